@@ -0,0 +1,352 @@
+import argparse
+import hashlib
+import json
+import logging
+import math
+import threading
+import time
+from typing import Dict, List
+from urllib.parse import parse_qs
+import pandas as pd
+from data_store import get_reference_data, get_nutrient_registry, get_faostat_index, get_food_index
+from nutrient_analysis import calculate_batch_results, RECOMMENDATION_STATUSES
+import metrics
+from settings import env_setting
+
+# Largest number of profiles in one analysis request
+DEFAULT_MAX_BATCH = 1000
+# Largest request body in bytes
+DEFAULT_MAX_BODY = 1024 * 1024
+DEFAULT_TOP_K = 5
+# Most foods per nutrient a recommendations request may ask for
+MAX_TOP_K = 50
+# Lookups only change when the data files do; clients revalidate with their ETag after this
+STATIC_MAX_AGE = 300
+
+_log = logging.getLogger(__name__)
+
+_requests = metrics.counter('api_requests', 'HTTP API requests by route and status code')
+_durations = metrics.histogram('api_request_duration_seconds', 'HTTP API request durations by route')
+
+_STATUS_TEXT = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                413: 'Payload Too Large', 500: 'Internal Server Error', 502: 'Bad Gateway',
+                503: 'Service Unavailable', 504: 'Gateway Timeout'}
+
+class HTTPError(Exception):
+    """An error answered with `status` and a JSON {"error": message} body"""
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or []
+
+def _json(value) -> bytes:
+    # NaN and Infinity are not JSON; requests with non-finite numbers are rejected up front
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+# Encoded bodies of static lookups: key -> (source object, body, ETag). The data layer
+# returns the same object until its files change, so a body is reused while its source is
+_static = {}
+_static_lock = threading.Lock()
+
+def _static_body(key, source, build):
+    entry = _static.get(key)
+    if entry is None or entry[0] is not source:
+        body = _json(build())
+        entry = (source, body, '"' + hashlib.sha256(body).hexdigest()[:32] + '"')
+        with _static_lock:
+            _static[key] = entry
+    return entry[1], entry[2]
+
+def _read_json(environ) -> Dict:
+    try:
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length")
+    max_body = environ['nutriscan.max_body']
+    if length > max_body:
+        raise HTTPError(413, f"Request body larger than {max_body} bytes")
+    try:
+        body = json.loads(environ['wsgi.input'].read(length) or b'{}')
+    except ValueError as exc:
+        raise HTTPError(400, f"Invalid JSON: {exc}")
+    if not isinstance(body, dict):
+        raise HTTPError(400, "Request body must be a JSON object")
+    return body
+
+def _profile_intakes(profile):
+    """Intakes of a request profile: given directly, or by FAOSTAT country and subpopulation"""
+    if not isinstance(profile, dict):
+        raise HTTPError(400, "Each profile must be a JSON object")
+    if 'intakes' in profile:
+        intakes = profile['intakes']
+        if not isinstance(intakes, dict):
+            raise HTTPError(400, "'intakes' must map nutrient names to numbers")
+        for nutrient, intake in intakes.items():
+            # null marks a missing intake; json.loads reads 1e400 as inf and accepts NaN
+            if intake is not None and (isinstance(intake, bool) or not isinstance(intake, (int, float))
+                                       or not math.isfinite(intake)):
+                raise HTTPError(400, f"Intake of {nutrient!r} must be a finite number")
+        return intakes
+    if 'country' in profile:
+        country, subpopulation = profile['country'], profile.get('subpopulation')
+        if not isinstance(country, str) or not isinstance(subpopulation, str):
+            raise HTTPError(400, "'country' and 'subpopulation' must be strings")
+        intakes = get_faostat_index().profiles.get((country, subpopulation))
+        if intakes is None:
+            raise HTTPError(404, f"No FAOSTAT profile for {country!r}, {subpopulation!r}")
+        return intakes
+    raise HTTPError(400, "Each profile needs 'intakes' or 'country' and 'subpopulation'")
+
+def analyze_profiles(profiles: List[Dict], results=True, recommendations=False, top_k=DEFAULT_TOP_K,
+                     rank_by='grams') -> List[Dict]:
+    """
+    Analyse a batch of profiles in one vectorized pass
+
+    Args:
+        profiles: Request profiles, each with 'intakes' or FAOSTAT 'country' and
+            'subpopulation', and an optional 'id' echoed in the response
+        results: Include the per-nutrient results (as calculate_results)
+        recommendations: Include food recommendations for off-target nutrients (as
+            get_food_recommendations, best ranked first)
+        top_k: Foods per nutrient in the recommendations
+        rank_by: 'grams' or 'energy', see FoodIndex.recommend
+
+    Returns:
+        List[Dict]: One response object per profile, in request order
+    """
+    reference_values, _ = get_reference_data()
+    registry = get_nutrient_registry()
+    intakes = pd.DataFrame([_profile_intakes(profile) for profile in profiles])
+    try:
+        batch = calculate_batch_results(intakes, reference_values)
+    except (TypeError, ValueError):
+        raise HTTPError(400, "Intakes must be numbers")
+    frame = batch.to_frame()
+    # Columns are converted to lists up front; iterating pandas columns element by element is slow
+    def column(df, name):
+        return df[name].tolist()
+
+    responses = [{'id': profile.get('id', i)} for i, profile in enumerate(profiles)]
+    if results:
+        for response in responses:
+            response['results'] = []
+        units = {nutrient: registry.unit(nutrient) for nutrient in batch.nutrients}
+        for profile, nutrient, intake, reference, percentage, status in zip(
+                column(frame, 'Profile'), column(frame, 'Nutrient'), column(frame, 'Intake'),
+                column(frame, 'Reference'), frame['Percentage'].round(2).tolist(), column(frame, 'Status')):
+            responses[profile]['results'].append({
+                'nutrient': nutrient, 'intake': intake, 'reference': reference, 'unit': units[nutrient],
+                'percentage': percentage, 'status': status})
+    if recommendations:
+        for response in responses:
+            response['recommendations'] = []
+        ranked = get_food_index().recommend(frame, top_k=top_k, rank_by=rank_by, statuses=RECOMMENDATION_STATUSES)
+        profile_of = frame['Profile'].to_numpy()[ranked['Row'].to_numpy()].tolist()
+        energies = ranked['Energy'].astype(object).where(ranked['Energy'].notna(), None).tolist()
+        for profile, nutrient, rank, food, amount, unit, content, action, energy in zip(
+                profile_of, column(ranked, 'Nutrient'), column(ranked, 'Rank'), column(ranked, 'Food'),
+                column(ranked, 'Amount'), column(ranked, 'Unit'), column(ranked, 'Content'), column(ranked, 'Action'),
+                energies):
+            responses[profile]['recommendations'].append({
+                'nutrient': nutrient, 'rank': rank, 'food': food, 'amount': amount, 'unit': unit,
+                'content': content, 'action': action, 'energy': energy})
+    return responses
+
+def _analysis(environ, results=True, recommendations=False):
+    body = _read_json(environ)
+    recommendations = bool(body.get('recommendations', recommendations))
+    try:
+        top_k = int(body.get('top_k', DEFAULT_TOP_K))
+    except (TypeError, ValueError):
+        raise HTTPError(400, "'top_k' must be an integer")
+    if not 1 <= top_k <= MAX_TOP_K:
+        raise HTTPError(400, f"'top_k' must be between 1 and {MAX_TOP_K}")
+    rank_by = body.get('rank_by', 'grams')
+    if rank_by not in ('grams', 'energy'):
+        raise HTTPError(400, "'rank_by' must be 'grams' or 'energy'")
+
+    if 'profiles' in body:
+        profiles = body['profiles']
+        if not isinstance(profiles, list):
+            raise HTTPError(400, "'profiles' must be a list")
+        max_batch = environ['nutriscan.max_batch']
+        if len(profiles) > max_batch:
+            raise HTTPError(413, f"At most {max_batch} profiles per request")
+        return {'profiles': analyze_profiles(profiles, results, recommendations, top_k, rank_by) if profiles else []}
+    response = analyze_profiles([body], results, recommendations, top_k, rank_by)[0]
+    del response['id']
+    return response
+
+def _nutrients(environ):
+    registry = get_nutrient_registry()
+    return _static_body('nutrients', registry, lambda: [
+        {'nutrient': info.name, 'unit': info.unit, 'reference': info.reference, 'label': info.label}
+        for info in (registry[name] for name in registry)])
+
+def _countries(environ):
+    faostat_index = get_faostat_index()
+    return _static_body('countries', faostat_index, lambda: [
+        {'country': country, 'subpopulations': faostat_index.get_subpopulations(country)}
+        for country in faostat_index.countries])
+
+def _profile(environ):
+    query = parse_qs(environ.get('QUERY_STRING', ''))
+    country, subpopulation = query.get('country', [None])[0], query.get('subpopulation', [None])[0]
+    if not country or not subpopulation:
+        raise HTTPError(400, "'country' and 'subpopulation' query parameters are required")
+    faostat_index = get_faostat_index()
+    intakes = faostat_index.profiles.get((country, subpopulation))
+    if intakes is None:
+        raise HTTPError(404, f"No FAOSTAT profile for {country!r}, {subpopulation!r}")
+    return _static_body(('profile', country, subpopulation), faostat_index, lambda: {
+        'country': country, 'subpopulation': subpopulation, 'intakes': intakes})
+
+def _llm_call(call):
+    """Run an LLM call, mapping gateway errors to HTTP errors"""
+    from llm_gateway import LLMError, LLMOverloadedError, LLMTimeoutError
+    try:
+        return call()
+    except LLMOverloadedError as exc:
+        raise HTTPError(503, str(exc), [('Retry-After', '60')])
+    except LLMTimeoutError as exc:
+        raise HTTPError(504, str(exc))
+    except LLMError as exc:
+        raise HTTPError(502, str(exc))
+
+def _estimate(environ):
+    text = _read_json(environ).get('text')
+    if not isinstance(text, str) or not text.strip():
+        raise HTTPError(400, "'text' must be a non-empty string")
+    from nutrient_estimator import estimate_nutrients  # Loads the prompts and LLM client on first use
+    description, intakes, missing = _llm_call(lambda: estimate_nutrients(text))
+    return {'description': description, 'intakes': intakes, 'missing': missing}
+
+def _meal_plan(environ):
+    body = _read_json(environ)
+    country = body.get('country')
+    if not isinstance(country, str) or not country:
+        raise HTTPError(400, "'country' is required")
+    reference_values, _ = get_reference_data()
+    batch = calculate_batch_results(pd.DataFrame([_profile_intakes(body)]), reference_values)
+    from meal_planner import generate_meal_plan
+    meal_plan = _llm_call(lambda: generate_meal_plan(batch.to_frame().drop(columns='Profile'), country,
+                                                     raise_errors=True))
+    return {'country': country, 'meal_plan': meal_plan}
+
+def _health(environ):
+    return {'status': 'ok'}
+
+def _metrics(environ):
+    return metrics.REGISTRY.render().encode('utf-8'), None
+
+# (method, path) -> handler returning a JSON-serializable object, or (body, ETag) for
+# pre-encoded static lookups (ETag None for non-JSON text)
+ROUTES = {
+    ('GET', '/health'): _health,
+    ('GET', '/v1/nutrients'): _nutrients,
+    ('GET', '/v1/faostat/countries'): _countries,
+    ('GET', '/v1/faostat/profile'): _profile,
+    ('POST', '/v1/analyze'): _analysis,
+    ('POST', '/v1/recommendations'): lambda environ: _analysis(environ, results=False, recommendations=True),
+}
+LLM_ROUTES = {
+    ('POST', '/v1/estimate'): _estimate,
+    ('POST', '/v1/meal-plan'): _meal_plan,
+}
+METRICS_ROUTES = {
+    ('GET', '/metrics'): _metrics,
+}
+
+def create_app(enable_llm=None, warm=False, serve_metrics=None):
+    """
+    Build the WSGI application
+
+    API_MAX_BATCH and API_MAX_BODY limit the size of requests, and API_ENABLE_LLM=1 serves
+    the LLM endpoints (needs GROQ_API_KEY), and API_METRICS=1 serves /metrics. They are read
+    here, after loading .env.
+
+    Args:
+        enable_llm: Also serve /v1/estimate and /v1/meal-plan; None to follow API_ENABLE_LLM
+        warm: Load the datasets now rather than on the first request (with
+            `gunicorn --preload`, workers then share them copy-on-write)
+        serve_metrics: Also serve /metrics; None to follow API_METRICS. Off by default, as
+            the API is usually served on a public address
+
+    Returns:
+        Callable: WSGI application
+    """
+    from dotenv import load_dotenv
+    load_dotenv()
+    if enable_llm is None:
+        enable_llm = env_setting('API_ENABLE_LLM', False)
+    if serve_metrics is None:
+        serve_metrics = env_setting('API_METRICS', False)
+    # Passed to the handlers in the WSGI environ
+    limits = {'nutriscan.max_batch': env_setting('API_MAX_BATCH', DEFAULT_MAX_BATCH),
+              'nutriscan.max_body': env_setting('API_MAX_BODY', DEFAULT_MAX_BODY)}
+    routes = dict(ROUTES)
+    if enable_llm:
+        routes.update(LLM_ROUTES)
+    if serve_metrics:
+        routes.update(METRICS_ROUTES)
+    paths = {path for _, path in routes}
+    if warm:
+        get_reference_data()
+        get_nutrient_registry()
+        get_faostat_index()
+        get_food_index()
+
+    def app(environ, start_response):
+        start = time.perf_counter()
+        method, path = environ.get('REQUEST_METHOD', 'GET'), environ.get('PATH_INFO', '/').rstrip('/') or '/'
+        handler = routes.get((method, path))
+        route = path if handler is not None else 'unknown'
+        headers = []
+        environ.update(limits)
+        try:
+            if handler is None:
+                raise HTTPError(405 if path in paths else 404, f"{method} {path} is not supported")
+            value = handler(environ)
+            status = 200
+            if isinstance(value, tuple):
+                body, etag = value
+                if etag is None:
+                    headers.append(('Content-Type', 'text/plain; version=0.0.4'))
+                else:
+                    headers += [('Content-Type', 'application/json'), ('ETag', etag),
+                                ('Cache-Control', f'public, max-age={STATIC_MAX_AGE}')]
+                    if etag in environ.get('HTTP_IF_NONE_MATCH', ''):
+                        status, body = 304, b''
+            else:
+                body = _json(value)
+                headers.append(('Content-Type', 'application/json'))
+        except HTTPError as exc:
+            status, body = exc.status, _json({'error': str(exc)})
+            headers = [('Content-Type', 'application/json')] + exc.headers
+        except Exception:
+            _log.exception("%s %s failed", method, path)
+            status, body = 500, _json({'error': "Internal error"})
+            headers = [('Content-Type', 'application/json')]
+        headers.append(('Content-Length', str(len(body))))
+        start_response(f"{status} {_STATUS_TEXT.get(status, '')}", headers)
+        _requests.inc(route=route, status=str(status))
+        _durations.observe(time.perf_counter() - start, route=route)
+        return [body]
+
+    return app
+
+if __name__ == "__main__":
+    from socketserver import ThreadingMixIn
+    from wsgiref.simple_server import WSGIServer, make_server
+
+    class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+
+    parser = argparse.ArgumentParser(description="Serve the NutriScan analysis API (for development; "
+                                                 "use gunicorn in production)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    server = make_server(args.host, args.port, create_app(warm=True), server_class=ThreadingWSGIServer)
+    print(f"Serving on http://{args.host}:{args.port}")
+    server.serve_forever()
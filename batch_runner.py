@@ -0,0 +1,191 @@
+import argparse
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from data_store import get_reference_data, get_faostat_index, get_food_index
+from nutrient_analysis import calculate_batch_results, RECOMMENDATION_STATUSES
+
+def _file_format(path, explicit=None):
+    if explicit:
+        return explicit
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    if extension in ('.parquet', '.pq'):
+        return 'parquet'
+    return 'csv'
+
+def read_chunks(path, chunk_size, file_format=None):
+    """
+    Stream an input file as DataFrame chunks
+
+    Args:
+        path: CSV, JSONL or Parquet file
+        chunk_size: Number of rows per chunk
+        file_format: 'csv', 'jsonl' or 'parquet' (default: from the file extension)
+
+    Yields:
+        pd.DataFrame: Consecutive chunks of the input
+    """
+    file_format = _file_format(path, file_format)
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq  # Only needed for Parquet input
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    elif file_format == 'jsonl':
+        yield from pd.read_json(path, lines=True, chunksize=chunk_size)
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+class ChunkWriter:
+    """Append result chunks to a CSV, JSONL or Parquet file"""
+    def __init__(self, path, file_format=None):
+        self.path = path
+        self.file_format = _file_format(path, file_format)
+        self.rows = 0
+        self._parquet_writer = None
+        # Start from an empty file since chunks are appended
+        if os.path.exists(path):
+            os.remove(path)
+
+    def write(self, df):
+        if self.file_format == 'parquet':
+            import pyarrow as pa  # Only needed for Parquet output
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
+        elif self.file_format == 'jsonl':
+            with open(self.path, 'a', encoding='utf-8') as f:
+                df.to_json(f, orient='records', lines=True, force_ascii=False)
+        else:
+            df.to_csv(self.path, mode='a', header=self.rows == 0, index=False)
+        self.rows += len(df)
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+def _faostat_intakes(chunk, country_column, subpopulation_column):
+    """Resolve FAOSTAT (country, subpopulation) keys to a wide intake table"""
+    faostat_index = get_faostat_index()
+    keys = list(zip(chunk[country_column], chunk[subpopulation_column]))
+    intakes = pd.DataFrame([faostat_index.profiles.get(key, {}) for key in keys], index=chunk.index)
+    missing = [key for key in keys if key not in faostat_index.profiles]
+    if missing:
+        print(f"Warning: no FAOSTAT data for {len(missing)} rows, e.g. {missing[0]}", file=sys.stderr)
+    return intakes
+
+def _recommendations(results, food_index, top_k=None):
+    """Serialize the ranked food recommendations for each off-target row as JSON"""
+    column = ['' if status not in RECOMMENDATION_STATUSES else '{}' for status in results['Status']]
+    recommendations = food_index.recommend(results, top_k=top_k, statuses=RECOMMENDATION_STATUSES)
+    for row, group in recommendations.groupby('Row', sort=False):
+        column[row] = json.dumps({food: {'amount_g': amount, 'action': action}
+                                  for food, amount, action in zip(group['Food'], group['Amount'], group['Action'])},
+                                 ensure_ascii=False)
+    return column
+
+def analyse_chunk(chunk, options):
+    """
+    Analyse one chunk of intake profiles
+
+    Args:
+        chunk: DataFrame of input rows (nutrient columns, or FAOSTAT key columns)
+        options: Dictionary with the keys id_column, faostat, country_column,
+            subpopulation_column, recommendations and top_k
+
+    Returns:
+        pd.DataFrame: One row per profile and nutrient with the calculate_results columns,
+        the profile id columns and, optionally, a JSON 'Recommendations' column
+    """
+    reference_values, _ = get_reference_data()
+    id_columns = [options['id_column']] if options['id_column'] else []
+    if options['faostat']:
+        intakes = _faostat_intakes(chunk, options['country_column'], options['subpopulation_column'])
+        id_columns = id_columns + [options['country_column'], options['subpopulation_column']]
+    else:
+        intakes = chunk[[column for column in chunk.columns if column in reference_values]]
+    intakes = intakes.apply(pd.to_numeric, errors='coerce')
+
+    results = calculate_batch_results(intakes, reference_values).to_frame()
+    # Profile holds the input row label; swap it for the requested id columns
+    profile_ids = chunk.loc[results['Profile'], id_columns].reset_index(drop=True) if id_columns else \
+        pd.DataFrame({'Row': results['Profile'].to_numpy()})
+    results = pd.concat([profile_ids, results.drop(columns='Profile')], axis=1)
+
+    if options['recommendations']:
+        results['Recommendations'] = _recommendations(results, get_food_index(), options.get('top_k'))
+    return results
+
+def run(input_path, output_path, chunk_size=50000, workers=1, options=None,
+        input_format=None, output_format=None):
+    """
+    Analyse every profile of an input file, streaming chunks through analyse_chunk
+
+    Args:
+        input_path: Input file (CSV, JSONL or Parquet)
+        output_path: Output file (CSV, JSONL or Parquet)
+        chunk_size: Rows per chunk
+        workers: Number of worker processes (1 runs in-process)
+        options: Options passed to analyse_chunk
+
+    Returns:
+        int: Number of result rows written
+    """
+    writer = ChunkWriter(output_path, output_format)
+    chunks = read_chunks(input_path, chunk_size, input_format)
+    try:
+        if workers <= 1:
+            for chunk in chunks:
+                writer.write(analyse_chunk(chunk, options))
+        else:
+            # Keep a bounded number of chunks in flight so memory stays flat, and write in input order
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(executor.submit(analyse_chunk, chunk, options))
+                    if len(pending) >= workers * 2:
+                        writer.write(pending.popleft().result())
+                while pending:
+                    writer.write(pending.popleft().result())
+    finally:
+        writer.close()
+    return writer.rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse a file of diets without the Streamlit app")
+    parser.add_argument("input", help="CSV, JSONL or Parquet file with one intake profile per row")
+    parser.add_argument("output", help="Output file (.csv, .jsonl or .parquet)")
+    parser.add_argument("--faostat", action="store_true",
+                        help="Rows hold FAOSTAT country/subpopulation keys instead of nutrient intakes")
+    parser.add_argument("--country-column", default="Survey", help="Country column for --faostat")
+    parser.add_argument("--subpopulation-column", default="Geographic Level",
+                        help="Subpopulation column for --faostat")
+    parser.add_argument("--id-column", help="Column identifying each profile in the output")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="Rows per chunk")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+    parser.add_argument("--no-recommendations", action="store_true", help="Skip food recommendations")
+    parser.add_argument("--top-k", type=int, help="Keep only the best ranked foods per nutrient")
+    parser.add_argument("--input-format", choices=["csv", "jsonl", "parquet"])
+    parser.add_argument("--output-format", choices=["csv", "jsonl", "parquet"])
+    args = parser.parse_args(argv)
+
+    options = {
+        'id_column': args.id_column,
+        'faostat': args.faostat,
+        'country_column': args.country_column,
+        'subpopulation_column': args.subpopulation_column,
+        'recommendations': not args.no_recommendations,
+        'top_k': args.top_k,
+    }
+    rows = run(args.input, args.output, args.chunk_size, args.workers, options,
+               args.input_format, args.output_format)
+    print(f"Wrote {rows} rows to {args.output}")
+
+if __name__ == "__main__":
+    main()
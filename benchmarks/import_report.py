@@ -0,0 +1,73 @@
+"""
+Import-time report for NutriScan modules
+
+Imports each module in a fresh interpreter with `python -X importtime` and lists the
+slowest imports it pulls in, so heavy dependencies creeping back into the startup path
+are easy to spot.
+
+Usage:
+    python benchmarks/import_report.py [main nutrient_analysis ...] [--top 15] [--json report.json]
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = ['main', 'nutrient_analysis', 'data_store', 'batch_runner', 'llm_gateway', 'ui_components', 'api']
+
+# "import time: self [us] | cumulative | imported package" lines written to stderr
+_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+def import_times(module):
+    """
+    Import `module` in a subprocess and collect its import times
+
+    Returns:
+        Dict: Total time in seconds, the modules imported with their self and cumulative
+        times, or the error if the import failed
+    """
+    env = dict(os.environ, LLM_BACKEND='fake', GROQ_API_KEY=os.getenv('GROQ_API_KEY', 'benchmark'))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=REPO_DIR, env=env, capture_output=True, text=True)
+    imports = []
+    total = 0
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = int(match.group(1)), int(match.group(2)), match.group(3), match.group(4)
+        # Top-level imports (one space of indentation) add up to the total
+        if len(indent) == 1:
+            total += cumulative_us
+        imports.append({'module': name, 'self': self_us / 1e6, 'cumulative': cumulative_us / 1e6})
+    report = {'module': module, 'total': total / 1e6, 'imports': imports}
+    if result.returncode != 0:
+        report['error'] = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'import failed'
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report import times of NutriScan modules")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES, help="Modules to import")
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest imports to list per module")
+    parser.add_argument("--json", help="Also write the full report to this file")
+    args = parser.parse_args(argv)
+
+    reports = []
+    for module in args.modules:
+        report = import_times(module)
+        reports.append(report)
+        print(f"{module}: {report['total'] * 1000:.1f} ms" + (f"  ({report['error']})" if 'error' in report else ""))
+        # Third-party packages (not submodules) sorted by the time their import took
+        packages = [entry for entry in report['imports'] if '.' not in entry['module']]
+        for entry in sorted(packages, key=lambda entry: entry['cumulative'], reverse=True)[:args.top]:
+            print(f"    {entry['cumulative'] * 1000:9.1f} ms  {entry['module']}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Offline benchmark suite for NutriScan
+
+Times startup (importing main.py), data loading, analysis, recommendations, LLM output
+parsing and chart building, and writes the results as JSON so they can be compared
+between releases. LLM calls go to a local fake backend, so no API key or network is needed.
+
+Usage:
+    python benchmarks/run_benchmarks.py --output bench.json [--quick]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RECORDED_RESPONSES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recorded_responses.json')
+
+# Relative --output paths are relative to where the script was started
+CALLER_DIR = os.getcwd()
+# The app resolves data files relative to the repository root
+os.chdir(REPO_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import numpy as np
+import pandas as pd
+import data_loader
+import diet_database
+from nutrient_analysis import calculate_results, calculate_batch_results, get_food_recommendations, build_food_index
+from food_optimizer import FoodOptimizer
+
+def measure(func, repeat=5, number=1):
+    """
+    Time `func` with `repeat` rounds of `number` calls each
+
+    Returns:
+        Dict: Per-call minimum, median and mean in seconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+    return {'min': min(timings), 'median': statistics.median(timings), 'mean': statistics.fmean(timings),
+            'rounds': repeat, 'calls_per_round': number}
+
+class Suite:
+    def __init__(self, quick=False):
+        self.quick = quick
+        self.results = []
+
+    def run(self, name, func, params=None, repeat=5, number=1):
+        if self.quick:
+            repeat = min(repeat, 2)
+        entry = {'name': name, 'params': params or {}}
+        try:
+            entry.update(measure(func, repeat, number))
+        except ImportError as e:
+            entry['skipped'] = f"missing dependency: {e.name}"
+        print(f"{name:45s} {json.dumps(params or {}):30s} "
+              f"{entry['skipped'] if 'skipped' in entry else format(entry['median'] * 1000, '.3f') + ' ms'}")
+        self.results.append(entry)
+
+def _synthetic_faostat_csv(path, reference_values, countries=40, subpopulations=6, seed=0):
+    """Write a FAOSTAT-like CSV for when the real extract is not available"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for c in range(countries):
+        for s in range(subpopulations):
+            for nutrient, reference in reference_values.items():
+                rows.append((f"Country {c} - Survey {c}", f"Subpopulation {s}", nutrient, 'unit',
+                             round(reference * rng.uniform(0.3, 2.5), 2)))
+    pd.DataFrame(rows, columns=['Survey', 'Geographic Level', 'Indicator', 'Unit', 'Value']).to_csv(path, index=False)
+
+def _random_profiles(reference_values, count, seed=0):
+    rng = np.random.default_rng(seed)
+    reference = np.array(list(reference_values.values()), dtype=float)
+    return pd.DataFrame(reference * rng.uniform(0.3, 2.5, size=(count, len(reference))),
+                        columns=list(reference_values))
+
+def bench_import_main(suite):
+    """Import main.py in a fresh interpreter with the fake LLM backend"""
+    env = dict(os.environ, LLM_BACKEND='fake', GROQ_API_KEY=os.getenv('GROQ_API_KEY', 'benchmark'))
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+    def run():
+        result = subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            missing = [line for line in result.stderr.splitlines() if 'ModuleNotFoundError' in line]
+            error = ImportError(missing[-1] if missing else result.stderr.strip().splitlines()[-1])
+            error.name = missing[-1].split("'")[1] if missing else 'main'
+            raise error
+        run.timings.append(float(result.stdout.strip().splitlines()[-1]))
+    run.timings = []
+    suite.run('import_main', run, repeat=3)
+    if run.timings:
+        suite.results[-1].update({'min': min(run.timings), 'median': statistics.median(run.timings),
+                                  'mean': statistics.fmean(run.timings)})
+
+def bench_data_loading(suite, reference_values):
+    suite.run('load_reference_values', data_loader.load_reference_values, number=10)
+    suite.run('get_nutrient_sources', diet_database.get_nutrient_sources, number=10)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = data_loader.FAOSTAT_CSV
+        synthetic = not os.path.exists(csv_path)
+        if synthetic:
+            csv_path = os.path.join(tmp, 'FAOSTAT_total_intakes.csv')
+            _synthetic_faostat_csv(csv_path, reference_values)
+        cache_dir = os.path.join(tmp, 'cache')
+        params = {'synthetic': synthetic}
+
+        suite.run('load_faostat_data[csv]', lambda: data_loader._read_faostat_csv(csv_path), params)
+        suite.run('load_faostat_data[cold_cache]',
+                  lambda: data_loader.load_faostat_data(csv_path=csv_path, cache_dir=os.path.join(tmp, f'cold{time.perf_counter_ns()}')),
+                  params)
+        data_loader.build_faostat_cache(csv_path, cache_dir)
+        suite.run('load_faostat_data[warm_cache]',
+                  lambda: data_loader.load_faostat_data(csv_path=csv_path, cache_dir=cache_dir), params, number=5)
+        faostat_df = data_loader.load_faostat_data(data_loader.FAOSTAT_PROFILE_COLUMNS, csv_path, cache_dir)
+        suite.run('build_faostat_index', lambda: data_loader.build_faostat_index(faostat_df, reference_values), params)
+
+def bench_analysis(suite, reference_values, nutrient_sources, counts):
+    suite.run('build_food_index', lambda: build_food_index(nutrient_sources), number=10)
+    food_index = build_food_index(nutrient_sources)
+    for count in counts:
+        profiles = _random_profiles(reference_values, count)
+        records = profiles.to_dict('records')
+        suite.run('calculate_results', lambda: [calculate_results(intakes, reference_values) for intakes in records],
+                  {'profiles': count}, repeat=3)
+        suite.run('calculate_batch_results', lambda: calculate_batch_results(profiles, reference_values),
+                  {'profiles': count}, repeat=3)
+
+        def recommendations():
+            for intakes in records:
+                for nutrient, intake in intakes.items():
+                    get_food_recommendations(nutrient, intake, reference_values[nutrient], nutrient_sources)
+        suite.run('get_food_recommendations', recommendations, {'profiles': count}, repeat=3)
+        results = calculate_batch_results(profiles, reference_values).to_frame()
+        suite.run('FoodIndex.recommend', lambda: food_index.recommend(results), {'profiles': count}, repeat=3)
+
+    # Single analyses, as shown in the app, take the per-row walk instead of the vectorized pass
+    results = calculate_results(_random_profiles(reference_values, 1).iloc[0].to_dict(), reference_values)
+    suite.run('FoodIndex.recommend_profile', lambda: food_index.recommend_profile(results), {'profiles': 1}, number=100)
+
+    optimizer = FoodOptimizer(nutrient_sources)
+    results = calculate_results(_random_profiles(reference_values, 1, seed=1).iloc[0].to_dict(), reference_values)
+    suite.run('FoodOptimizer.optimize', lambda: optimizer.optimize(results, use_cache=False),
+              {'foods': len(optimizer.foods)}, number=10)
+
+def bench_parsing(suite):
+    # The function the app calls, including its metrics wrapper
+    from nutrient_estimator import parse_response
+    with open(RECORDED_RESPONSES, 'r', encoding='utf-8') as f:
+        recorded = json.load(f)
+    for sample in recorded:
+        suite.run('parse_response', lambda: parse_response(sample['response']), {'sample': sample['name']}, number=200)
+
+def bench_rendering(suite, reference_values):
+    def build():
+        from ui_components import build_results_figure
+        build_results_figure(results)
+    results = calculate_results(_random_profiles(reference_values, 1).iloc[0].to_dict(), reference_values)
+    suite.run('build_results_figure', build, {'nutrients': len(results)}, number=5)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the NutriScan benchmark suite")
+    parser.add_argument("--output", "-o", default="bench.json", help="JSON file for the results")
+    parser.add_argument("--quick", action="store_true", help="Fewer rounds and smaller profile counts")
+    args = parser.parse_args(argv)
+
+    # Any LLM call made during the benchmarks is answered locally
+    os.environ['LLM_BACKEND'] = 'fake'
+    suite = Suite(quick=args.quick)
+    reference_values, _ = data_loader.load_reference_values()
+    nutrient_sources = diet_database.get_nutrient_sources()
+    counts = [1, 100] if args.quick else [1, 100, 1000, 10000]
+
+    bench_import_main(suite)
+    bench_data_loading(suite, reference_values)
+    bench_analysis(suite, reference_values, nutrient_sources, counts)
+    bench_parsing(suite)
+    bench_rendering(suite, reference_values)
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'commit': commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'quick': args.quick,
+        },
+        'unit': 'seconds',
+        'benchmarks': suite.results,
+    }
+    output = os.path.join(CALLER_DIR, args.output)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(suite.results)} results to {output}")
+
+if __name__ == "__main__":
+    main()
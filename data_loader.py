@@ -1,8 +1,26 @@
 import pandas as pd
+import numpy as np
+import argparse
+import json
 import os
+import uuid
+from contextlib import contextmanager
+try:
+    import fcntl  # Serializes cache builds across processes (POSIX only)
+except ImportError:
+    fcntl = None
 
 # Define data directory path
 DATA_DIR = "data"
+FAOSTAT_CSV = os.path.join(DATA_DIR, 'FAOSTAT_total_intakes.csv')
+
+# Columnar cache of the FAOSTAT CSV: one .npy file per column plus a JSON manifest
+CACHE_DIR = os.path.join(DATA_DIR, '.cache')
+FAOSTAT_CACHE_DIR = os.path.join(CACHE_DIR, 'faostat')
+FAOSTAT_CACHE_VERSION = 1
+
+# Columns needed to build profiles; other columns are only read when asked for
+FAOSTAT_PROFILE_COLUMNS = ['Survey', 'Geographic Level', 'Indicator', 'Value']
 
 def load_reference_values():
     """
@@ -16,17 +34,223 @@ def load_reference_values():
     reference_df = pd.read_csv(os.path.join(DATA_DIR, 'Indicators_brief.csv'))
     return dict(zip(reference_df['Indicator'], reference_df['Value'])), reference_df
 
-def load_faostat_data():
+class NutrientInfo:
+    """
+    Metadata of one reference nutrient
+
+    Attributes:
+        name: Nutrient name as in Indicators_brief.csv
+        unit: Unit of the reference value (e.g. "mg/d")
+        reference: Reference value
+        label: Display label with the unit, e.g. "Iron (mg/d)"
+        ordinal: Position in Indicators_brief.csv
+    """
+    __slots__ = ('name', 'unit', 'reference', 'label', 'ordinal')
+
+    def __init__(self, name, unit, reference, ordinal):
+        self.name = name
+        self.unit = unit
+        self.reference = reference
+        self.label = f"{name} ({unit})" if unit else name
+        self.ordinal = ordinal
+
+class NutrientRegistry:
+    """
+    Nutrient metadata keyed by name, built once from the reference data
+
+    Iterates over nutrient names in file order; registry[name] gives the NutrientInfo.
+    """
+    def __init__(self, infos):
+        self._infos = {info.name: info for info in sorted(infos, key=lambda info: info.ordinal)}
+        self.units = {name: info.unit for name, info in self._infos.items()}
+        self.reference_values = {name: info.reference for name, info in self._infos.items()}
+
+    def __getitem__(self, name):
+        return self._infos[name]
+
+    def __contains__(self, name):
+        return name in self._infos
+
+    def __iter__(self):
+        return iter(self._infos)
+
+    def __len__(self):
+        return len(self._infos)
+
+    def get(self, name, default=None):
+        return self._infos.get(name, default)
+
+    def unit(self, name, default=''):
+        info = self._infos.get(name)
+        return info.unit if info is not None else default
+
+    def label(self, name):
+        info = self._infos.get(name)
+        return info.label if info is not None else name
+
+    def sort(self, names):
+        """Order nutrient names as in the reference data, unknown names last"""
+        return sorted(names, key=lambda name: self._infos[name].ordinal if name in self._infos else len(self._infos))
+
+def build_nutrient_registry(reference_df) -> NutrientRegistry:
+    """
+    Build the nutrient registry from the reference DataFrame (Indicator, Unit, Value columns)
+
+    Returns:
+        NutrientRegistry: Name, unit, reference value, label and position of each nutrient
+    """
+    return NutrientRegistry(NutrientInfo(name, unit if isinstance(unit, str) else '', float(reference), ordinal)
+                            for ordinal, (name, unit, reference)
+                            in enumerate(zip(reference_df['Indicator'], reference_df['Unit'], reference_df['Value'])))
+
+def _read_faostat_csv(csv_path):
+    faostat_df = pd.read_csv(csv_path)
+    # Clean survey names by removing text after dash
+    faostat_df['Survey'] = faostat_df['Survey'].str.split(' -', n=1).str[0]
+    return faostat_df
+
+def _source_state(csv_path):
+    stat = os.stat(csv_path)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+def _read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'manifest.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _is_current(manifest, csv_path):
+    return (manifest is not None and manifest.get('version') == FAOSTAT_CACHE_VERSION
+            and manifest.get('source') == _source_state(csv_path))
+
+@contextmanager
+def _build_lock(cache_dir):
+    """Hold an exclusive lock on the cache directory while building (no-op without fcntl)"""
+    os.makedirs(cache_dir, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(cache_dir, 'build.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def build_faostat_cache(csv_path=FAOSTAT_CSV, cache_dir=FAOSTAT_CACHE_DIR):
+    """
+    Convert the FAOSTAT CSV into the columnar cache
+    
+    Text columns are stored as categorical codes (int16/int32) with their categories in the
+    manifest, numeric columns as float32. Files are written under a fresh build id and the
+    manifest is swapped in last, so concurrent readers never see a half-written cache.
+    Builds hold a lock on the cache directory, so concurrent builds from several processes
+    run one after the other.
+    
+    Args:
+        csv_path: Path to the FAOSTAT CSV
+        cache_dir: Directory for the cache files
+    
+    Returns:
+        Dict: The new cache manifest
+    """
+    with _build_lock(cache_dir):
+        return _write_faostat_cache(csv_path, cache_dir)
+
+def _write_faostat_cache(csv_path, cache_dir):
+    source = _source_state(csv_path)
+    faostat_df = _read_faostat_csv(csv_path)
+    build_id = uuid.uuid4().hex[:12]
+    
+    columns = {}
+    for name in faostat_df.columns:
+        column = faostat_df[name]
+        file_name = f"{len(columns)}.{build_id}.npy"
+        if pd.api.types.is_numeric_dtype(column):
+            np.save(os.path.join(cache_dir, file_name), column.to_numpy(dtype=np.float32))
+            columns[name] = {'kind': 'float32', 'file': file_name}
+        else:
+            codes, categories = pd.factorize(column)
+            dtype = np.int16 if len(categories) < np.iinfo(np.int16).max else np.int32
+            np.save(os.path.join(cache_dir, file_name), codes.astype(dtype))
+            columns[name] = {'kind': 'categorical', 'file': file_name,
+                             'categories': [str(category) for category in categories]}
+    
+    manifest = {'version': FAOSTAT_CACHE_VERSION, 'source': source,
+                'rows': len(faostat_df), 'columns': columns}
+    tmp_path = os.path.join(cache_dir, f"manifest.{build_id}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    replaced = _read_manifest(cache_dir)
+    os.replace(tmp_path, os.path.join(cache_dir, 'manifest.json'))
+    
+    # Remove files from older builds. The files of the manifest just replaced are kept, as
+    # readers may have read it before the swap and not opened its files yet; they are
+    # removed by the next build. Open memory maps keep working on POSIX.
+    keep = {column['file'] for column in columns.values()}
+    if replaced is not None:
+        keep.update(column.get('file') for column in replaced.get('columns', {}).values())
+    for file_name in os.listdir(cache_dir):
+        if file_name.endswith('.npy') and file_name not in keep:
+            try:
+                os.remove(os.path.join(cache_dir, file_name))
+            except OSError:
+                pass
+    return manifest
+
+def _get_faostat_manifest(csv_path, cache_dir):
+    manifest = _read_manifest(cache_dir)
+    if not _is_current(manifest, csv_path):
+        with _build_lock(cache_dir):
+            # Another process may have rebuilt it while we were waiting for the lock
+            manifest = _read_manifest(cache_dir)
+            if not _is_current(manifest, csv_path):
+                manifest = _write_faostat_cache(csv_path, cache_dir)
+    return manifest
+
+def load_faostat_data(columns=None, csv_path=FAOSTAT_CSV, cache_dir=FAOSTAT_CACHE_DIR):
     """
     Load and preprocess FAOSTAT dietary data
     
+    Data is read from the columnar cache, which is (re)built from the CSV whenever the
+    CSV's modification time or size changes. Column arrays are memory-mapped and only
+    the requested columns are materialised.
+    
+    Args:
+        columns: Columns to load (default: all columns)
+        csv_path: Path to the FAOSTAT CSV
+        cache_dir: Directory of the columnar cache
+    
     Returns:
         pd.DataFrame: Processed FAOSTAT data with cleaned survey names
     """
-    faostat_df = pd.read_csv(os.path.join(DATA_DIR, 'FAOSTAT_total_intakes.csv'))
-    # Clean survey names by removing text after dash
-    faostat_df['Survey'] = [i.split(' -')[0] for i in faostat_df['Survey'].values]
-    return faostat_df
+    manifest = _get_faostat_manifest(csv_path, cache_dir)
+    try:
+        return _load_columns(manifest, columns, cache_dir)
+    except FileNotFoundError:
+        # A damaged cache (e.g. files removed by hand) is rebuilt rather than failing every load
+        return _load_columns(build_faostat_cache(csv_path, cache_dir), columns, cache_dir)
+
+def _load_columns(manifest, columns, cache_dir):
+    if columns is None:
+        columns = list(manifest['columns'])
+    data = {}
+    for name in columns:
+        column = manifest['columns'][name]
+        values = np.load(os.path.join(cache_dir, column['file']), mmap_mode='r')
+        if column['kind'] == 'categorical':
+            data[name] = pd.Categorical.from_codes(values, categories=column['categories'])
+        else:
+            data[name] = values
+    return pd.DataFrame(data, copy=False)
+
+def _to_float(values):
+    """Convert intake values to Python floats, using the shortest repr for float32 data"""
+    values = np.asarray(values)
+    if values.dtype == np.float32:
+        values = values.astype(str).astype(np.float64)
+    return values.astype(np.float64).tolist()
 
 def get_faostat_profile(faostat_df, country, subpopulation, reference_values):
     """
@@ -45,13 +269,67 @@ def get_faostat_profile(faostat_df, country, subpopulation, reference_values):
     # Filter data for specific country and subpopulation
     profile = faostat_df[(faostat_df['Survey'] == country) & 
                         (faostat_df['Geographic Level'] == subpopulation)]
+    # Only include values that are not null and have a reference value
+    profile = profile[profile['Value'].notnull() & profile['Indicator'].isin(list(reference_values))]
+    
+    return dict(zip(profile['Indicator'], _to_float(profile['Value'])))
+
+class FaostatIndex:
+    """
+    Lookup tables over the FAOSTAT data, built once so that selecting countries,
+    subpopulations and profiles does not scan the DataFrame
+
+    Attributes:
+        countries: Survey (country) names in file order
+        subpopulations: Dictionary mapping each country to its subpopulations in file order
+        profiles: Dictionary mapping (country, subpopulation) to a nutrient -> intake dictionary
+    """
+    def __init__(self, countries, subpopulations, profiles):
+        self.countries = countries
+        self.subpopulations = subpopulations
+        self.profiles = profiles
+
+    def get_subpopulations(self, country):
+        return self.subpopulations.get(country, [])
+
+    def get_profile(self, country, subpopulation):
+        """
+        Get the dietary profile for a country and subpopulation
+
+        Returns:
+            Dict: Copy of the nutrient intakes, empty if there is no matching data
+        """
+        return dict(self.profiles.get((country, subpopulation), {}))
+
+def build_faostat_index(faostat_df, reference_values):
+    """
+    Build the FAOSTAT lookup index in a single pass over the data
     
-    result = {}
-    for _, row in profile.iterrows():
-        indicator = row['Indicator']
-        value = row['Value']
-        # Only include values that are not null and have a reference value
-        if pd.notnull(value) and indicator in reference_values:
-            result[indicator] = float(value)
+    Args:
+        faostat_df: DataFrame containing FAOSTAT data
+        reference_values: Dictionary of reference values
+    
+    Returns:
+        FaostatIndex: Country and subpopulation lists and per-profile nutrient intakes,
+        containing only nutrients that are in the reference values list
+    """
+    keys = faostat_df[['Survey', 'Geographic Level']].drop_duplicates()
+    subpopulations = {}
+    for country, subpopulation in zip(keys['Survey'], keys['Geographic Level']):
+        subpopulations.setdefault(country, []).append(subpopulation)
     
-    return result
+    valid = faostat_df[faostat_df['Value'].notnull() & faostat_df['Indicator'].isin(list(reference_values))]
+    profiles = {}
+    for country, subpopulation, indicator, value in zip(valid['Survey'], valid['Geographic Level'],
+                                                       valid['Indicator'], _to_float(valid['Value'])):
+        profiles.setdefault((country, subpopulation), {})[indicator] = value
+    
+    return FaostatIndex(list(subpopulations), subpopulations, profiles)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the columnar FAOSTAT cache")
+    parser.add_argument("--csv", default=FAOSTAT_CSV, help="Path to the FAOSTAT CSV")
+    parser.add_argument("--cache-dir", default=FAOSTAT_CACHE_DIR, help="Directory for the cache files")
+    args = parser.parse_args()
+    manifest = build_faostat_cache(args.csv, args.cache_dir)
+    print(f"Cached {manifest['rows']} rows, {len(manifest['columns'])} columns in {args.cache_dir}")
@@ -0,0 +1,198 @@
+import hashlib
+import os
+import threading
+import time
+from types import MappingProxyType
+from data_loader import DATA_DIR, FAOSTAT_CSV, FAOSTAT_PROFILE_COLUMNS, load_reference_values, load_faostat_data, build_faostat_index, build_nutrient_registry
+import diet_database
+from nutrient_analysis import build_food_index
+from food_optimizer import FoodOptimizer, DEFAULT_MAX_FOODS, DEFAULT_MAX_GRAMS, DEFAULT_TIME_BUDGET
+from settings import env_setting
+from population_analysis import build_population_summary
+import metrics
+
+# Files backing each dataset
+REFERENCE_VALUES_PATH = os.path.join(DATA_DIR, 'Indicators_brief.csv')
+FAOSTAT_PATH = FAOSTAT_CSV
+NUTRIENT_SOURCES_PATH = os.path.join(DATA_DIR, 'nutrient_sources.db')
+
+# Minimum number of seconds between two freshness checks of the same file
+CHECK_INTERVAL = 2.0
+
+class _Entry:
+    """Cached dataset together with the state of the files it was loaded from"""
+    __slots__ = ('value', 'stat', 'digest', 'checked_at')
+
+    def __init__(self, value, stat, digest):
+        self.value = value
+        self.stat = stat
+        self.digest = digest
+        self.checked_at = time.monotonic()
+
+_entries = {}
+_lock = threading.RLock()
+
+def _file_stat(paths):
+    stats = [os.stat(path) for path in paths]
+    return tuple((stat.st_mtime_ns, stat.st_size) for stat in stats)
+
+def _file_digest(paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+def _is_fresh(entry, paths):
+    """
+    Check whether a cached entry still matches its files
+
+    The mtime/size pairs are compared first; if they changed, the files are hashed so
+    that a touch or an identical rewrite does not force a reload.
+    """
+    now = time.monotonic()
+    if now - entry.checked_at < CHECK_INTERVAL:
+        return True
+    entry.checked_at = now
+
+    stat = _file_stat(paths)
+    if stat == entry.stat:
+        return True
+    digest = _file_digest(paths)
+    if digest == entry.digest:
+        entry.stat = stat
+        return True
+    return False
+
+def _get(name, paths, loader):
+    """
+    Return the cached dataset `name`, (re)loading it with `loader` if any of `paths` changed
+    """
+    entry = _entries.get(name)
+    if entry is not None and _is_fresh(entry, paths):
+        return entry.value
+
+    with _lock:
+        # Another thread may have reloaded it while we were waiting for the lock
+        stat = _file_stat(paths)
+        entry = _entries.get(name)
+        if entry is not None and entry.stat == stat:
+            return entry.value
+        digest = _file_digest(paths)
+        with metrics.span('load_' + name):
+            value = loader()
+        _entries[name] = _Entry(value, stat, digest)
+        return value
+
+def _load_reference_data():
+    reference_values, reference_df = load_reference_values()
+    return MappingProxyType(reference_values), reference_df
+
+def _load_nutrient_sources():
+    nutrient_sources = diet_database.get_nutrient_sources(NUTRIENT_SOURCES_PATH)
+    return MappingProxyType({nutrient: MappingProxyType(foods) for nutrient, foods in nutrient_sources.items()})
+
+def get_reference_data():
+    """
+    Get the nutrient reference values shared by all sessions of this process
+
+    Returns:
+        Tuple[Mapping, pd.DataFrame]:
+        - Read-only mapping of nutrient names to reference values
+        - DataFrame containing full reference data (shared, do not modify in place)
+    """
+    return _get('reference', (REFERENCE_VALUES_PATH,), _load_reference_data)
+
+def _build_nutrient_registry():
+    return build_nutrient_registry(get_reference_data()[1])
+
+def get_nutrient_registry():
+    """
+    Get the nutrient metadata (unit, reference, label, order) shared by all sessions of this process
+
+    Returns:
+        NutrientRegistry: Metadata keyed by nutrient name
+    """
+    return _get('nutrient_registry', (REFERENCE_VALUES_PATH,), _build_nutrient_registry)
+
+def _load_faostat_data():
+    return load_faostat_data(columns=FAOSTAT_PROFILE_COLUMNS)
+
+def get_faostat_data():
+    """
+    Get the preprocessed FAOSTAT data shared by all sessions of this process
+
+    Only the columns needed for profiles are loaded (see FAOSTAT_PROFILE_COLUMNS).
+
+    Returns:
+        pd.DataFrame: Processed FAOSTAT data (shared, do not modify in place)
+    """
+    return _get('faostat', (FAOSTAT_PATH,), _load_faostat_data)
+
+def _build_faostat_index():
+    return build_faostat_index(get_faostat_data(), get_reference_data()[0])
+
+def get_faostat_index():
+    """
+    Get the FAOSTAT country/subpopulation/profile index shared by all sessions of this process
+
+    The index is rebuilt whenever either the FAOSTAT data or the reference values change.
+
+    Returns:
+        FaostatIndex: Prebuilt lookup tables for FAOSTAT profiles
+    """
+    return _get('faostat_index', (FAOSTAT_PATH, REFERENCE_VALUES_PATH), _build_faostat_index)
+
+def get_nutrient_sources():
+    """
+    Get the food sources for each nutrient shared by all sessions of this process
+
+    Returns:
+        Mapping: Read-only mapping of nutrient -> food -> (content, unit)
+    """
+    return _get('nutrient_sources', (NUTRIENT_SOURCES_PATH,), _load_nutrient_sources)
+
+def _build_population_summary():
+    return build_population_summary(get_faostat_index(), get_reference_data()[0])
+
+def get_population_summary():
+    """
+    Get the aggregates over all FAOSTAT profiles shared by all sessions of this process
+
+    Returns:
+        PopulationSummary: Distributions, status prevalence and country rankings
+    """
+    return _get('population', (FAOSTAT_PATH, REFERENCE_VALUES_PATH), _build_population_summary)
+
+def _build_food_index():
+    return build_food_index(get_nutrient_sources())
+
+def get_food_index():
+    """
+    Get the food ranking index over the nutrient sources shared by all sessions of this process
+
+    Returns:
+        FoodIndex: Per-nutrient food sources ranked for recommendations
+    """
+    return _get('food_index', (NUTRIENT_SOURCES_PATH,), _build_food_index)
+
+def _build_food_optimizer():
+    return FoodOptimizer(get_nutrient_sources(),
+                         max_foods=env_setting("OPTIMIZER_MAX_FOODS", DEFAULT_MAX_FOODS),
+                         max_grams=env_setting("OPTIMIZER_MAX_GRAMS", DEFAULT_MAX_GRAMS),
+                         time_budget=env_setting("OPTIMIZER_TIME_BUDGET", DEFAULT_TIME_BUDGET))
+
+def get_food_optimizer():
+    """
+    Get the food basket optimizer over the nutrient sources shared by all sessions of this process
+
+    Returns:
+        FoodOptimizer: Optimizer with its own cache of recent baskets
+    """
+    return _get('food_optimizer', (NUTRIENT_SOURCES_PATH,), _build_food_optimizer)
+
+def clear_cache():
+    """Drop all cached datasets so the next access reloads them from disk"""
+    with _lock:
+        _entries.clear()
@@ -1,157 +1,248 @@
 import sqlite3
-import pandas as pd
+import argparse
 import os
 
-def create_nutrient_sources_table(db_path="data/nutrient_sources.db"):
+DEFAULT_DB_PATH = "data/nutrient_sources.db"
+
+# Version 1 was the original key-less table that was appended to on every seed run.
+# Version 2 adds the (nutrient, food) key, the nutrient index and this version marker.
+SCHEMA_VERSION = 2
+
+# Seed data: (nutrient, food, content per 100g, unit)
+NUTRIENT_SOURCES_DATA = [
+    # Energy
+    ('Energy', 'Brown rice (cooked)', 112, 'kcal/100g'),
+    ('Energy', 'Chicken breast (cooked)', 165, 'kcal/100g'),
+    ('Energy', 'Avocado', 160, 'kcal/100g'),
+    ('Energy', 'Whole wheat bread', 247, 'kcal/100g'),
+    ('Energy', 'Banana', 89, 'kcal/100g'),
+
+    # Protein
+    ('Protein', 'Chicken breast (cooked)', 31, 'g/100g'),
+    ('Protein', 'Greek yogurt', 10, 'g/100g'),
+    ('Protein', 'Lentils (cooked)', 9, 'g/100g'),
+    ('Protein', 'Almonds', 21, 'g/100g'),
+    ('Protein', 'Salmon (cooked)', 22, 'g/100g'),
+
+    # Fat
+    ('Fat', 'Olive oil', 100, 'g/100g'),
+    ('Fat', 'Avocado', 15, 'g/100g'),
+    ('Fat', 'Almonds', 49, 'g/100g'),
+    ('Fat', 'Salmon (cooked)', 13, 'g/100g'),
+    ('Fat', 'Chia seeds', 31, 'g/100g'),
+
+    # Carbohydrate
+    ('Carbohydrate (available)', 'Brown rice (cooked)', 23, 'g/100g'),
+    ('Carbohydrate (available)', 'Banana', 23, 'g/100g'),
+    ('Carbohydrate (available)', 'Sweet potato (cooked)', 20, 'g/100g'),
+    ('Carbohydrate (available)', 'Whole wheat bread', 41, 'g/100g'),
+    ('Carbohydrate (available)', 'Oatmeal (cooked)', 12, 'g/100g'),
+
+    # Dietary Fibre
+    ('Dietary Fibre', 'Chia seeds', 34, 'g/100g'),
+    ('Dietary Fibre', 'Lentils (cooked)', 8, 'g/100g'),
+    ('Dietary Fibre', 'Almonds', 12, 'g/100g'),
+    ('Dietary Fibre', 'Raspberries', 7, 'g/100g'),
+    ('Dietary Fibre', 'Broccoli (cooked)', 3.3, 'g/100g'),
+
+    # Calcium
+    ('Calcium', 'Greek yogurt', 115, 'mg/100g'),
+    ('Calcium', 'Sardines (canned with bones)', 382, 'mg/100g'),
+    ('Calcium', 'Kale (cooked)', 150, 'mg/100g'),
+    ('Calcium', 'Tofu (firm)', 350, 'mg/100g'),
+    ('Calcium', 'Almonds', 269, 'mg/100g'),
+
+    # Iron
+    ('Iron', 'Spinach (cooked)', 3.6, 'mg/100g'),
+    ('Iron', 'Lentils (cooked)', 3.3, 'mg/100g'),
+    ('Iron', 'Beef (cooked)', 2.6, 'mg/100g'),
+    ('Iron', 'Pumpkin seeds', 8.8, 'mg/100g'),
+    ('Iron', 'Quinoa (cooked)', 1.5, 'mg/100g'),
+
+    # Zinc
+    ('Zinc', 'Oysters (cooked)', 78.6, 'mg/100g'),
+    ('Zinc', 'Beef (cooked)', 6.3, 'mg/100g'),
+    ('Zinc', 'Pumpkin seeds', 7.8, 'mg/100g'),
+    ('Zinc', 'Lentils (cooked)', 1.3, 'mg/100g'),
+    ('Zinc', 'Greek yogurt', 0.7, 'mg/100g'),
+
+    # Magnesium
+    ('Magnesium', 'Pumpkin seeds', 592, 'mg/100g'),
+    ('Magnesium', 'Spinach (cooked)', 87, 'mg/100g'),
+    ('Magnesium', 'Almonds', 270, 'mg/100g'),
+    ('Magnesium', 'Black beans (cooked)', 70, 'mg/100g'),
+    ('Magnesium', 'Avocado', 29, 'mg/100g'),
+
+    # Phosphorus
+    ('Phosphorus', 'Salmon (cooked)', 280, 'mg/100g'),
+    ('Phosphorus', 'Greek yogurt', 135, 'mg/100g'),
+    ('Phosphorus', 'Chicken breast (cooked)', 210, 'mg/100g'),
+    ('Phosphorus', 'Lentils (cooked)', 180, 'mg/100g'),
+    ('Phosphorus', 'Almonds', 481, 'mg/100g'),
+
+    # Potassium
+    ('Potassium', 'Sweet potato (cooked)', 475, 'mg/100g'),
+    ('Potassium', 'Banana', 358, 'mg/100g'),
+    ('Potassium', 'Spinach (cooked)', 466, 'mg/100g'),
+    ('Potassium', 'Salmon (cooked)', 360, 'mg/100g'),
+    ('Potassium', 'Avocado', 485, 'mg/100g'),
+
+    # Thiamin
+    ('Thiamin', 'Pork (cooked)', 0.7, 'mg/100g'),
+    ('Thiamin', 'Sunflower seeds', 1.5, 'mg/100g'),
+    ('Thiamin', 'Black beans (cooked)', 0.2, 'mg/100g'),
+    ('Thiamin', 'Brown rice (cooked)', 0.1, 'mg/100g'),
+    ('Thiamin', 'Trout (cooked)', 0.1, 'mg/100g'),
+
+    # Riboflavin
+    ('Riboflavin', 'Almonds', 1.1, 'mg/100g'),
+    ('Riboflavin', 'Beef liver (cooked)', 3.0, 'mg/100g'),
+    ('Riboflavin', 'Greek yogurt', 0.3, 'mg/100g'),
+    ('Riboflavin', 'Spinach (cooked)', 0.2, 'mg/100g'),
+    ('Riboflavin', 'Mushrooms (cooked)', 0.3, 'mg/100g'),
+
+    # Vitamin B6
+    ('Vitamin B6', 'Chickpeas (cooked)', 0.2, 'mg/100g'),
+    ('Vitamin B6', 'Salmon (cooked)', 0.6, 'mg/100g'),
+    ('Vitamin B6', 'Banana', 0.4, 'mg/100g'),
+    ('Vitamin B6', 'Potato (baked)', 0.3, 'mg/100g'),
+    ('Vitamin B6', 'Chicken breast (cooked)', 0.5, 'mg/100g'),
+
+    # Vitamin A (retinol equivalents)
+    ('Vitamin A (retinol equivalents)', 'Sweet potato (cooked)', 961, 'μg/100g'),
+    ('Vitamin A (retinol equivalents)', 'Spinach (cooked)', 524, 'μg/100g'),
+    ('Vitamin A (retinol equivalents)', 'Carrots (cooked)', 852, 'μg/100g'),
+    ('Vitamin A (retinol equivalents)', 'Kale (cooked)', 681, 'μg/100g'),
+    ('Vitamin A (retinol equivalents)', 'Beef liver (cooked)', 9442, 'μg/100g'),
+
+    # Vitamin A (retinol activity equivalents)
+    ('Vitamin A (retinol activity equivalents)', 'Sweet potato (cooked)', 961, 'μg/100g'),
+    ('Vitamin A (retinol activity equivalents)', 'Spinach (cooked)', 469, 'μg/100g'),
+    ('Vitamin A (retinol activity equivalents)', 'Carrots (cooked)', 852, 'μg/100g'),
+    ('Vitamin A (retinol activity equivalents)', 'Kale (cooked)', 681, 'μg/100g'),
+    ('Vitamin A (retinol activity equivalents)', 'Beef liver (cooked)', 9442, 'μg/100g'),
+
+    # Vitamin C
+    ('Vitamin C', 'Red bell pepper (raw)', 128, 'mg/100g'),
+    ('Vitamin C', 'Kiwi', 93, 'mg/100g'),
+    ('Vitamin C', 'Broccoli (cooked)', 65, 'mg/100g'),
+    ('Vitamin C', 'Strawberries', 59, 'mg/100g'),
+    ('Vitamin C', 'Orange', 53, 'mg/100g'),
+
+    # Vitamin B12
+    ('Vitamin B12', 'Clams (cooked)', 84.1, 'μg/100g'),
+    ('Vitamin B12', 'Salmon (cooked)', 2.8, 'μg/100g'),
+    ('Vitamin B12', 'Beef (cooked)', 2.1, 'μg/100g'),
+    ('Vitamin B12', 'Greek yogurt', 0.5, 'μg/100g'),
+    ('Vitamin B12', 'Eggs', 1.1, 'μg/100g')
+]
+
+
+def _get_schema_version(conn):
+    """
+    Read the schema version of an open database
+
+    Returns:
+        int: Stored schema version, 1 for a legacy database without a version table
+        and 0 for an empty database
+    """
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if 'schema_version' in tables:
+        row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+        return row[0] or 0
+    return 1 if 'nutrient_sources' in tables else 0
+
+def _create_schema(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS nutrient_sources
+                    (nutrient TEXT NOT NULL, food TEXT NOT NULL, content REAL, unit TEXT,
+                     UNIQUE (nutrient, food))''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_nutrient_sources_nutrient ON nutrient_sources (nutrient)')
+    conn.execute('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)')
+    conn.execute('DELETE FROM schema_version')
+    conn.execute('INSERT INTO schema_version VALUES (?)', (SCHEMA_VERSION,))
+
+def _ensure_schema(conn):
+    """
+    Bring an open database up to the current schema, deduplicating legacy rows
+
+    Returns:
+        bool: True if the database had to be migrated
+    """
+    version = _get_schema_version(conn)
+    if version == SCHEMA_VERSION:
+        return False
+
+    with conn:
+        if version == 1:
+            # Keep one row per (nutrient, food) in first-seen order; later duplicates win on content
+            conn.execute('ALTER TABLE nutrient_sources RENAME TO nutrient_sources_legacy')
+            _create_schema(conn)
+            conn.execute('''INSERT INTO nutrient_sources (nutrient, food, content, unit)
+                            SELECT nutrient, food, content, unit FROM nutrient_sources_legacy
+                            WHERE nutrient IS NOT NULL AND food IS NOT NULL
+                            ORDER BY rowid
+                            ON CONFLICT (nutrient, food) DO UPDATE
+                            SET content = excluded.content, unit = excluded.unit''')
+            conn.execute('DROP TABLE nutrient_sources_legacy')
+        else:
+            _create_schema(conn)
+    return True
+
+def create_nutrient_sources_table(db_path=DEFAULT_DB_PATH):
+    """
+    Create the nutrient sources table and seed it with the built-in food list
+
+    Seeding is an upsert on (nutrient, food), so running it repeatedly leaves
+    the table unchanged.
+
+    Args:
+        db_path: Path to the SQLite database
+    """
     conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS nutrient_sources
-                 (nutrient TEXT, food TEXT, content REAL, unit TEXT)''')
-    
-    # Read nutrients from Indicators_brief.csv
-    indicators_df = pd.read_csv('data/Indicators_brief.csv')
-    nutrients = indicators_df['Indicator'].tolist()
-
-    # Insert data for all nutrients
-    data = [
-        # Energy
-        ('Energy', 'Brown rice (cooked)', 112, 'kcal/100g'),
-        ('Energy', 'Chicken breast (cooked)', 165, 'kcal/100g'),
-        ('Energy', 'Avocado', 160, 'kcal/100g'),
-        ('Energy', 'Whole wheat bread', 247, 'kcal/100g'),
-        ('Energy', 'Banana', 89, 'kcal/100g'),
-        
-        # Protein
-        ('Protein', 'Chicken breast (cooked)', 31, 'g/100g'),
-        ('Protein', 'Greek yogurt', 10, 'g/100g'),
-        ('Protein', 'Lentils (cooked)', 9, 'g/100g'),
-        ('Protein', 'Almonds', 21, 'g/100g'),
-        ('Protein', 'Salmon (cooked)', 22, 'g/100g'),
-        
-        # Fat
-        ('Fat', 'Olive oil', 100, 'g/100g'),
-        ('Fat', 'Avocado', 15, 'g/100g'),
-        ('Fat', 'Almonds', 49, 'g/100g'),
-        ('Fat', 'Salmon (cooked)', 13, 'g/100g'),
-        ('Fat', 'Chia seeds', 31, 'g/100g'),
-        
-        # Carbohydrate
-        ('Carbohydrate (available)', 'Brown rice (cooked)', 23, 'g/100g'),
-        ('Carbohydrate (available)', 'Banana', 23, 'g/100g'),
-        ('Carbohydrate (available)', 'Sweet potato (cooked)', 20, 'g/100g'),
-        ('Carbohydrate (available)', 'Whole wheat bread', 41, 'g/100g'),
-        ('Carbohydrate (available)', 'Oatmeal (cooked)', 12, 'g/100g'),
-        
-        # Dietary Fibre
-        ('Dietary Fibre', 'Chia seeds', 34, 'g/100g'),
-        ('Dietary Fibre', 'Lentils (cooked)', 8, 'g/100g'),
-        ('Dietary Fibre', 'Almonds', 12, 'g/100g'),
-        ('Dietary Fibre', 'Raspberries', 7, 'g/100g'),
-        ('Dietary Fibre', 'Broccoli (cooked)', 3.3, 'g/100g'),
-        
-        # Calcium
-        ('Calcium', 'Greek yogurt', 115, 'mg/100g'),
-        ('Calcium', 'Sardines (canned with bones)', 382, 'mg/100g'),
-        ('Calcium', 'Kale (cooked)', 150, 'mg/100g'),
-        ('Calcium', 'Tofu (firm)', 350, 'mg/100g'),
-        ('Calcium', 'Almonds', 269, 'mg/100g'),
-        
-        # Iron
-        ('Iron', 'Spinach (cooked)', 3.6, 'mg/100g'),
-        ('Iron', 'Lentils (cooked)', 3.3, 'mg/100g'),
-        ('Iron', 'Beef (cooked)', 2.6, 'mg/100g'),
-        ('Iron', 'Pumpkin seeds', 8.8, 'mg/100g'),
-        ('Iron', 'Quinoa (cooked)', 1.5, 'mg/100g'),
-        
-        # Zinc
-        ('Zinc', 'Oysters (cooked)', 78.6, 'mg/100g'),
-        ('Zinc', 'Beef (cooked)', 6.3, 'mg/100g'),
-        ('Zinc', 'Pumpkin seeds', 7.8, 'mg/100g'),
-        ('Zinc', 'Lentils (cooked)', 1.3, 'mg/100g'),
-        ('Zinc', 'Greek yogurt', 0.7, 'mg/100g'),
-        
-        # Magnesium
-        ('Magnesium', 'Pumpkin seeds', 592, 'mg/100g'),
-        ('Magnesium', 'Spinach (cooked)', 87, 'mg/100g'),
-        ('Magnesium', 'Almonds', 270, 'mg/100g'),
-        ('Magnesium', 'Black beans (cooked)', 70, 'mg/100g'),
-        ('Magnesium', 'Avocado', 29, 'mg/100g'),
-        
-        # Phosphorus
-        ('Phosphorus', 'Salmon (cooked)', 280, 'mg/100g'),
-        ('Phosphorus', 'Greek yogurt', 135, 'mg/100g'),
-        ('Phosphorus', 'Chicken breast (cooked)', 210, 'mg/100g'),
-        ('Phosphorus', 'Lentils (cooked)', 180, 'mg/100g'),
-        ('Phosphorus', 'Almonds', 481, 'mg/100g'),
-        
-        # Potassium
-        ('Potassium', 'Sweet potato (cooked)', 475, 'mg/100g'),
-        ('Potassium', 'Banana', 358, 'mg/100g'),
-        ('Potassium', 'Spinach (cooked)', 466, 'mg/100g'),
-        ('Potassium', 'Salmon (cooked)', 360, 'mg/100g'),
-        ('Potassium', 'Avocado', 485, 'mg/100g'),
-        
-        # Thiamin
-        ('Thiamin', 'Pork (cooked)', 0.7, 'mg/100g'),
-        ('Thiamin', 'Sunflower seeds', 1.5, 'mg/100g'),
-        ('Thiamin', 'Black beans (cooked)', 0.2, 'mg/100g'),
-        ('Thiamin', 'Brown rice (cooked)', 0.1, 'mg/100g'),
-        ('Thiamin', 'Trout (cooked)', 0.1, 'mg/100g'),
-        
-        # Riboflavin
-        ('Riboflavin', 'Almonds', 1.1, 'mg/100g'),
-        ('Riboflavin', 'Beef liver (cooked)', 3.0, 'mg/100g'),
-        ('Riboflavin', 'Greek yogurt', 0.3, 'mg/100g'),
-        ('Riboflavin', 'Spinach (cooked)', 0.2, 'mg/100g'),
-        ('Riboflavin', 'Mushrooms (cooked)', 0.3, 'mg/100g'),
-        
-        # Vitamin B6
-        ('Vitamin B6', 'Chickpeas (cooked)', 0.2, 'mg/100g'),
-        ('Vitamin B6', 'Salmon (cooked)', 0.6, 'mg/100g'),
-        ('Vitamin B6', 'Banana', 0.4, 'mg/100g'),
-        ('Vitamin B6', 'Potato (baked)', 0.3, 'mg/100g'),
-        ('Vitamin B6', 'Chicken breast (cooked)', 0.5, 'mg/100g'),
-        
-        # Vitamin A (retinol equivalents)
-        ('Vitamin A (retinol equivalents)', 'Sweet potato (cooked)', 961, 'μg/100g'),
-        ('Vitamin A (retinol equivalents)', 'Spinach (cooked)', 524, 'μg/100g'),
-        ('Vitamin A (retinol equivalents)', 'Carrots (cooked)', 852, 'μg/100g'),
-        ('Vitamin A (retinol equivalents)', 'Kale (cooked)', 681, 'μg/100g'),
-        ('Vitamin A (retinol equivalents)', 'Beef liver (cooked)', 9442, 'μg/100g'),
-        
-        # Vitamin A (retinol activity equivalents)
-        ('Vitamin A (retinol activity equivalents)', 'Sweet potato (cooked)', 961, 'μg/100g'),
-        ('Vitamin A (retinol activity equivalents)', 'Spinach (cooked)', 469, 'μg/100g'),
-        ('Vitamin A (retinol activity equivalents)', 'Carrots (cooked)', 852, 'μg/100g'),
-        ('Vitamin A (retinol activity equivalents)', 'Kale (cooked)', 681, 'μg/100g'),
-        ('Vitamin A (retinol activity equivalents)', 'Beef liver (cooked)', 9442, 'μg/100g'),
-        
-        # Vitamin C
-        ('Vitamin C', 'Red bell pepper (raw)', 128, 'mg/100g'),
-        ('Vitamin C', 'Kiwi', 93, 'mg/100g'),
-        ('Vitamin C', 'Broccoli (cooked)', 65, 'mg/100g'),
-        ('Vitamin C', 'Strawberries', 59, 'mg/100g'),
-        ('Vitamin C', 'Orange', 53, 'mg/100g'),
-        
-        # Vitamin B12
-        ('Vitamin B12', 'Clams (cooked)', 84.1, 'μg/100g'),
-        ('Vitamin B12', 'Salmon (cooked)', 2.8, 'μg/100g'),
-        ('Vitamin B12', 'Beef (cooked)', 2.1, 'μg/100g'),
-        ('Vitamin B12', 'Greek yogurt', 0.5, 'μg/100g'),
-        ('Vitamin B12', 'Eggs', 1.1, 'μg/100g')
-    ]
-    
-    c.executemany('INSERT INTO nutrient_sources VALUES (?,?,?,?)', data)
-    
-    conn.commit()
+    _ensure_schema(conn)
+
+    with conn:
+        conn.executemany('''INSERT INTO nutrient_sources (nutrient, food, content, unit) VALUES (?,?,?,?)
+                            ON CONFLICT (nutrient, food) DO UPDATE
+                            SET content = excluded.content, unit = excluded.unit''', NUTRIENT_SOURCES_DATA)
+
     conn.close()
 
-def get_nutrient_sources(db_path="data/nutrient_sources.db"):
+def compact_database(db_path=DEFAULT_DB_PATH):
+    """
+    Migrate an existing database to the current schema in place and VACUUM it
+
+    Args:
+        db_path: Path to the SQLite database
+
+    Returns:
+        Dict: Row counts and file sizes before and after compaction
+    """
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"Database not found: {db_path}")
+
+    size_before = os.path.getsize(db_path)
+    conn = sqlite3.connect(db_path)
+    rows_before = conn.execute('SELECT COUNT(*) FROM nutrient_sources').fetchone()[0]
+    migrated = _ensure_schema(conn)
+    rows_after = conn.execute('SELECT COUNT(*) FROM nutrient_sources').fetchone()[0]
+    # VACUUM cannot run inside a transaction, so it happens after the migration commits
+    conn.execute('VACUUM')
+    conn.close()
+
+    return {
+        'migrated': migrated,
+        'rows_before': rows_before,
+        'rows_after': rows_after,
+        'bytes_before': size_before,
+        'bytes_after': os.path.getsize(db_path),
+    }
+
+def get_nutrient_sources(db_path=DEFAULT_DB_PATH):
     conn = sqlite3.connect(db_path)
     c = conn.cursor()
     
-    c.execute('SELECT nutrient, food, content, unit FROM nutrient_sources')
+    c.execute('SELECT nutrient, food, content, unit FROM nutrient_sources ORDER BY rowid')
     data = c.fetchall()
     
     nutrient_sources = {}
@@ -163,5 +254,21 @@ def get_nutrient_sources(db_path="data/nutrient_sources.db"):
     conn.close()
     return nutrient_sources
 
+def main():
+    parser = argparse.ArgumentParser(description="Manage the nutrient sources database")
+    parser.add_argument("command", nargs="?", default="seed", choices=["seed", "compact", "migrate"],
+                        help="seed: create and upsert the built-in data (default); "
+                             "compact/migrate: upgrade an existing database in place and VACUUM it")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="Path to the SQLite database")
+    args = parser.parse_args()
+
+    if args.command == "seed":
+        create_nutrient_sources_table(args.db)
+    else:
+        stats = compact_database(args.db)
+        print(f"{args.db}: {stats['rows_before']} -> {stats['rows_after']} rows, "
+              f"{stats['bytes_before']} -> {stats['bytes_after']} bytes"
+              f"{' (migrated)' if stats['migrated'] else ''}")
+
 if __name__ == "__main__":
-    create_nutrient_sources_table()
+    main()
@@ -0,0 +1,233 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import List
+import numpy as np
+from nutrient_analysis import STATUS_BINS
+from metrics import span
+
+# Aim for the reference value, and avoid pushing a nutrient past the first threshold
+# that is no longer Adequate (High)
+TARGET_PERCENTAGE = 100.0
+UPPER_PERCENTAGE = float(STATUS_BINS[2])
+# A nutrient counts as resolved from this percentage (the lower bound of Adequate)
+ADEQUATE_PERCENTAGE = float(STATUS_BINS[1])
+
+DEFAULT_MAX_FOODS = 5
+# Largest amount of a single food in a basket, in grams
+DEFAULT_MAX_GRAMS = 300.0
+# Seconds the solver may spend on one analysis before returning its best basket so far
+DEFAULT_TIME_BUDGET = 0.05
+DEFAULT_CACHE_SIZE = 1024
+# Percentage bucket width of the cache key; analyses with the same status per nutrient
+# and percentages in the same buckets share a basket
+CACHE_BUCKET = 5.0
+
+# Amounts are rounded to this many grams, and smaller amounts are dropped
+GRAMS_STEP = 5.0
+# Newton iterations when re-optimizing the amounts of the chosen foods
+_ITERATIONS = 50
+# Foods tried per greedy step, in order of steepest improvement, before the solver gives up
+_CANDIDATES = 8
+
+class Basket:
+    """
+    A combination of foods to add to a diet
+
+    Attributes:
+        items: (food, grams) pairs, largest amount first
+        percentages: Dictionary mapping nutrients to their percentage of reference after
+            adding the basket
+        complete: False if the time budget ran out before the solver converged
+    """
+    def __init__(self, items, percentages, complete):
+        self.items = items
+        self.percentages = percentages
+        self.complete = complete
+
+    @property
+    def unresolved(self) -> List[str]:
+        """Nutrients still below Adequate or above it after adding the basket"""
+        return [nutrient for nutrient, percentage in self.percentages.items()
+                if percentage < ADEQUATE_PERCENTAGE or percentage > UPPER_PERCENTAGE]
+
+    def __repr__(self):
+        return f"Basket({', '.join(f'{food}: {grams:g} g' for food, grams in self.items)})"
+
+class FoodOptimizer:
+    """
+    Finds a small basket of foods that jointly closes the deficits of an analysis
+
+    The diet is scored by the squared shortfall of each nutrient below TARGET_PERCENTAGE
+    plus the squared overshoot above UPPER_PERCENTAGE, both in percentage points of the
+    reference, so foods that would worsen an existing excess are traded off against the
+    deficits they close; nutrients not yet above UPPER_PERCENTAGE are never pushed past it.
+    A greedy sparse solver tries foods in order of steepest improvement, re-optimizing the
+    amounts of all chosen foods by projected Newton descent within [0, max_grams], and adds
+    the first one that improves the score. It stops when none of the next few candidates
+    does, `max_foods` foods are chosen or the time budget is spent.
+
+    Foods are only credited with the nutrients they are listed as a source of in
+    nutrient_sources; other contents are taken as zero.
+
+    Args:
+        nutrient_sources: Dictionary of nutrient -> food -> (content per 100g, unit)
+        max_foods: Maximum number of foods in a basket
+        max_grams: Maximum amount of each food
+        time_budget: Seconds per optimization
+        cache_size: Number of baskets kept in the in-memory cache
+    """
+    def __init__(self, nutrient_sources, max_foods=DEFAULT_MAX_FOODS, max_grams=DEFAULT_MAX_GRAMS,
+                 time_budget=DEFAULT_TIME_BUDGET, cache_size=DEFAULT_CACHE_SIZE):
+        self.nutrients = list(nutrient_sources)
+        self.foods = sorted({food for foods in nutrient_sources.values() for food in foods})
+        food_ids = {food: i for i, food in enumerate(self.foods)}
+        # Content per 100g, nutrients x foods
+        self.contents = np.zeros((len(self.nutrients), len(self.foods)))
+        for n, foods in enumerate(nutrient_sources.values()):
+            for food, (content, _) in foods.items():
+                self.contents[n, food_ids[food]] = content
+        self._positions = {nutrient: n for n, nutrient in enumerate(self.nutrients)}
+        self.max_foods = max_foods
+        self.max_grams = max_grams
+        self.time_budget = time_budget
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cache_key(self, results):
+        buckets = np.floor(results['Percentage'].to_numpy(dtype=np.float64) / CACHE_BUCKET).astype(int)
+        return tuple(sorted(zip(results['Nutrient'], results['Status'], buckets.tolist())))
+
+    def optimize(self, results, use_cache=True) -> Basket:
+        """
+        Find a basket of foods for an analysis
+
+        Args:
+            results: DataFrame with Nutrient, Intake, Reference, Percentage and Status
+                columns, as returned by calculate_results
+            use_cache: Reuse the basket of an analysis with the same statuses and
+                percentage buckets
+
+        Returns:
+            Basket: Foods and amounts to add (empty if nothing can be improved)
+        """
+        key = self._cache_key(results) if use_cache else None
+        if key is not None:
+            with self._lock:
+                basket = self._cache.get(key)
+                if basket is not None:
+                    self._cache.move_to_end(key)
+                    return basket
+
+        with span('optimize_basket'):
+            basket = self._solve(results)
+
+        if key is not None:
+            with self._lock:
+                self._cache[key] = basket
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return basket
+
+    def _solve(self, results):
+        deadline = time.perf_counter() + self.time_budget
+        rows = [(self._positions[nutrient], nutrient, reference, percentage)
+                for nutrient, reference, percentage in zip(results['Nutrient'], results['Reference'], results['Percentage'])
+                if nutrient in self._positions and reference > 0 and np.isfinite(percentage)]
+        if not rows:
+            return Basket([], {}, True)
+        positions, nutrients, reference, current = (np.array(column) for column in zip(*rows))
+        # Percentage points of each nutrient's reference per 100g of each food
+        matrix = self.contents[positions.astype(int)] / reference.astype(float)[:, np.newaxis] * 100
+        current = current.astype(float)
+        upper = self.max_grams / 100
+        # Nutrients within the upper bound must stay there
+        bounded = current <= UPPER_PERCENTAGE
+
+        def score(percentages):
+            return float(np.sum(np.maximum(TARGET_PERCENTAGE - percentages, 0) ** 2 +
+                                np.maximum(percentages - UPPER_PERCENTAGE, 0) ** 2))
+
+        def slope(percentages):
+            return 2 * (np.maximum(percentages - UPPER_PERCENTAGE, 0) - np.maximum(TARGET_PERCENTAGE - percentages, 0))
+
+        def refine(sub_matrix, amounts):
+            """Projected Newton descent on the amounts of the chosen foods"""
+            percentages = current + sub_matrix @ amounts
+            value = score(percentages)
+            for _ in range(_ITERATIONS):
+                gradient = sub_matrix.T @ slope(percentages)
+                # Amounts held at a bound by the gradient stay there
+                free = ~(((amounts <= 0) & (gradient > 0)) | ((amounts >= upper) & (gradient < 0)))
+                if not free.any() or np.max(np.abs(gradient[free])) < 1e-6:
+                    break
+                violated = (percentages < TARGET_PERCENTAGE) | (percentages > UPPER_PERCENTAGE)
+                rows = sub_matrix[violated][:, free]
+                direction = np.zeros_like(amounts)
+                direction[free] = -np.linalg.lstsq(2 * rows.T @ rows, gradient[free], rcond=None)[0]
+                # Slide along the upper bounds of nutrients that have reached them, and stop
+                # short of the bounds of the others
+                at_bound = bounded & (percentages >= UPPER_PERCENTAGE - 1e-6)
+                if at_bound.any():
+                    rows = sub_matrix[at_bound]
+                    direction -= rows.T @ np.linalg.lstsq(rows @ rows.T, rows @ direction, rcond=None)[0]
+                rising = sub_matrix @ direction
+                limited = bounded & ~at_bound & (rising > 1e-12)
+                step = min(1.0, float(np.min((UPPER_PERCENTAGE - percentages[limited]) / rising[limited]))) \
+                    if limited.any() else 1.0
+                # Backtracking line search within the box
+                while step > 1e-4:
+                    trial = np.clip(amounts + step * direction, 0, upper)
+                    trial_percentages = current + sub_matrix @ trial
+                    trial_value = score(trial_percentages)
+                    if trial_value < value - 1e-9 and np.all(trial_percentages[bounded] <= UPPER_PERCENTAGE + 1e-9):
+                        break
+                    step /= 2
+                else:
+                    break
+                amounts, percentages, value = trial, trial_percentages, trial_value
+                if time.perf_counter() > deadline:
+                    break
+            return amounts, value
+
+        active = []
+        amounts = np.zeros(0)
+        best = score(current)
+        complete = True
+        while len(active) < self.max_foods and complete:
+            scores = matrix.T @ slope(current + matrix[:, active] @ amounts)
+            scores[active] = 0
+            added = False
+            for candidate in np.argsort(scores, kind='stable')[:_CANDIDATES].tolist():
+                if scores[candidate] >= -1e-9:
+                    break  # No further food improves the score
+                if time.perf_counter() > deadline:
+                    complete = False
+                    break
+                # A food can fail to improve the score on its own, e.g. if it would push a
+                # nutrient past its upper bound; the next best candidate may still help
+                trial_active = active + [candidate]
+                trial, trial_score = refine(matrix[:, trial_active], np.append(amounts, 0.0))
+                if trial_score < best - 1e-9:
+                    active, amounts, best = trial_active, trial, trial_score
+                    added = True
+                    break
+            if not added:
+                break
+
+        grams = np.round(amounts * 100 / GRAMS_STEP) * GRAMS_STEP
+        if np.any((current + matrix[:, active] @ (grams / 100))[bounded] > UPPER_PERCENTAGE):
+            # Rounding up pushed a nutrient past its upper bound
+            grams = np.floor(amounts * 100 / GRAMS_STEP + 1e-9) * GRAMS_STEP
+        keep = grams > 0
+        active = [food for food, kept in zip(active, keep) if kept]
+        grams = grams[keep]
+        percentages = current + matrix[:, active] @ (grams / 100)
+        items = sorted(((self.foods[food], float(amount)) for food, amount in zip(active, grams)),
+                       key=lambda item: -item[1])
+        return Basket(items, dict(zip(nutrients.tolist(), np.round(percentages, 1).tolist())), complete)
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
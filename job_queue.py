@@ -0,0 +1,170 @@
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+import metrics
+from settings import env_setting
+
+# Worker threads running jobs; jobs mostly wait on LLM calls, which the gateway limits anyway
+DEFAULT_WORKERS = 16
+# Finished jobs are dropped from the table after this many seconds
+DEFAULT_RETENTION = 600.0
+
+# Job states; the last three are final
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+_jobs = metrics.counter('jobs', 'Background jobs finished, by kind and status (done/failed/cancelled)')
+_job_wait = metrics.histogram('job_wait_seconds', 'Time background jobs waited for a worker, by kind')
+_job_durations = metrics.histogram('job_duration_seconds', 'Run time of background jobs, by kind')
+
+class Job:
+    """
+    A unit of background work and its outcome
+
+    Attributes:
+        id: Job id
+        kind: Kind of work, e.g. 'estimate' or 'meal_plan'
+        status: QUEUED, RUNNING, DONE, FAILED or CANCELLED
+        result: Return value of the job function once DONE
+        error: Exception raised by the job function if FAILED
+        progress: Partial output published by the job while it runs
+        position: Number of LLM calls ahead of the job's call while it waits for token
+            budget, None otherwise
+    """
+    def __init__(self, job_id, kind):
+        self.id = job_id
+        self.kind = kind
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.progress = None
+        self.position = None
+        self.created = time.time()
+        self.finished = None
+        self._cancelled = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        """Whether the job has reached a final state"""
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether cancellation was requested; long-running jobs should check this and stop"""
+        return self._cancelled.is_set()
+
+    def set_position(self, position: Optional[int]):
+        """Record the queue position of the job's LLM call (usable as on_queue callback)"""
+        self.position = position
+
+    def set_progress(self, progress):
+        self.progress = progress
+
+class JobQueue:
+    """
+    Runs jobs on a thread pool and keeps their state in an in-memory table
+
+    Streamlit sessions submit slow work (LLM calls) as jobs and poll them on later
+    reruns, so a session's script thread is never blocked on an upstream call. Job
+    functions run outside any Streamlit session and must not call Streamlit themselves.
+
+    Args:
+        max_workers: Number of worker threads
+        retention: Seconds finished jobs are kept for polling
+    """
+    def __init__(self, max_workers=DEFAULT_WORKERS, retention=DEFAULT_RETENTION):
+        self.max_workers = max_workers
+        self.retention = retention
+        self._jobs: Dict[str, Job] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def submit(self, kind: str, fn: Callable, *args, **kwargs) -> str:
+        """
+        Queue `fn(job, *args, **kwargs)` for a worker thread
+
+        Args:
+            kind: Kind of work, used in metrics
+            fn: Job function; receives the Job first, to publish progress and check for
+                cancellation
+
+        Returns:
+            str: Job id to poll with get
+        """
+        with self._lock:
+            self._purge()
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='job')
+            job = Job(f"{kind}-{next(self._ids)}", kind)
+            self._jobs[job.id] = job
+            self._executor.submit(self._run, job, fn, args, kwargs)
+        return job.id
+
+    def _run(self, job, fn, args, kwargs):
+        if job.cancelled:
+            self._finish(job, CANCELLED)
+            return
+        job.status = RUNNING
+        _job_wait.observe(time.time() - job.created, kind=job.kind)
+        start = time.perf_counter()
+        try:
+            job.result = fn(job, *args, **kwargs)
+        except Exception as exc:
+            job.error = exc
+            self._finish(job, FAILED)
+        else:
+            self._finish(job, CANCELLED if job.cancelled else DONE)
+        finally:
+            _job_durations.observe(time.perf_counter() - start, kind=job.kind)
+
+    @staticmethod
+    def _finish(job, status):
+        job.position = None
+        job.finished = time.time()
+        job.status = status
+        _jobs.inc(kind=job.kind, status=status)
+
+    def _purge(self):
+        expired = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.done and job.finished < expired]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        """Get a job by id, or None if it is unknown or has expired"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: Optional[str]):
+        """
+        Request cancellation of a job; a queued job will not run, and a running one
+        finishes as CANCELLED, stopping early if its function checks `job.cancelled`
+        """
+        job = self.get(job_id)
+        if job is not None:
+            job._cancelled.set()
+
+    def stats(self) -> Dict[str, int]:
+        """Number of jobs in the table per status"""
+        with self._lock:
+            counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED, CANCELLED)}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+def get_job_queue() -> JobQueue:
+    """Get the process-wide job queue, creating it on first use with the JOB_* settings"""
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            _default_queue = JobQueue(env_setting("JOB_WORKERS", DEFAULT_WORKERS),
+                                      env_setting("JOB_RETENTION", DEFAULT_RETENTION))
+        return _default_queue
@@ -0,0 +1,141 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, Optional
+from data_loader import CACHE_DIR
+from settings import env_setting
+import metrics
+
+DEFAULT_CACHE_PATH = os.path.join(CACHE_DIR, 'llm_responses.db')
+# Entries older than this are treated as misses (seconds, default 30 days)
+DEFAULT_TTL = 30 * 24 * 3600.0
+# Least recently used entries are evicted above this size
+DEFAULT_MAX_ENTRIES = 10000
+
+_WHITESPACE = re.compile(r'\s+')
+
+_requests = metrics.counter('cache_requests', 'Cache lookups by cache and result (hit/miss)')
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize free text so trivially different inputs share a cache entry
+    (Unicode form, case, whitespace and trailing punctuation)
+    """
+    text = unicodedata.normalize('NFKC', text).casefold()
+    return _WHITESPACE.sub(' ', text).strip(' .;,!')
+
+def make_key(text: str, model: str, system_prompt: str) -> str:
+    """
+    Build the cache key for an LLM request
+
+    Args:
+        text: User input
+        model: Model name
+        system_prompt: System prompt sent with the input
+
+    Returns:
+        str: Hex digest identifying the request
+    """
+    prompt_hash = hashlib.sha256(system_prompt.encode('utf-8')).hexdigest()
+    payload = '\x1f'.join((model, prompt_hash, normalize_text(text)))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """
+    On-disk cache of LLM responses with a TTL and least-recently-used eviction
+
+    Safe to share between threads and processes; each operation uses its own
+    SQLite connection. `name` labels the cache in the exported metrics.
+    """
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, name='llm_responses'):
+        self.path = path
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS responses
+                            (key TEXT PRIMARY KEY, value TEXT NOT NULL,
+                             created_at REAL NOT NULL, accessed_at REAL NOT NULL)''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_accessed_at ON responses (accessed_at)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _count(self, hit):
+        _requests.inc(cache=self.name, result='hit' if hit else 'miss')
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for `key`, or None if it is missing or expired"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                row = conn.execute('SELECT value, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+                if row is not None and now - row[1] > self.ttl:
+                    conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                    row = None
+                if row is not None:
+                    conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+        finally:
+            conn.close()
+        self._count(row is not None)
+        return row[0] if row is not None else None
+
+    def set(self, key: str, value: str):
+        """Store a response, evicting the least recently used entries above max_entries"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)', (key, value, now, now))
+                conn.execute('''DELETE FROM responses WHERE key IN
+                                (SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)''',
+                             (self.max_entries,))
+        finally:
+            conn.close()
+
+    def clear(self):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM responses')
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns:
+            Dict: Hit and miss counts of this process and the number of stored entries
+        """
+        conn = self._connect()
+        try:
+            entries = conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        finally:
+            conn.close()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_response_cache() -> ResponseCache:
+    """Get the process-wide response cache, creating it on first use with the LLM_CACHE_* settings"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache(ttl=env_setting("LLM_CACHE_TTL", DEFAULT_TTL),
+                                           max_entries=env_setting("LLM_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+        return _default_cache
@@ -0,0 +1,800 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Iterator, List, Optional, Tuple, Union
+import metrics
+from settings import env_setting
+
+DEFAULT_MODEL = 'llama-3.3-70b-versatile'
+# Per-call deadline in seconds, covering all retries
+DEFAULT_TIMEOUT = 60.0
+# Maximum number of upstream calls in flight per process
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 3
+# Let concurrent identical requests share one upstream call (set LLM_COALESCE=0 to disable)
+DEFAULT_COALESCE = True
+# Estimated prompt + completion tokens admitted per minute across all sessions (0 disables
+# admission control), requests allowed to wait for budget, and the longest estimated wait
+# a new request is queued for before it is turned away
+DEFAULT_TOKENS_PER_MINUTE = 12000
+DEFAULT_MAX_QUEUE = 50
+DEFAULT_MAX_QUEUE_WAIT = 60.0
+# Completion tokens assumed for a call until its response is known
+DEFAULT_EXPECTED_TOKENS = 512
+
+# Queue priorities, lower first: short interactive calls go ahead of long generations
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITY_BACKGROUND = 3  # Speculative work nobody is waiting for yet
+
+# Seconds between checks of the queue position while a blocking call waits
+_POLL_INTERVAL = 0.25
+
+# A message is a (role, content) pair with role 'system', 'user' or 'assistant'
+Message = Tuple[str, str]
+
+_calls = metrics.counter('llm_calls', 'LLM calls by kind (complete/stream) and outcome (ok/error/timeout)')
+_retries = metrics.counter('llm_retries', 'LLM call attempts retried after a rate limit or transient error')
+_durations = metrics.histogram('llm_call_duration_seconds', 'Duration of LLM calls including retries')
+_first_chunk = metrics.histogram('llm_first_chunk_seconds', 'Time to the first chunk of streamed LLM calls')
+_coalesced = metrics.counter('llm_coalesced', 'LLM requests served by joining an identical call already in flight')
+_queue_wait = metrics.histogram('llm_queue_wait_seconds', 'Time LLM calls waited for token budget, by priority')
+_shed = metrics.counter('llm_shed', 'LLM calls turned away by admission control, by reason (queue_full/wait/evicted)')
+
+def _outcome(exc):
+    if exc is None:
+        return 'ok'
+    return 'timeout' if isinstance(exc, LLMTimeoutError) else 'error'
+
+class LLMError(Exception):
+    """An LLM call failed"""
+
+class LLMTimeoutError(LLMError):
+    """An LLM call did not complete before its deadline"""
+
+class LLMOverloadedError(LLMError):
+    """Admission control turned a call away because too many calls are waiting"""
+
+class RateLimitError(LLMError):
+    """The upstream API rejected a call because of rate limits"""
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def _is_retryable(exc):
+    """Whether an upstream exception is a rate limit or a transient server/connection error"""
+    status = getattr(exc, 'status_code', None)
+    if status is None and getattr(exc, 'response', None) is not None:
+        status = getattr(exc.response, 'status_code', None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(exc, (RateLimitError, ConnectionError)) or 'RateLimit' in type(exc).__name__ \
+        or 'Connection' in type(exc).__name__
+
+def _retry_after(exc):
+    if isinstance(exc, RateLimitError):
+        return exc.retry_after
+    response = getattr(exc, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+class GroqBackend:
+    """
+    Calls the Groq API through LangChain, with one client per (model, temperature)
+    sharing pooled HTTP connections
+    """
+    def __init__(self, api_key=None, max_connections=DEFAULT_MAX_CONCURRENCY * 2):
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self._models = {}
+        self._lock = threading.Lock()
+        self._http_client = None
+        self._http_async_client = None
+
+    def _get_model(self, model, temperature):
+        with self._lock:
+            key = (model, temperature)
+            if key not in self._models:
+                import httpx  # Imported on first use to keep startup light
+                from langchain_groq import ChatGroq
+                if self._http_client is None:
+                    limits = httpx.Limits(max_connections=self.max_connections,
+                                          max_keepalive_connections=self.max_connections)
+                    self._http_client = httpx.Client(limits=limits)
+                    self._http_async_client = httpx.AsyncClient(limits=limits)
+                self._models[key] = ChatGroq(
+                    api_key=self.api_key or os.getenv("GROQ_API_KEY"),
+                    model_name=model,
+                    temperature=temperature,
+                    max_retries=0,  # Retries are handled by the gateway
+                    http_client=self._http_client,
+                    http_async_client=self._http_async_client,
+                )
+            return self._models[key]
+
+    @staticmethod
+    def _to_langchain(messages):
+        from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+        classes = {'system': SystemMessage, 'user': HumanMessage, 'assistant': AIMessage}
+        return [classes[role](content=content) for role, content in messages]
+
+    async def complete(self, messages: List[Message], model: str, temperature: float) -> str:
+        result = await self._get_model(model, temperature).ainvoke(self._to_langchain(messages))
+        return result.content
+
+    async def stream(self, messages: List[Message], model: str, temperature: float):
+        async for chunk in self._get_model(model, temperature).astream(self._to_langchain(messages)):
+            if chunk.content:
+                yield chunk.content
+
+class FakeBackend:
+    """
+    Local backend for tests and offline runs
+
+    Args:
+        response: Fixed response text, or a function of the message list returning it
+        delay: Seconds to wait before answering
+        failures: Exceptions to raise on the first calls, in order (e.g. RateLimitError)
+    """
+    def __init__(self, response: Union[str, Callable[[List[Message]], str]] = "", delay=0.0, failures=None):
+        self.response = response
+        self.delay = delay
+        self.failures = list(failures or [])
+        self.calls = []
+
+    def _respond(self, messages):
+        self.calls.append(messages)
+        if self.failures:
+            raise self.failures.pop(0)
+        return self.response(messages) if callable(self.response) else self.response
+
+    async def complete(self, messages: List[Message], model: str, temperature: float) -> str:
+        await asyncio.sleep(self.delay)
+        return self._respond(messages)
+
+    async def stream(self, messages: List[Message], model: str, temperature: float):
+        await asyncio.sleep(self.delay)
+        text = self._respond(messages)
+        for start in range(0, len(text), 16):
+            yield text[start:start + 16]
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of a text (about 4 characters per token)"""
+    return len(text) // 4 + 1
+
+def _prompt_tokens(messages):
+    return sum(estimate_tokens(content) + 4 for _, content in messages)
+
+class _Grant:
+    """Tokens charged to the budget at `time`"""
+    def __init__(self, time, tokens):
+        self.time = time
+        self.tokens = tokens
+
+class _Waiter:
+    def __init__(self, future, cost, priority, ticket):
+        self.future = future
+        self.cost = cost
+        self.priority = priority
+        self.ticket = ticket
+
+class QueueTicket:
+    """
+    Queue position of one call, updated by the scheduler
+
+    Attributes:
+        position: Number of calls ahead of this one while it waits for token budget,
+            None when it is not waiting
+        priority: Priority the call is queued at, None until it asks for budget
+    """
+    def __init__(self):
+        self.priority = None
+        self._position = None
+        self._leader = None
+
+    @property
+    def position(self) -> Optional[int]:
+        return self._leader.position if self._leader is not None else self._position
+
+    @position.setter
+    def position(self, position):
+        self._position = position
+
+    def follow(self, ticket: 'QueueTicket'):
+        """Report the position of another call from now on, e.g. the one this call was coalesced into"""
+        self._leader = ticket
+
+class TokenBudgetScheduler:
+    """
+    Admits LLM calls against a budget of estimated tokens per minute
+
+    Each call is charged its estimated prompt tokens plus the completion tokens it is
+    expected to produce; the charge is corrected to the actual size once the response is
+    known, and expires a minute after admission. Calls that do not fit wait in a queue
+    ordered by priority and then arrival. A new call is turned away with
+    LLMOverloadedError if its estimated wait exceeds `max_wait` seconds, or if `max_queue`
+    calls are already waiting and none of them has a lower priority (otherwise the newest
+    of the lowest priority ones is turned away instead).
+
+    Only used from the gateway's event loop.
+
+    Args:
+        tokens_per_minute: Token budget per minute
+        max_queue: Maximum number of waiting calls
+        max_wait: Longest estimated wait in seconds before a call is turned away
+    """
+    window = 60.0
+
+    def __init__(self, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, max_queue=DEFAULT_MAX_QUEUE,
+                 max_wait=DEFAULT_MAX_QUEUE_WAIT):
+        self.tokens_per_minute = tokens_per_minute
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.used = 0
+        self._grants = deque()
+        self._queue = []  # Heap of (priority, arrival, waiter)
+        self._arrivals = itertools.count()
+        self._timer = None
+
+    @property
+    def queued(self) -> int:
+        """Number of calls waiting for budget"""
+        return sum(not waiter.future.done() for _, _, waiter in self._queue)
+
+    def _expire(self, now):
+        while self._grants and self._grants[0].time + self.window <= now:
+            self.used -= self._grants.popleft().tokens
+
+    def _fits(self, cost):
+        # A call larger than the whole budget is admitted alone rather than never
+        return self.used + cost <= self.tokens_per_minute or not self._grants
+
+    def _grant(self, cost):
+        grant = _Grant(time.monotonic(), cost)
+        self._grants.append(grant)
+        self.used += cost
+        return grant
+
+    def _estimated_wait(self, cost, priority):
+        ahead = sum(waiter.cost for waiter_priority, _, waiter in self._queue
+                    if waiter_priority <= priority and not waiter.future.done())
+        return max(self.used + ahead + cost - self.tokens_per_minute, 0) / self.tokens_per_minute * self.window
+
+    def _make_room(self, priority):
+        """Turn away the newest waiter of the lowest priority below `priority`, if any"""
+        waiting = [entry for entry in self._queue if not entry[2].future.done()]
+        if len(waiting) < self.max_queue:
+            return True
+        worst = max(waiting)
+        if worst[0] <= priority:
+            return False
+        worst[2].future.set_exception(LLMOverloadedError("Too many language model requests are waiting; try again shortly"))
+        worst[2].ticket.position = None
+        _shed.inc(reason='evicted')
+        return True
+
+    async def acquire(self, cost, priority=PRIORITY_NORMAL, ticket=None):
+        """
+        Wait until `cost` tokens fit in the budget and charge them
+
+        Args:
+            cost: Estimated tokens of the call
+            priority: Queue priority, lower first
+            ticket: QueueTicket to report the queue position to
+
+        Returns:
+            _Grant: The charge, to pass to settle once the actual size is known
+        """
+        ticket = ticket or QueueTicket()
+        if ticket.priority is not None:
+            priority = min(priority, ticket.priority)  # Promoted before it got here
+        ticket.priority = priority
+        self._expire(time.monotonic())
+        if not self.queued and self._fits(cost):
+            return self._grant(cost)
+        if self._estimated_wait(cost, priority) > self.max_wait:
+            _shed.inc(reason='wait')
+            raise LLMOverloadedError("The language model is busy; try again in a minute")
+        if not self._make_room(priority):
+            _shed.inc(reason='queue_full')
+            raise LLMOverloadedError("Too many language model requests are waiting; try again shortly")
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), cost, priority, ticket)
+        heapq.heappush(self._queue, (priority, next(self._arrivals), waiter))
+        start = time.perf_counter()
+        self._dispatch()
+        try:
+            return await waiter.future
+        finally:
+            waiter.ticket.position = None
+            if not waiter.future.done():
+                waiter.future.cancel()  # Cancelled by the caller, e.g. its deadline passed
+                self._dispatch()
+            _queue_wait.observe(time.perf_counter() - start, priority=str(priority))
+
+    def promote(self, ticket, priority):
+        """
+        Raise the priority of the call holding `ticket` to `priority` if that is higher, e.g.
+        when a more urgent request is coalesced into it; a call not queued yet is queued at it
+        """
+        if ticket.priority is not None and ticket.priority <= priority:
+            return
+        ticket.priority = priority
+        for index, (_, arrival, waiter) in enumerate(self._queue):
+            if waiter.ticket is ticket and not waiter.future.done():
+                waiter.priority = priority
+                self._queue[index] = (priority, arrival, waiter)
+                heapq.heapify(self._queue)
+                self._dispatch()
+                return
+
+    def settle(self, grant, tokens):
+        """Correct the charge of an admitted call to its actual size"""
+        if grant in self._grants:
+            self.used += tokens - grant.tokens
+        grant.tokens = tokens
+        self._dispatch()
+
+    def _dispatch(self):
+        """Admit waiting calls in order while they fit, and schedule the next check"""
+        self._expire(time.monotonic())
+        while self._queue:
+            _, _, waiter = self._queue[0]
+            if waiter.future.done():
+                heapq.heappop(self._queue)
+                continue
+            if not self._fits(waiter.cost):
+                break
+            heapq.heappop(self._queue)
+            waiter.future.set_result(self._grant(waiter.cost))
+        for position, (_, _, waiter) in enumerate(sorted(entry for entry in self._queue if not entry[2].future.done())):
+            waiter.ticket.position = position
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._queue and self._grants:
+            # Budget frees up when the oldest charge expires
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_at(loop.time() + max(self._grants[0].time + self.window - time.monotonic(), 0),
+                                       self._dispatch)
+
+def _request_key(kind, messages, model, temperature):
+    payload = json.dumps([kind, model, temperature, messages], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class _Broadcast:
+    """Chunks of one upstream stream, replayed to every reader that joins while it runs"""
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.readers = 0
+        self.task = None
+        self.ticket = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def publish(self, chunk):
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error=None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def read(self):
+        position = 0
+        while True:
+            while position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+class LLMGateway:
+    """
+    Shared entry point for all LLM calls
+
+    Calls run on a private asyncio event loop in a background thread, so they can be
+    awaited from async code (acomplete) or made from regular threads such as Streamlit
+    script runs (complete). Each call gets a deadline covering all attempts, calls are
+    limited to `max_concurrency` in flight, and rate-limit or transient errors are retried
+    with jittered exponential backoff.
+
+    With `coalesce`, a request identical (same messages, model and temperature) to one
+    already in flight does not make its own upstream call: it waits for the running call
+    and gets the same result, or for streams, the chunks produced so far followed by the
+    rest. The deadline of the first request applies to the shared call, and it waits for
+    token budget at the highest priority of the requests sharing it.
+
+    Upstream calls are admitted by a TokenBudgetScheduler (unless `tokens_per_minute` is
+    0), so bursts wait in a priority queue instead of running into upstream rate limits;
+    the deadline of a call includes its time in the queue.
+    """
+    def __init__(self, backend=None, max_concurrency=DEFAULT_MAX_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff_base=0.5, backoff_max=8.0, coalesce=DEFAULT_COALESCE,
+                 tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, max_queue=DEFAULT_MAX_QUEUE,
+                 max_queue_wait=DEFAULT_MAX_QUEUE_WAIT):
+        self.backend = backend or GroqBackend()
+        self.coalesce = coalesce
+        self.scheduler = TokenBudgetScheduler(tokens_per_minute, max_queue, max_queue_wait) \
+            if tokens_per_minute else None
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._loop = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+        # Request key -> in-flight task or _Broadcast; only used on the gateway loop
+        self._inflight = {}
+
+    def _get_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                threading.Thread(target=loop.run_forever, name="llm-gateway", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def _backoff(self, attempt, exc, remaining):
+        delay = _retry_after(exc)
+        if delay is None:
+            delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+            delay = random.uniform(delay / 2, delay)  # Jitter spreads out retries from concurrent sessions
+        return min(delay, max(remaining, 0))
+
+    async def _attempt(self, make_call):
+        async with self._semaphore:
+            return await make_call()
+
+    async def _admit(self, messages, priority, expected_tokens, ticket, deadline):
+        """Wait for token budget for a call; returns the grant to settle, or None"""
+        if self.scheduler is None:
+            return None
+        cost = _prompt_tokens(messages) + (expected_tokens or DEFAULT_EXPECTED_TOKENS)
+        try:
+            return await asyncio.wait_for(self.scheduler.acquire(cost, priority, ticket),
+                                          max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            raise LLMTimeoutError("LLM call timed out waiting in the queue") from None
+
+    def _settle(self, grant, messages, response_chars):
+        if grant is not None:
+            self.scheduler.settle(grant, _prompt_tokens(messages) + response_chars // 4)
+
+    async def _call(self, make_call, deadline):
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMTimeoutError("LLM call timed out")
+            try:
+                # The deadline also covers waiting for a concurrency slot
+                return await asyncio.wait_for(self._attempt(make_call), remaining)
+            except asyncio.TimeoutError:
+                raise LLMTimeoutError("LLM call timed out") from None
+            except Exception as exc:
+                if attempt >= self.max_retries or not _is_retryable(exc):
+                    if isinstance(exc, LLMError):
+                        raise
+                    raise LLMError(str(exc)) from exc
+                _retries.inc()
+                await asyncio.sleep(self._backoff(attempt, exc, deadline - time.monotonic()))
+                attempt += 1
+
+    def _join(self, call, priority, ticket):
+        """Let a request coalesced into `call` raise its queue priority and follow its position"""
+        if self.scheduler is not None:
+            self.scheduler.promote(call.ticket, priority)
+        if ticket is not None:
+            ticket.follow(call.ticket)
+
+    async def _acomplete(self, messages, model, temperature, timeout, priority=PRIORITY_NORMAL,
+                         expected_tokens=None, ticket=None):
+        ticket = ticket or QueueTicket()
+
+        def upstream():
+            return self._complete_upstream(messages, model, temperature, timeout, priority, expected_tokens, ticket)
+
+        if not self.coalesce:
+            return await upstream()
+        key = _request_key('complete', messages, model, temperature)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(upstream())
+            task.ticket = ticket
+            self._inflight[key] = task
+
+            def finished(task):
+                self._inflight.pop(key, None)
+                if not task.cancelled():
+                    task.exception()  # Retrieved here in case every waiter has gone
+            task.add_done_callback(finished)
+        else:
+            _coalesced.inc(kind='complete')
+            self._join(task, priority, ticket)
+        # Shielded so that a waiter being cancelled does not cancel the call for the others
+        return await asyncio.shield(task)
+
+    async def _complete_upstream(self, messages, model, temperature, timeout, priority, expected_tokens, ticket):
+        start = time.perf_counter()
+        deadline = time.monotonic() + (timeout or self.timeout)
+        error = None
+        try:
+            grant = await self._admit(messages, priority, expected_tokens, ticket, deadline)
+            response = await self._call(lambda: self.backend.complete(messages, model, temperature), deadline)
+            self._settle(grant, messages, len(response))
+            return response
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            _calls.inc(kind='complete', outcome=_outcome(error))
+            _durations.observe(time.perf_counter() - start, kind='complete')
+
+    async def acomplete(self, messages: List[Message], model: str = DEFAULT_MODEL, temperature: float = 0.0,
+                        timeout: Optional[float] = None, priority: int = PRIORITY_NORMAL,
+                        expected_tokens: Optional[int] = None) -> str:
+        """
+        Get a completion from async code running on any event loop
+
+        Args:
+            messages: List of (role, content) pairs
+            model: Model name
+            temperature: Sampling temperature
+            timeout: Deadline in seconds for the whole call including queueing and retries
+            priority: Queue priority (PRIORITY_HIGH/NORMAL/LOW/BACKGROUND) when the token budget is spent
+            expected_tokens: Expected completion tokens, charged to the budget until the
+                response is known
+
+        Returns:
+            str: Response text
+
+        Raises:
+            LLMOverloadedError: Admission control turned the call away
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self._acomplete(messages, model, temperature, timeout, priority, expected_tokens), self._get_loop())
+        return await asyncio.wrap_future(future)
+
+    def complete(self, messages: List[Message], model: str = DEFAULT_MODEL, temperature: float = 0.0,
+                 timeout: Optional[float] = None, priority: int = PRIORITY_NORMAL,
+                 expected_tokens: Optional[int] = None,
+                 on_queue: Optional[Callable[[Optional[int]], None]] = None) -> str:
+        """
+        Blocking version of acomplete for regular (non-async) code
+
+        `on_queue` is called in the calling thread with the number of calls ahead whenever
+        it changes while the call waits for token budget, and with None once it is admitted.
+        """
+        ticket = QueueTicket()
+        future = asyncio.run_coroutine_threadsafe(
+            self._acomplete(messages, model, temperature, timeout, priority, expected_tokens, ticket),
+            self._get_loop())
+        if on_queue is None:
+            return future.result()
+        position = None
+        try:
+            while True:
+                try:
+                    return future.result(timeout=_POLL_INTERVAL)
+                except concurrent.futures.TimeoutError:
+                    position = _report_position(ticket, position, on_queue)
+        finally:
+            if position is not None:
+                on_queue(None)
+
+    async def _astream(self, messages, model, temperature, deadline):
+        """
+        Stream response chunks; a failed attempt is only retried if it had not produced
+        any output yet, and the deadline applies to the whole stream
+        """
+        attempt = 0
+        while True:
+            started = False
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), max(deadline - time.monotonic(), 0))
+                try:
+                    chunks = self.backend.stream(messages, model, temperature).__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), max(deadline - time.monotonic(), 0))
+                        except StopAsyncIteration:
+                            return
+                        started = True
+                        yield chunk
+                finally:
+                    self._semaphore.release()
+            except asyncio.TimeoutError:
+                raise LLMTimeoutError("LLM call timed out") from None
+            except Exception as exc:
+                if started or attempt >= self.max_retries or not _is_retryable(exc):
+                    if isinstance(exc, LLMError):
+                        raise
+                    raise LLMError(str(exc)) from exc
+                _retries.inc()
+                await asyncio.sleep(self._backoff(attempt, exc, deadline - time.monotonic()))
+                attempt += 1
+
+    async def _produce_stream(self, broadcast, messages, model, temperature, timeout, priority,
+                              expected_tokens, ticket):
+        """Run one upstream stream, publishing its chunks to `broadcast`"""
+        start = time.perf_counter()
+        deadline = time.monotonic() + (timeout or self.timeout)
+        error = None
+        cancelled = False
+        grant = None
+        try:
+            grant = await self._admit(messages, priority, expected_tokens, ticket, deadline)
+            async for chunk in self._astream(messages, model, temperature, deadline):
+                if not broadcast.chunks:
+                    _first_chunk.observe(time.perf_counter() - start)
+                broadcast.publish(chunk)
+        except asyncio.CancelledError:
+            cancelled = True  # Every reader closed the stream early, which counts as completed
+        except Exception as exc:
+            error = exc
+        finally:
+            _calls.inc(kind='stream', outcome=_outcome(error))
+            _durations.observe(time.perf_counter() - start, kind='stream')
+            self._settle(grant, messages, sum(len(chunk) for chunk in broadcast.chunks))
+            broadcast.finish(error)
+        if cancelled:
+            raise asyncio.CancelledError
+
+    async def _shared_stream(self, messages, model, temperature, timeout, priority, expected_tokens, ticket):
+        """Stream a completion, joining an identical stream in flight if there is one"""
+        key = _request_key('stream', messages, model, temperature) if self.coalesce else None
+        broadcast = self._inflight.get(key) if key is not None else None
+        if broadcast is None:
+            broadcast = _Broadcast()
+            broadcast.ticket = ticket
+            broadcast.task = asyncio.ensure_future(
+                self._produce_stream(broadcast, messages, model, temperature, timeout, priority,
+                                     expected_tokens, ticket))
+            if key is not None:
+                self._inflight[key] = broadcast
+                broadcast.task.add_done_callback(
+                    lambda _: self._inflight.pop(key) if self._inflight.get(key) is broadcast else None)
+        else:
+            _coalesced.inc(kind='stream')
+            self._join(broadcast, priority, ticket)
+        broadcast.readers += 1
+        try:
+            async for chunk in broadcast.read():
+                yield chunk
+        finally:
+            broadcast.readers -= 1
+            if broadcast.readers == 0 and not broadcast.done:
+                # Nobody is reading any more; stop the upstream call and let new requests start afresh
+                if key is not None and self._inflight.get(key) is broadcast:
+                    del self._inflight[key]
+                broadcast.task.cancel()
+
+    def stream(self, messages: List[Message], model: str = DEFAULT_MODEL, temperature: float = 0.0,
+               timeout: Optional[float] = None, priority: int = PRIORITY_NORMAL,
+               expected_tokens: Optional[int] = None,
+               on_queue: Optional[Callable[[Optional[int]], None]] = None) -> Iterator[str]:
+        """
+        Stream a completion to regular (non-async) code as it is generated
+
+        Args:
+            messages: List of (role, content) pairs
+            model: Model name
+            temperature: Sampling temperature
+            timeout: Deadline in seconds for the whole stream including queueing
+            priority: Queue priority (PRIORITY_HIGH/NORMAL/LOW/BACKGROUND) when the token budget is spent
+            expected_tokens: Expected completion tokens, charged to the budget until the
+                stream ends
+            on_queue: Called in the reading thread with the number of calls ahead while
+                the stream waits for token budget, and with None once it is admitted
+
+        Yields:
+            str: Response text chunks; closing the iterator early cancels the upstream call
+        """
+        chunks = queue.Queue()
+        done = object()
+        ticket = QueueTicket()
+
+        async def pump():
+            try:
+                async for chunk in self._shared_stream(messages, model, temperature, timeout, priority,
+                                                       expected_tokens, ticket):
+                    chunks.put(chunk)
+            except BaseException as exc:
+                chunks.put(exc)
+            finally:
+                chunks.put(done)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self._get_loop())
+        position = None
+        try:
+            while True:
+                if on_queue is None:
+                    item = chunks.get()
+                else:
+                    try:
+                        item = chunks.get(timeout=_POLL_INTERVAL)
+                    except queue.Empty:
+                        position = _report_position(ticket, position, on_queue)
+                        continue
+                    if position is not None:
+                        on_queue(None)
+                    position, on_queue = None, None  # Admitted once output arrives
+                if item is done:
+                    return
+                if isinstance(item, BaseException):
+                    if isinstance(item, asyncio.CancelledError):
+                        return
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+            if position is not None:
+                on_queue(None)
+
+def _report_position(ticket, reported, on_queue):
+    """Call on_queue if the ticket's position differs from the one last reported"""
+    position = ticket.position
+    if position != reported:
+        on_queue(position)
+    return position
+
+_default_gateway = None
+_default_gateway_lock = threading.Lock()
+
+def get_gateway() -> LLMGateway:
+    """
+    Get the process-wide gateway, creating it on first use with the LLM_* settings
+
+    Set LLM_BACKEND=fake to answer every call locally with an empty response.
+    """
+    global _default_gateway
+    with _default_gateway_lock:
+        if _default_gateway is None:
+            from dotenv import load_dotenv
+            load_dotenv()  # GROQ_API_KEY and the LLM_* settings may come from .env
+            max_concurrency = env_setting("LLM_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)
+            if os.getenv("LLM_BACKEND") == "fake":
+                backend = FakeBackend()
+            else:
+                backend = GroqBackend(max_connections=max_concurrency * 2)
+            _default_gateway = LLMGateway(
+                backend, max_concurrency=max_concurrency,
+                timeout=env_setting("LLM_TIMEOUT", DEFAULT_TIMEOUT),
+                max_retries=env_setting("LLM_MAX_RETRIES", DEFAULT_MAX_RETRIES),
+                coalesce=env_setting("LLM_COALESCE", DEFAULT_COALESCE),
+                tokens_per_minute=env_setting("LLM_TOKENS_PER_MINUTE", DEFAULT_TOKENS_PER_MINUTE),
+                max_queue=env_setting("LLM_MAX_QUEUE", DEFAULT_MAX_QUEUE),
+                max_queue_wait=env_setting("LLM_MAX_QUEUE_WAIT", DEFAULT_MAX_QUEUE_WAIT))
+        return _default_gateway
+
+def set_gateway(gateway: LLMGateway):
+    """Replace the process-wide gateway, e.g. with one using a FakeBackend in tests"""
+    global _default_gateway
+    with _default_gateway_lock:
+        _default_gateway = gateway
@@ -1,23 +1,21 @@
 # Import required libraries
 import streamlit as st  # Web app framework
 import pandas as pd  # Data manipulation
-import pycountry  # Country data and operations
-from langchain_groq import ChatGroq  # Groq LLM integration
-from langchain_core.prompts import SystemMessagePromptTemplate, HumanMessagePromptTemplate, ChatPromptTemplate  # LLM prompt templates
-from langchain_core.output_parsers import StrOutputParser  # Parse LLM output
 # Import custom modules
-from diet_database import get_nutrient_sources  # Database operations
-from data_loader import load_reference_values, load_faostat_data, get_faostat_profile  # Data loading utilities
-from nutrient_analysis import calculate_results, get_food_recommendations  # Analysis functions
-from ui_components import display_results, display_recommendations  # UI components
-from meal_planner import generate_meal_plan  # Meal planning functionality
-from voice_input import get_voice_input  # Voice input processing
+from data_store import get_reference_data, get_nutrient_registry, get_faostat_index, get_food_index, get_food_optimizer, get_population_summary  # Process-wide cached datasets
+from nutrient_analysis import AnalysisState  # Incrementally updated analysis results
+from ui_components import display_results, display_basket, display_recommendations, display_population, watch_job  # UI components
+from job_queue import get_job_queue, DONE, FAILED, CANCELLED  # Background jobs for LLM calls
+from llm_gateway import LLMError, PRIORITY_LOW, PRIORITY_BACKGROUND  # Shared LLM client
+from nutrient_estimator import estimate_nutrients  # LLM nutrient estimates of diet descriptions
+import metrics  # Timing spans and counters, exported in Prometheus format
 from streamlit_extras.stylable_container import stylable_container  # Styled containers
 from dotenv import load_dotenv  # Environment variable management
 import os
-# Import required for image handling
-from PIL import Image
-from typing import Dict
+from functools import lru_cache
+from typing import Dict, List
+# pycountry, PIL, voice_input (speech_recognition, PyAudio) and meal_planner are imported
+# where they are first used, so startup and headless use of this module stay light
 
 # Define common container style
 CONTAINER_STYLE = """
@@ -54,44 +52,31 @@ def local_css(file_name):
     with open(os.path.join("data", file_name), "r") as f:
         st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
 
-# Load necessary data at startup
-reference_values, reference_df = load_reference_values()  # Load nutrient reference values
-faostat_df = load_faostat_data()  # Load FAOSTAT dietary data
-
-# Initialize database
-#create_nutrient_sources_table(os.path.join(DATA_DIR, "nutrient_sources.db"))  # Pass the new path
-nutrient_sources = get_nutrient_sources(os.path.join(DATA_DIR, "nutrient_sources.db"))  # Pass the new path
+# Get the shared datasets; they are loaded once per process and reused across reruns and sessions
+reference_values, _ = get_reference_data()  # Nutrient reference values
+nutrient_registry = get_nutrient_registry()  # Unit, label and order of each nutrient, keyed by name
+# The FAOSTAT index (get_faostat_index) and food ranking index (get_food_index) are fetched where
+# they are used, so sessions that never need them do not pay for loading them
 
 # Load environment variables
 load_dotenv()
 
+# Serve or write metrics if METRICS_PORT / METRICS_FILE are set (once per process)
+metrics.start_from_env()
+
 # Verify API key is loaded
 if not os.getenv("GROQ_API_KEY"):
     st.error("GROQ_API_KEY not found in environment variables. Please check your .env file.")
     st.stop()
 
-# Initialize the LLM model
-model = ChatGroq(
-    api_key=os.getenv("GROQ_API_KEY"),
-    model_name='llama-3.3-70b-versatile',#'llama-3.2-90b-text-preview',
-    temperature=0.0  # Set to 0 for deterministic outputs
-)
-
-# Define system message template for the LLM
-system_message = SystemMessagePromptTemplate.from_template(f"""You are given a list of food items or meals and you need to estimate 
-                                                           the total nutrient content of the diet. The nutrients that you have to 
-                                                           consider are: {', '.join(reference_values.keys())}.
-                                                           Write the estimated amount of each nutrient separated by semicolons, with 
-                                                           the format "Nutrient name: value;". Answer always in English, use the nutrient
-                                                           names exactly as they are in the list above.
-                                                           Only provide estimates for the nutrients listed above.
-                                                           You are brief. You do not comment on the results.
-                                                           If you don't know the nutrient content of a food item or meal, you say 'unknown'.
-                                                           If you don't recognize a food item, you can ask for clarification or you can make an estimation based on the context.
-                                                           """)
-
-# Get list of all countries from pycountry
-all_countries = [country.name for country in pycountry.countries]
+# Start generating the meal plan as soon as an analysis is available, before it is requested
+SPECULATIVE_MEAL_PLANS = os.getenv("SPECULATIVE_MEAL_PLANS", "0") == "1"
+
+# Get list of all countries from pycountry, loaded on first use
+@lru_cache(maxsize=None)
+def get_all_countries() -> List[str]:
+    import pycountry  # Country data and operations
+    return [country.name for country in pycountry.countries]
 
 # Define language codes
 LANGUAGE_CODES: Dict[str, str] = {
@@ -107,47 +92,103 @@ LANGUAGE_CODES: Dict[str, str] = {
     "Russian": "ru-RU"
 }
 
-# Function to generate LLM response
-def generate_response(chat_history):
-    chat_template = ChatPromptTemplate.from_messages(chat_history)
-    chain = chat_template | model | StrOutputParser()
-    response = chain.invoke({})
-    return response
+# Background job estimating a diet description; runs outside the Streamlit session
+def run_estimate(job, text):
+    return (text,) + estimate_nutrients(text, on_queue=job.set_position)
 
-# Function to parse LLM response into structured data
-def parse_response(response):
+def finish_estimate(job):
+    """Store the outcome of an estimate job in the session state"""
+    messages = []
+    if job.status == FAILED:
+        if isinstance(job.error, LLMError):
+            messages.append(('error', f"Could not reach the language model: {job.error}"))
+        else:
+            messages.append(('error', f"Failed to estimate nutrient content: {job.error}"))
+    elif job.status == DONE:
+        text, response, intakes, missing = job.result
+        if response is not None:  # Item-level estimates may be answered without the LLM
+            st.session_state.chat_history.append({'user': text, 'assistant': response})
+        if intakes:
+            # Keep every nutrient in the form so missing ones can be filled in by hand
+            st.session_state.estimated_intakes = {nutrient: intakes.get(nutrient, 0.0) for nutrient in reference_values}
+            messages.append(('success', "Nutrient content estimated successfully!"))
+            if missing:
+                messages.append(('warning', f"No estimate for: {', '.join(missing)}. These are set to 0, please adjust them if needed."))
+        else:
+            messages.append(('error', "Failed to estimate nutrient content. Please try again."))
+    st.session_state.estimate_messages = messages
+
+# Background job generating a meal plan, publishing the text written so far as progress
+def run_meal_plan(job, results, country, priority=PRIORITY_LOW):
+    from meal_planner import stream_meal_plan  # Meal planning functionality, loaded when first requested
+    meal_plan = ""
+    pieces = stream_meal_plan(results, country, on_queue=job.set_position, priority=priority)
     try:
-        # Skip lines until we find one containing a colon
-        lines = response.split('\n')
-        while lines and ':' not in lines[0]:
-            lines.pop(0)
-        
-        data = {}
-        estimates = lines[0].split(';')
-        
-        # Process each nutrient estimate
-        for line in estimates: 
-            parts = line.split(':')
-            if len(parts) == 2:
-                nutrient = parts[0].strip()
-                value = parts[1].strip()
-                
-                # Only process nutrients that are in our reference list
-                if nutrient in reference_values:
-                    import re
-                    # Handle decimal numbers with commas
-                    value = value.replace(',', '.')
-                    match = re.match(r'(\d+(?:\.\d+)?)\s*(\w+)', value)
-                    if match:
-                        numeric_value, unit = match.groups()
-                        data[nutrient] = float(numeric_value)
-                    else:
-                        data[nutrient] = 0.0  # Default to 0 if parsing fails
-        
-        return data
-    except Exception as e:
-        st.error(f"Failed to parse the response into a table: {str(e)}")
+        for piece in pieces:
+            if job.cancelled:
+                break
+            meal_plan += piece
+            job.set_progress(meal_plan)
+    finally:
+        pieces.close()  # Stops the upstream call if the job was cancelled
+    return meal_plan
+
+def finish_meal_plan(job):
+    """Store the outcome of a meal plan job in the session state"""
+    if job.status not in (DONE, FAILED):
+        return
+    st.session_state.meal_plan = job.result if job.status == DONE else None
+    st.session_state.show_meal_plan = True
+
+# Outcome of speculative meal plans; discarded ones were started for inputs the user moved away from
+speculative_plans = metrics.counter('speculative_meal_plans', 'Speculative meal plans by outcome (started/used/discarded)')
+
+def speculate_meal_plan(results, country):
+    """
+    Start generating the meal plan for the current analysis in the background, at the
+    lowest queue priority, replacing a speculative plan started for other inputs
+    """
+    from meal_planner import meal_plan_key
+    key = meal_plan_key(results, country)
+    if key == st.session_state.speculative_key:
+        return
+    discard_speculative_plan()
+    st.session_state.speculative_job = get_job_queue().submit('speculative_meal_plan', run_meal_plan, results.copy(),
+                                                              country, PRIORITY_BACKGROUND)
+    st.session_state.speculative_key = key
+    speculative_plans.inc(outcome='started')
+
+def discard_speculative_plan():
+    if st.session_state.speculative_job:
+        get_job_queue().cancel(st.session_state.speculative_job)
+        speculative_plans.inc(outcome='discarded')
+    st.session_state.speculative_job = None
+    st.session_state.speculative_key = None
+
+def claim_speculative_plan(results, country):
+    """
+    Take over the speculative plan for the given inputs, finished or still being written
+    
+    Returns:
+        str: Id of the speculative job, or None if there is none to serve (a plan still
+        waiting for token budget at background priority is discarded, so the requested
+        plan queues at its normal priority instead)
+    """
+    from meal_planner import meal_plan_key
+    key = meal_plan_key(results, country)
+    job = get_job_queue().get(st.session_state.speculative_job)
+    if job is None or job.status in (FAILED, CANCELLED) or job.position is not None \
+            or st.session_state.speculative_key != key:
+        discard_speculative_plan()
+        job = None
+    # Either way the plan for these inputs is now requested, so later reruns (and clicks)
+    # must not speculate it again until the inputs change
+    st.session_state.speculative_job = None
+    st.session_state.speculative_key = key
+    if job is None:
         return None
+    speculative_plans.inc(outcome='used')
+    return job.id
 
 # Main application function
 def main():
@@ -185,6 +226,18 @@ def main():
         st.session_state.meal_plan = None
     if 'selected_country' not in st.session_state:
         st.session_state.selected_country = None
+    # Ids of the running estimate and meal plan jobs, and the messages of the last estimate
+    if 'estimate_job' not in st.session_state:
+        st.session_state.estimate_job = None
+    if 'meal_plan_job' not in st.session_state:
+        st.session_state.meal_plan_job = None
+    if 'estimate_messages' not in st.session_state:
+        st.session_state.estimate_messages = []
+    # Speculative meal plan job and the key of the inputs it was started for
+    if 'speculative_job' not in st.session_state:
+        st.session_state.speculative_job = None
+    if 'speculative_key' not in st.session_state:
+        st.session_state.speculative_key = None
 
     # Create main layout columns
     col_input, col_results = st.columns([0.4, 0.6])
@@ -203,15 +256,15 @@ def main():
             input_method = st.radio("Choose input method:", ("LLM Estimation", "FAOSTAT Data Profiles", "Manual"), horizontal=True)
             
             if input_method == "FAOSTAT Data Profiles":
-                countries = faostat_df['Survey'].unique()
-                selected_country = st.selectbox("Select a country:", countries)
+                faostat_index = get_faostat_index()  # FAOSTAT countries, subpopulations and profiles
+                selected_country = st.selectbox("Select a country:", faostat_index.countries)
                 st.session_state.selected_country = selected_country
                 
-                subpopulations = faostat_df[faostat_df['Survey'] == selected_country]['Geographic Level'].unique()
+                subpopulations = faostat_index.get_subpopulations(selected_country)
                 selected_subpopulation = st.selectbox("Select a subpopulation:", subpopulations)
                 
                 if st.button("Load FAOSTAT Profile"):
-                    faostat_intakes = get_faostat_profile(faostat_df, selected_country, selected_subpopulation, reference_values)
+                    faostat_intakes = faostat_index.get_profile(selected_country, selected_subpopulation)
                     if faostat_intakes:
                         st.session_state.estimated_intakes = faostat_intakes
                         st.success(f"Loaded dietary profile for {selected_country} - {selected_subpopulation}")
@@ -227,7 +280,7 @@ def main():
                         for nutrient, intake in st.session_state.estimated_intakes.items():
                             if nutrient in reference_values:
                                 adjusted_intakes[nutrient] = st.number_input(
-                                    f"{nutrient} ({reference_df.loc[reference_df['Indicator'] == nutrient, 'Unit'].values[0]})",
+                                    nutrient_registry.label(nutrient),
                                     value=float(intake),
                                     help=f"FAOSTAT value: {intake}, Reference: {reference_values.get(nutrient, 'N/A')}"
                                 )
@@ -236,13 +289,14 @@ def main():
                     if submitted:
                         intakes = adjusted_intakes
             else:
+                all_countries = get_all_countries()
                 st.session_state.selected_country = st.selectbox("Select your country of residence:", all_countries, index=all_countries.index("United States"))
             
             if input_method == "Manual":
                 with st.form("nutrient_form"):
                     for nutrient, reference in reference_values.items():
                         intakes[nutrient] = st.number_input(
-                            f"{nutrient} ({reference_df.loc[reference_df['Indicator'] == nutrient, 'Unit'].values[0]})",
+                            nutrient_registry.label(nutrient),
                             value=0.0,
                             help=f"Reference value: {reference}"
                         )
@@ -262,24 +316,23 @@ def main():
                 
                 if estimate_submitted:
                     if use_voice:
+                        from voice_input import get_voice_input  # Voice input processing, only needed when requested
                         text, success = get_voice_input(LANGUAGE_CODES[selected_language])
                         if not success:
                             st.error(text)  # Display error message
                             return
                         
                     if text:
-                        with st.spinner("Estimating nutrient content..."):
-                            prompt = HumanMessagePromptTemplate.from_template(text)
-                            chat_history = [system_message, prompt]
-                            response = generate_response(chat_history)
-                            st.session_state.chat_history.append({'user': text, 'assistant': response})
-                            intakes = parse_response(response)
-                            if intakes:
-                                st.session_state.estimated_intakes = intakes
-                                st.success("Nutrient content estimated successfully!")
-                            else:
-                                st.error("Failed to estimate nutrient content. Please try again.")
-                                return
+                        # Estimated in the background; the page stays usable while the LLM answers
+                        job_queue = get_job_queue()
+                        job_queue.cancel(st.session_state.estimate_job)
+                        st.session_state.estimate_job = job_queue.submit('estimate', run_estimate, text)
+                        st.session_state.estimate_messages = []
+                
+                if st.session_state.estimate_job:
+                    watch_job('estimate_job', "Estimating nutrient content...", finish_estimate)
+                for level, message in st.session_state.estimate_messages:
+                    getattr(st, level)(message)
                 
                 if st.session_state.estimated_intakes:
                     st.subheader("Estimated Nutrient Intakes")
@@ -289,7 +342,7 @@ def main():
                     with st.form("adjust_estimates"):
                         for nutrient, intake in st.session_state.estimated_intakes.items():
                             adjusted_intakes[nutrient] = st.number_input(
-                                f"{nutrient} ({reference_df.loc[reference_df['Indicator'] == nutrient, 'Unit'].values[0]})",
+                                nutrient_registry.label(nutrient),
                                 value=float(intake),
                                 help=f"Estimated: {intake}, Reference: {reference_values.get(nutrient, 'N/A')}"
                             )
@@ -302,16 +355,23 @@ def main():
 
     # Results section
     if submitted and intakes:
-        st.session_state.results = calculate_results(intakes, reference_values)
+        # Keep the analysis between submissions so adjusting a few values only recomputes those
+        if 'analysis' not in st.session_state or st.session_state.analysis.reference_values != dict(reference_values):
+            st.session_state.analysis = AnalysisState(reference_values)
+        st.session_state.analysis.update(intakes)
+        st.session_state.results = st.session_state.analysis.results
         
     if 'results' in st.session_state:
+        if SPECULATIVE_MEAL_PLANS and st.session_state.selected_country:
+            speculate_meal_plan(st.session_state.results, st.session_state.selected_country)
+        
         with col_results:
             with stylable_container(
                 key="container_with_border",
                 css_styles=CONTAINER_STYLE
             ):  # Use stylable_container for results
                 #st.markdown("<h2 style='text-align: center;'>Analysis Results and Recommendations</h2>", unsafe_allow_html=True)
-                display_results(st.session_state.results, reference_df)
+                display_results(st.session_state.results, nutrient_registry, st.session_state.get('analysis'))
                 st.markdown('</div>', unsafe_allow_html=True)
         
         col_recommendations, col_meal_plan = st.columns(2)
@@ -322,7 +382,8 @@ def main():
                 css_styles=CONTAINER_STYLE
             ):  # Use stylable_container for recommendations
                 st.subheader("Dietary Recommendations")
-                display_recommendations(st.session_state.results, nutrient_sources)
+                display_basket(st.session_state.results, get_food_optimizer())
+                display_recommendations(st.session_state.results, get_food_index(), analysis=st.session_state.get('analysis'))
                 st.markdown('</div>', unsafe_allow_html=True)
         
         with col_meal_plan:
@@ -332,17 +393,34 @@ def main():
             ):  # Use stylable_container for meal plan
                 st.subheader("Meal Planner")
                 if st.button("Generate Meal Plan", key="generate_meal_plan"):
-                    with st.spinner("Generating meal plan..."):
-                        st.session_state.meal_plan = generate_meal_plan(st.session_state.results, st.session_state.selected_country)
-                    st.session_state.show_meal_plan = True
-            
-                if st.session_state.show_meal_plan and st.session_state.meal_plan:
+                    # Generated in the background; the plan is shown as it is written and kept for later reruns
+                    job_queue = get_job_queue()
+                    job_queue.cancel(st.session_state.meal_plan_job)
+                    job_id = claim_speculative_plan(st.session_state.results, st.session_state.selected_country) \
+                        if SPECULATIVE_MEAL_PLANS else None
+                    st.session_state.meal_plan_job = job_id or job_queue.submit('meal_plan', run_meal_plan, st.session_state.results.copy(),
+                                                                                st.session_state.selected_country)
+                    st.session_state.show_meal_plan = False
+                if st.session_state.meal_plan_job:
+                    st.markdown(f"<h4>Weekly Meal Plan for {st.session_state.selected_country}</h4>", unsafe_allow_html=True)
+                    watch_job('meal_plan_job', "Generating your meal plan...", finish_meal_plan, show_progress=st.markdown)
+                elif st.session_state.show_meal_plan and st.session_state.meal_plan:
                     st.markdown(f"<h4>Weekly Meal Plan for {st.session_state.selected_country}</h4>", unsafe_allow_html=True)
                     st.markdown(st.session_state.meal_plan)
                 elif st.session_state.show_meal_plan:
                     st.error("Failed to generate meal plan. Please try again.")
                 st.markdown('</div>', unsafe_allow_html=True)
 
+    # Population overview across every FAOSTAT profile, computed once per process
+    if st.checkbox("🌍 Show population overview across all FAOSTAT countries and subpopulations"):
+        with stylable_container(
+            key="container_with_border",
+            css_styles=CONTAINER_STYLE
+        ):
+            st.subheader("Population Overview")
+            display_population(get_population_summary())
+            st.markdown('</div>', unsafe_allow_html=True)
+
 # About section
     st.markdown("""
                 <br>
@@ -363,6 +441,7 @@ def main():
 """, unsafe_allow_html=True)
     
     col1, col_photo1,col3, col_photo2, col5 = st.columns(5)
+    from PIL import Image  # Image handling for the team photos
 
     with col_photo1:
         try:
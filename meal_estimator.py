@@ -0,0 +1,305 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from data_loader import CACHE_DIR
+from data_store import get_reference_data, get_nutrient_sources
+import metrics
+
+DEFAULT_STORE_PATH = os.path.join(CACHE_DIR, 'food_items.db')
+
+# Grams per unit of measure; ml are taken as grams
+UNIT_GRAMS = {
+    'g': 1, 'gram': 1, 'kg': 1000, 'kilogram': 1000, 'mg': 0.001,
+    'ml': 1, 'l': 1000, 'liter': 1000, 'litre': 1000,
+    'oz': 28.35, 'ounce': 28.35, 'lb': 453.6, 'pound': 453.6,
+    'cup': 240, 'glass': 250, 'bowl': 250, 'plate': 300, 'serving': 100, 'portion': 100,
+    'slice': 30, 'piece': 100, 'handful': 30, 'spoon': 15, 'tablespoon': 15, 'tbsp': 15,
+    'teaspoon': 5, 'tsp': 5, 'can': 150, 'scoop': 30,
+}
+
+# Typical weight in grams of one item, for counts without a unit ("2 eggs")
+PIECE_GRAMS = {
+    'egg': 50, 'banana': 120, 'apple': 180, 'orange': 130, 'kiwi': 75, 'pear': 180,
+    'peach': 150, 'tomato': 120, 'potato': 170, 'sweet potato': 200, 'carrot': 60,
+    'chicken breast': 170, 'steak': 200, 'fillet': 150, 'sausage': 75, 'burger': 150,
+    'toast': 30, 'bread': 30, 'bagel': 100, 'croissant': 60, 'muffin': 110, 'tortilla': 45,
+    'cookie': 15, 'sandwich': 200, 'pizza': 110, 'yogurt': 150, 'avocado': 150,
+}
+DEFAULT_PORTION_GRAMS = 100
+# Unknown items of one meal looked up in parallel
+MAX_CONCURRENT_LOOKUPS = 8
+
+NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6,
+    'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'twelve': 12, 'dozen': 12,
+    'half': 0.5, 'a half': 0.5, 'half a': 0.5, 'half an': 0.5, 'a couple of': 2, 'a few': 3, 'some': 1,
+}
+
+# Plurals the suffix rules in normalize_food_name get wrong
+IRREGULAR_PLURALS = {
+    'cookies': 'cookie', 'brownies': 'brownie', 'smoothies': 'smoothie', 'pies': 'pie',
+    'fries': 'fries', 'leaves': 'leaf', 'loaves': 'loaf', 'knives': 'knife',
+}
+
+_INTRO = re.compile(r'^\s*(?:(?:today|yesterday|for (?:breakfast|lunch|dinner))\s*,?\s*)?'
+                    r'(?:i\s+(?:ate|had|have eaten|drank|eat|have))?\s*:?\s*', re.IGNORECASE)
+_NUMBER_PATTERN = '|'.join(sorted((re.escape(word) for word in NUMBER_WORDS), key=len, reverse=True))
+# Commas between digits are decimal commas, and "and"/"with" only separate items when a
+# quantity follows, so dishes like "mac and cheese" stay one item
+_SEPARATORS = re.compile(r'\s*(?:(?<!\d),|,(?!\d)|;|\n|\+|\band then\b|\bplus\b|'
+                         rf'\b(?:and|with)\s+(?=\d|(?:{_NUMBER_PATTERN})\b))\s*', re.IGNORECASE)
+_UNIT_PATTERN = '|'.join(sorted((re.escape(unit) for unit in UNIT_GRAMS), key=len, reverse=True))
+_ITEM = re.compile(
+    rf'^(?P<quantity>\d+/\d+|\d+(?:[.,]\d+)?|(?:{_NUMBER_PATTERN})\b)?\s*'
+    rf'(?:(?P<unit>{_UNIT_PATTERN})(?:e?s)?\b\.?)?\s*(?:of\s+)?(?P<food>.+)$',
+    re.IGNORECASE)
+_items = metrics.counter('food_items', 'Food items of item-level meal estimates by source (local/llm)')
+
+_CLEAN = re.compile(r'[^\w\s\-\']')
+_PARENTHESES = re.compile(r'\s*\([^)]*\)')
+
+class FoodItem:
+    """One food item of a meal description with its quantity resolved to grams"""
+    def __init__(self, name, quantity, unit, grams):
+        self.name = name
+        self.quantity = quantity
+        self.unit = unit
+        self.grams = grams
+
+    def __repr__(self):
+        return f"FoodItem({self.name!r}, {self.grams:g} g)"
+
+def normalize_food_name(name: str) -> str:
+    """Lowercase, strip punctuation and reduce the last word to its singular form"""
+    words = _CLEAN.sub(' ', name.lower()).split()
+    if not words:
+        return ''
+    last = words[-1]
+    if last in IRREGULAR_PLURALS:
+        last = IRREGULAR_PLURALS[last]
+    elif last.endswith('ies') and len(last) > 4:
+        last = last[:-3] + 'y'
+    elif last.endswith(('oes', 'ches', 'shes', 'sses')):
+        last = last[:-2]
+    elif last.endswith('s') and not last.endswith(('ss', 'us', 'is')) and len(last) > 3:
+        last = last[:-1]
+    return ' '.join(words[:-1] + [last])
+
+def _parse_quantity(text):
+    if text is None:
+        return None
+    text = text.lower().replace(',', '.')
+    if text in NUMBER_WORDS:
+        return float(NUMBER_WORDS[text])
+    if '/' in text:
+        numerator, denominator = text.split('/')
+        return float(numerator) / float(denominator) if float(denominator) else None
+    return float(text)
+
+def _piece_grams(name):
+    # Drop leading words until a known item is found ("grilled chicken breast" -> "chicken breast")
+    words = name.split()
+    for start in range(len(words)):
+        grams = PIECE_GRAMS.get(' '.join(words[start:]))
+        if grams is not None:
+            return grams
+    return DEFAULT_PORTION_GRAMS
+
+def split_items(text: str) -> List[FoodItem]:
+    """
+    Split a free-text meal description into food items with quantities
+
+    Args:
+        text: Meal description, e.g. "2 eggs, 200 g of rice and a slice of toast"
+
+    Returns:
+        List[FoodItem]: Items in order of appearance
+    """
+    items = []
+    for part in _SEPARATORS.split(_INTRO.sub('', text, count=1)):
+        part = part.strip(' .!')
+        if not part:
+            continue
+        match = _ITEM.match(part)
+        quantity = _parse_quantity(match.group('quantity'))
+        unit = match.group('unit').lower() if match.group('unit') else None
+        name = normalize_food_name(match.group('food'))
+        if not name:
+            continue
+        if unit is not None:
+            grams = (quantity or 1) * UNIT_GRAMS[unit]
+        else:
+            grams = (quantity or 1) * _piece_grams(name)
+        items.append(FoodItem(name, quantity, unit, grams))
+    return items
+
+class FoodItemStore:
+    """
+    Per-100g nutrient vectors for food items
+
+    Vectors come from the nutrient_sources table (seed) and from memoized per-item LLM
+    lookups, which are persisted in SQLite so they are shared between sessions and
+    restarts. Seed vectors only cover the nutrients a food is listed as a source of.
+    Lookups that failed are stored with an empty vector, so the item is not sent again.
+    """
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._memo = {}
+        self._seed = None
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with sqlite3.connect(self.path, timeout=10) as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS food_items
+                            (name TEXT PRIMARY KEY, nutrients TEXT NOT NULL,
+                             source TEXT NOT NULL, updated_at REAL NOT NULL)''')
+
+    def _seed_vectors(self):
+        if self._seed is None:
+            seed = {}
+            for nutrient, foods in get_nutrient_sources().items():
+                for food, (content, unit) in foods.items():
+                    # Register both "brown rice (cooked)" and "brown rice"
+                    for alias in {normalize_food_name(food), normalize_food_name(_PARENTHESES.sub('', food))}:
+                        seed.setdefault(alias, {})[nutrient] = float(content)
+            self._seed = seed
+        return self._seed
+
+    def _stored(self, name):
+        with self._lock:
+            if name not in self._memo:
+                conn = sqlite3.connect(self.path, timeout=10)
+                try:
+                    row = conn.execute('SELECT nutrients FROM food_items WHERE name = ?', (name,)).fetchone()
+                finally:
+                    conn.close()
+                self._memo[name] = json.loads(row[0]) if row else None
+            return self._memo[name]
+
+    def known(self, name: str) -> bool:
+        """Whether an item has seed values or a stored (possibly failed) lookup"""
+        return name in self._seed_vectors() or self._stored(name) is not None
+
+    def get(self, name: str) -> Dict[str, float]:
+        """Return the known per-100g nutrients of an item (possibly partial or empty)"""
+        vector = dict(self._stored(name) or {})
+        # Seed values take precedence over estimates
+        vector.update(self._seed_vectors().get(name, {}))
+        return vector
+
+    def set(self, name: str, nutrients: Dict[str, float], source: str = 'llm'):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO food_items VALUES (?, ?, ?, ?)',
+                             (name, json.dumps(nutrients), source, time.time()))
+        finally:
+            conn.close()
+        with self._lock:
+            self._memo[name] = dict(nutrients)
+
+class MealEstimate:
+    """
+    Result of an item-level meal estimate
+
+    Attributes:
+        intakes: Total nutrient intakes of the meal
+        items: Parsed food items
+        sources: Dictionary mapping item names to 'local' or 'llm'
+        missing: Nutrients without a value for every item, which are left out of intakes
+    """
+    def __init__(self, intakes, items, sources, missing):
+        self.intakes = intakes
+        self.items = items
+        self.sources = sources
+        self.missing = missing
+
+    @property
+    def llm_calls(self) -> int:
+        return sum(1 for source in self.sources.values() if source == 'llm')
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+def get_food_item_store() -> FoodItemStore:
+    """Get the process-wide food item store, creating it on first use"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = FoodItemStore()
+        return _default_store
+
+def estimate_meal(text: str, lookup: Callable[[str], Optional[Dict[str, float]]],
+                  store: Optional[FoodItemStore] = None) -> Optional[MealEstimate]:
+    """
+    Estimate the nutrient content of a meal by summing per-item vectors
+
+    Items are resolved from the local store; only items without any local entry are sent
+    to `lookup`, once and concurrently, and the results are memoized, so later meals reuse
+    them without a call. A lookup only counts if it covers every reference nutrient. Seed
+    vectors are used as they are: nutrients missing from any item's vector are reported
+    as missing rather than summed as zero.
+
+    Args:
+        text: Free-text meal description
+        lookup: Function returning the per-100g nutrient content of a food item name
+            (e.g. an LLM query), or None/empty if it could not be estimated; called from
+            worker threads
+        store: Food item store (default: the process-wide store)
+
+    Returns:
+        MealEstimate: Intakes, missing nutrients and per-item sources, or None if the
+        description could not be split into items, an item could not be resolved or the
+        items have no nutrient in common; callers should then fall back to estimating the
+        whole meal at once
+    """
+    store = store or get_food_item_store()
+    reference_values, _ = get_reference_data()
+    items = split_items(text)
+    if not items:
+        return None
+
+    names = list(dict.fromkeys(item.name for item in items))
+    unknown = [name for name in names if not store.known(name)]
+    # Nutrients with a value for every item, counting items still to be looked up as complete;
+    # checked first so that no lookup is made for a meal that would fall back anyway
+    covered = set(reference_values)
+    for name in names:
+        if name not in unknown:
+            covered &= store.get(name).keys()
+    if not covered:
+        return None
+
+    # The lookups wait on the LLM, so they run concurrently and the gateway applies its own
+    # concurrency limit and token budget
+    if unknown:
+        with ThreadPoolExecutor(min(len(unknown), MAX_CONCURRENT_LOOKUPS), thread_name_prefix='lookup') as executor:
+            estimates = dict(zip(unknown, executor.map(lookup, unknown)))
+        resolved = True
+        for name, estimated in estimates.items():
+            nutrients = {nutrient: float(value) for nutrient, value in (estimated or {}).items()
+                         if nutrient in reference_values}
+            if len(nutrients) == len(reference_values):
+                store.set(name, nutrients)
+            else:
+                store.set(name, {}, source='failed')
+                resolved = False
+        if not resolved:
+            return None
+
+    intakes = {nutrient: 0.0 for nutrient in reference_values if nutrient in covered}
+    sources = {}
+    for item in items:
+        vector = store.get(item.name)
+        source = 'llm' if item.name in unknown else 'local'
+        sources[item.name] = source
+        _items.inc(source=source)
+        for nutrient in intakes:
+            intakes[nutrient] += vector[nutrient] * item.grams / 100
+
+    missing = [nutrient for nutrient in reference_values if nutrient not in covered]
+    return MealEstimate({nutrient: round(value, 2) for nutrient, value in intakes.items()}, items, sources, missing)
@@ -0,0 +1,149 @@
+import argparse
+import hashlib
+import os
+import threading
+from collections import Counter
+from typing import Optional
+import numpy as np
+from data_loader import CACHE_DIR
+from llm_cache import ResponseCache
+from settings import env_setting
+
+DEFAULT_CACHE_PATH = os.path.join(CACHE_DIR, 'meal_plans.db')
+# Reuse policy: 'status' shares plans between analyses with the same country and status per
+# nutrient, 'quantized' additionally requires percentages in the same bucket, 'off' disables reuse
+DEFAULT_POLICY = 'status'
+# Bucket width, in percentage points, for the 'quantized' policy
+DEFAULT_BUCKET = 25.0
+DEFAULT_TTL = 30 * 24 * 3600.0
+DEFAULT_MAX_ENTRIES = 5000
+
+POLICIES = ('status', 'quantized', 'off')
+
+def make_key(analysis_results, country, policy=DEFAULT_POLICY, bucket=DEFAULT_BUCKET) -> Optional[str]:
+    """
+    Build the cache key for a meal plan request
+
+    Args:
+        analysis_results: DataFrame of analysis results (Nutrient, Percentage, Status columns)
+        country: Country of residence
+        policy: Reuse policy, one of POLICIES
+        bucket: Bucket width in percentage points for the 'quantized' policy
+
+    Returns:
+        str: Hex digest identifying equivalent requests, or None if reuse is disabled
+    """
+    if policy == 'off':
+        return None
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown meal plan cache policy: {policy}")
+
+    results = analysis_results.sort_values('Nutrient')
+    parts = [policy, str(country)]
+    parts += [f"{nutrient}={status}" for nutrient, status in zip(results['Nutrient'], results['Status'])]
+    if policy == 'quantized':
+        buckets = np.floor(results['Percentage'].to_numpy(dtype=np.float64) / bucket).astype(int)
+        parts += [f"{bucket:g}"] + [str(value) for value in buckets]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+class MealPlanCache:
+    """On-disk meal plan cache keyed on country and analysis profile"""
+    def __init__(self, path=DEFAULT_CACHE_PATH, policy=DEFAULT_POLICY, bucket=DEFAULT_BUCKET,
+                 ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.policy = policy
+        self.bucket = bucket
+        self.store = ResponseCache(path, ttl=ttl, max_entries=max_entries, name='meal_plans')
+
+    def key(self, analysis_results, country):
+        return make_key(analysis_results, country, self.policy, self.bucket)
+
+    def get(self, analysis_results, country) -> Optional[str]:
+        key = self.key(analysis_results, country)
+        return self.store.get(key) if key is not None else None
+
+    def set(self, analysis_results, country, meal_plan: str):
+        key = self.key(analysis_results, country)
+        if key is not None:
+            self.store.set(key, meal_plan)
+
+    def stats(self):
+        return self.store.stats()
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_meal_plan_cache() -> MealPlanCache:
+    """Get the process-wide meal plan cache, creating it on first use with the MEAL_PLAN_CACHE_* settings"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = MealPlanCache(
+                policy=env_setting("MEAL_PLAN_CACHE_POLICY", DEFAULT_POLICY),
+                bucket=env_setting("MEAL_PLAN_CACHE_BUCKET", DEFAULT_BUCKET),
+                ttl=env_setting("MEAL_PLAN_CACHE_TTL", DEFAULT_TTL),
+                max_entries=env_setting("MEAL_PLAN_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+        return _default_cache
+
+def prewarm(top=20, dry_run=False):
+    """
+    Generate and cache meal plans for the most common country x status combinations
+    among the FAOSTAT profiles
+
+    Args:
+        top: Number of combinations to generate
+        dry_run: Only report the combinations
+
+    Returns:
+        int: Number of meal plans generated
+    """
+    import pandas as pd
+    from data_store import get_reference_data, get_faostat_index
+    from nutrient_analysis import calculate_batch_results
+    from meal_planner import generate_meal_plan
+
+    reference_values, _ = get_reference_data()
+    faostat_index = get_faostat_index()
+    profiles = pd.DataFrame.from_dict(faostat_index.profiles, orient='index')
+    results = calculate_batch_results(profiles, reference_values).to_frame()
+
+    cache = get_meal_plan_cache()
+    if cache.policy == 'off':
+        return 0
+    counts = Counter()
+    representatives = {}
+    for profile, group in results.groupby('Profile', sort=False):
+        country = profile[0]
+        key = cache.key(group, country)
+        counts[key] += 1
+        representatives.setdefault(key, (country, group.drop(columns='Profile').reset_index(drop=True)))
+
+    generated = 0
+    for key, count in counts.most_common(top):
+        country, group = representatives[key]
+        if cache.store.get(key) is not None:
+            continue
+        print(f"{country}: {count} profile(s)")
+        if dry_run:
+            continue
+        meal_plan = generate_meal_plan(group, country, use_cache=False)
+        if not meal_plan.startswith("Error generating meal plan"):
+            cache.store.set(key, meal_plan)
+            generated += 1
+    return generated
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the meal plan cache")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    prewarm_parser = subparsers.add_parser("prewarm", help="Generate plans for the most common FAOSTAT profiles")
+    prewarm_parser.add_argument("--top", type=int, default=20, help="Number of country x status combinations")
+    prewarm_parser.add_argument("--dry-run", action="store_true", help="List combinations without generating")
+    subparsers.add_parser("stats", help="Show cache statistics")
+    subparsers.add_parser("clear", help="Remove all cached meal plans")
+    args = parser.parse_args()
+
+    if args.command == "prewarm":
+        print(f"Generated {prewarm(args.top, args.dry_run)} meal plan(s)")
+    elif args.command == "stats":
+        print(get_meal_plan_cache().stats())
+    else:
+        get_meal_plan_cache().store.clear()
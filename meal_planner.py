@@ -1,32 +1,109 @@
-from dotenv import load_dotenv
-from langchain_groq import ChatGroq  # Groq LLM integration
-from langchain_core.prompts import SystemMessagePromptTemplate, HumanMessagePromptTemplate, ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-import os
+import hashlib
+from llm_gateway import get_gateway, PRIORITY_LOW
+from meal_plan_cache import get_meal_plan_cache
+from metrics import span, timed
 
-# Load environment variables
-load_dotenv()
+MODEL_NAME = 'llama-3.3-70b-versatile'#'llama-3.2-90b-text-preview'
+TEMPERATURE = 0.2
+# Completion tokens expected for a week-long plan, charged to the shared token budget
+MEAL_PLAN_TOKENS = 3000
 
-meal_planner_model = ChatGroq(
-    api_key=os.getenv("GROQ_API_KEY"),
-    model_name='llama-3.3-70b-versatile',#'llama-3.2-90b-text-preview',
-    temperature=0.2  # Set to 0 for deterministic outputs
-)
-
-meal_planner_system_message = SystemMessagePromptTemplate.from_template("""You are a nutritionist and meal planner. 
+MEAL_PLANNER_SYSTEM_PROMPT = """You are a nutritionist and meal planner. 
 Given a detailed analysis of a person's nutrient intake, you will create a meal plan for a week with 3 meals per day. 
 Focus on addressing any nutrient deficiencies and maintaining a balanced diet. 
-Provide a brief explanation for each day's meals and how they address the nutritional needs.""")
+Provide a brief explanation for each day's meals and how they address the nutritional needs."""
+
+def _build_messages(analysis_results, country):
+    formatted_results = "\n".join([f"{row['Nutrient']}: Intake {row['Intake']:.2f}, Reference {row['Reference']:.2f}, Status {row['Status']}" for _, row in analysis_results.iterrows()])
+    
+    prompt = f"Based on this nutrient analysis:\n\n{formatted_results}\n\nCreate a meal plan for a week with 3 meals per day for someone living in {country}. Consider local cuisine and available ingredients."
+    return [('system', MEAL_PLANNER_SYSTEM_PROMPT), ('user', prompt)]
 
-def generate_meal_plan(analysis_results, country):
+def meal_plan_key(analysis_results, country) -> str:
+    """
+    Key shared by meal plan requests that are answered with the same plan: the meal plan
+    cache key, or a hash of the prompt if the cache is off
+    """
+    key = get_meal_plan_cache().key(analysis_results, country)
+    if key is None:
+        key = hashlib.sha256(repr(_build_messages(analysis_results, country)).encode('utf-8')).hexdigest()
+    return key
+
+@timed()
+def generate_meal_plan(analysis_results, country, use_cache=True, raise_errors=False):
+    """
+    Generate a meal plan
+    
+    Args:
+        analysis_results: DataFrame of analysis results
+        country: Country of residence
+        use_cache: Read and write the meal plan cache
+        raise_errors: Raise errors (such as the gateway's LLMError) rather than
+            returning them as the meal plan
+    
+    Returns:
+        str: The meal plan; an error message if generation fails and raise_errors is False
+    """
     try:
-        formatted_results = "\n".join([f"{row['Nutrient']}: Intake {row['Intake']:.2f}, Reference {row['Reference']:.2f}, Status {row['Status']}" for _, row in analysis_results.iterrows()])
-        
-        prompt = HumanMessagePromptTemplate.from_template(f"Based on this nutrient analysis:\n\n{formatted_results}\n\nCreate a meal plan for a week with 3 meals per day for someone living in {country}. Consider local cuisine and available ingredients.")
-        chat_history = [meal_planner_system_message, prompt]
-        chat_template = ChatPromptTemplate.from_messages(chat_history)
-        chain = chat_template | meal_planner_model | StrOutputParser()
-        response = chain.invoke({})
+        if use_cache:
+            cached = get_meal_plan_cache().get(analysis_results, country)
+            if cached is not None:
+                return cached
+        messages = _build_messages(analysis_results, country)
+        response = get_gateway().complete(messages, model=MODEL_NAME, temperature=TEMPERATURE, priority=PRIORITY_LOW,
+                                          expected_tokens=MEAL_PLAN_TOKENS)
+        if use_cache:
+            get_meal_plan_cache().set(analysis_results, country, response)
         return response
     except Exception as e:
+        if raise_errors:
+            raise
         return f"Error generating meal plan: {str(e)}"
+
+def stream_meal_plan(analysis_results, country, use_cache=True, on_queue=None, priority=PRIORITY_LOW):
+    """
+    Generate a meal plan, yielding it line by line as the model writes it
+    
+    Complete lines are yielded (rather than raw tokens) so partially rendered
+    Markdown such as headings and lists stays well-formed. Plans for an equivalent
+    analysis and country (see meal_plan_cache) are served from the cache in one piece,
+    and newly generated plans are cached once complete.
+    
+    Args:
+        analysis_results: DataFrame of analysis results
+        country: Country of residence
+        use_cache: Read and write the meal plan cache
+        on_queue: Called with the queue position while the call waits for token budget;
+            meal plans queue behind shorter requests
+        priority: Queue priority of the LLM call
+    
+    Yields:
+        str: Consecutive pieces of the meal plan; an error message if generation fails
+    """
+    # Timed here rather than with @timed, which would only cover creating the generator
+    with span('stream_meal_plan'):
+        yield from _stream_meal_plan(analysis_results, country, use_cache, on_queue, priority)
+
+def _stream_meal_plan(analysis_results, country, use_cache, on_queue, priority):
+    buffer = ""
+    try:
+        if use_cache:
+            cached = get_meal_plan_cache().get(analysis_results, country)
+            if cached is not None:
+                yield cached
+                return
+        messages = _build_messages(analysis_results, country)
+        meal_plan = []
+        for chunk in get_gateway().stream(messages, model=MODEL_NAME, temperature=TEMPERATURE, priority=priority,
+                                          expected_tokens=MEAL_PLAN_TOKENS, on_queue=on_queue):
+            meal_plan.append(chunk)
+            buffer += chunk
+            if "\n" in buffer:
+                complete, buffer = buffer.rsplit("\n", 1)
+                yield complete + "\n"
+        if buffer:
+            yield buffer
+        if use_cache:
+            get_meal_plan_cache().set(analysis_results, country, "".join(meal_plan))
+    except Exception as e:
+        yield (buffer + "\n\n" if buffer else "") + f"Error generating meal plan: {str(e)}"
@@ -0,0 +1,225 @@
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+# Every metric name gets this prefix in the exported text
+PREFIX = 'nutriscan_'
+# Histogram bucket upper bounds in seconds, covering fast in-process steps up to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+class Counter:
+    """Monotonic count per label set"""
+    type = 'counter'
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_labels(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield f"{PREFIX}{self.name}_total{_format_labels(labels)} {value:g}"
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observations per label set"""
+    type = 'histogram'
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _labels(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels):
+        state = self._values.get(_labels(labels))
+        return state[2] if state else 0
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        for labels, (counts, total, count) in sorted(values.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield f"{PREFIX}{self.name}_bucket{_format_labels(labels, ('le', f'{bound:g}'))} {bucket_count}"
+            yield f"{PREFIX}{self.name}_bucket{_format_labels(labels, ('le', '+Inf'))} {count}"
+            yield f"{PREFIX}{self.name}_sum{_format_labels(labels)} {total:.6f}"
+            yield f"{PREFIX}{self.name}_count{_format_labels(labels)} {count}"
+
+class Registry:
+    """Named metrics of this process"""
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, description, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, description, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.type}")
+            return metric
+
+    def counter(self, name, description='') -> Counter:
+        return self._get(Counter, name, description)
+
+    def histogram(self, name, description='', buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, description, buckets=buckets)
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            exported = PREFIX + metric.name + ('_total' if metric.type == 'counter' else '')
+            lines.append(f"# HELP {exported} {metric.description}")
+            lines.append(f"# TYPE {exported} {metric.type}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self._metrics.clear()
+
+REGISTRY = Registry()
+
+def counter(name, description='') -> Counter:
+    """Get or create a counter in the process-wide registry"""
+    return REGISTRY.counter(name, description)
+
+def histogram(name, description='', buckets=DEFAULT_BUCKETS) -> Histogram:
+    """Get or create a histogram in the process-wide registry"""
+    return REGISTRY.histogram(name, description, buckets)
+
+def _span_metrics():
+    return (histogram('span_duration_seconds', 'Duration of instrumented steps'),
+            counter('span_errors', 'Instrumented steps that raised an exception'))
+
+@contextmanager
+def span(name, **labels):
+    """
+    Time a block of code as the step `name`
+
+    The duration is recorded in the span_duration_seconds histogram whether or not the
+    block raises; exceptions are also counted in span_errors and re-raised.
+    """
+    durations, errors = _span_metrics()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        errors.inc(span=name, **labels)
+        raise
+    finally:
+        durations.observe(time.perf_counter() - start, span=name, **labels)
+
+def timed(name=None):
+    """Decorator recording each call of a function as a span (default name: the function name)"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def write_textfile(path):
+    """Write the current metrics to `path` atomically (e.g. for the node_exporter textfile collector)"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(REGISTRY.render())
+    os.replace(temp_path, path)
+
+def start_http_server(port, addr='127.0.0.1'):
+    """Serve the metrics at http://addr:port/metrics from a background thread"""
+    # Imported here as http.server is slow to import and most processes never serve metrics
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = REGISTRY.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes would otherwise flood the app log
+
+    server = ThreadingHTTPServer((addr, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+_started = False
+_started_lock = threading.Lock()
+
+def start_from_env():
+    """
+    Start the exporters configured in the environment, once per process
+
+    METRICS_PORT serves /metrics on that port (bound to METRICS_ADDR, default 127.0.0.1),
+    and METRICS_FILE is rewritten every METRICS_INTERVAL seconds (default 15). Safe to
+    call on every Streamlit rerun.
+    """
+    global _started
+    with _started_lock:
+        if _started:
+            return
+        _started = True
+    port = os.getenv("METRICS_PORT")
+    path = os.getenv("METRICS_FILE")
+    interval = float(os.getenv("METRICS_INTERVAL", 15))
+    if port:
+        start_http_server(int(port), os.getenv("METRICS_ADDR", '127.0.0.1'))
+    if path:
+        def write_periodically():
+            while True:
+                time.sleep(interval)
+                write_textfile(path)
+        threading.Thread(target=write_periodically, name="metrics-file", daemon=True).start()
@@ -1,5 +1,22 @@
 import pandas as pd
-from typing import Dict, Tuple
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from metrics import timed
+
+# Status thresholds as percentages of the reference value, in ascending order.
+# A percentage above a threshold moves up one status level; a percentage equal to it
+# only does so where STATUS_BINS_INCLUSIVE is True (so 90% is Adequate but 150% is not High).
+STATUS_BINS = np.array([70.0, 90.0, 150.0, 200.0])
+STATUS_BINS_INCLUSIVE = np.array([True, True, False, False])
+# Status labels and colour codes for each level, from lowest to highest
+STATUS_LABELS = np.array(['Deficient', 'Borderline', 'Adequate', 'High', 'Excess'])
+STATUS_COLORS = np.array(['red', 'yellow', 'green', 'orange', 'purple'])
+# STATUS_BINS as Python floats for get_status, which compares one percentage at a time
+_BORDERLINE_FROM, _ADEQUATE_FROM, _HIGH_ABOVE, _EXCESS_ABOVE = STATUS_BINS.tolist()
+# Statuses that get food recommendations
+RECOMMENDATION_STATUSES = ('Deficient', 'High', 'Excess')
+# Differences from the reference up to this fraction of it get no recommendations
+RECOMMENDATION_TOLERANCE = 0.1
 
 def calculate_percentage(intake: float, reference: float) -> float:
     """
@@ -30,17 +47,37 @@ def get_status(percentage: float) -> Tuple[str, str]:
         - Borderline (70-90%): yellow
         - Deficient (<70%): red
     """
-    if percentage > 200:  # More than double the recommended value
+    # Plain float comparisons; use get_status_codes for many percentages at once
+    if percentage > _EXCESS_ABOVE:
         return "Excess", "purple"
-    elif percentage > 150:  # 50% more than recommended
+    elif percentage > _HIGH_ABOVE:
         return "High", "orange"
-    elif percentage >= 90:
+    elif percentage >= _ADEQUATE_FROM:
         return "Adequate", "green"
-    elif percentage >= 70:
+    elif percentage >= _BORDERLINE_FROM:
         return "Borderline", "yellow"
     else:
         return "Deficient", "red"
 
+def get_status_codes(percentages, bins=STATUS_BINS, inclusive=STATUS_BINS_INCLUSIVE) -> np.ndarray:
+    """
+    Vectorized version of get_status returning status levels instead of labels
+    
+    Args:
+        percentages: Array of percentages of intake relative to reference values (any shape)
+        bins: Ascending status thresholds
+        inclusive: Whether a percentage equal to each threshold belongs to the level above it
+    
+    Returns:
+        np.ndarray: Status level per percentage (index into STATUS_LABELS and STATUS_COLORS),
+        -1 where the percentage is missing
+    """
+    percentages = np.asarray(percentages, dtype=np.float64)
+    expanded = percentages[..., np.newaxis]
+    levels = ((expanded > bins) | (np.asarray(inclusive) & (expanded == bins))).sum(axis=-1)
+    return np.where(np.isnan(percentages), -1, levels).astype(np.int8)
+
+@timed()
 def calculate_results(intakes, reference_values):
     """
     Calculate analysis results for all nutrients
@@ -67,6 +104,185 @@ def calculate_results(intakes, reference_values):
             })
     return pd.DataFrame(results)
 
+class AnalysisState:
+    """
+    Analysis results that are updated in place when intakes change
+    
+    Only the rows of nutrients whose intake changed are recomputed. Each consumer of the
+    results (e.g. the chart or the recommendations) takes the positions of the rows that
+    changed since it last looked, so it can patch its own output instead of rebuilding it.
+    
+    Attributes:
+        reference_values: Reference values the results are computed against
+        intakes: Current intakes of the nutrients that have a reference value
+        results: DataFrame as returned by calculate_results, modified in place
+    """
+    def __init__(self, reference_values):
+        self.reference_values = dict(reference_values)
+        self.intakes = {}
+        self.results = calculate_results({}, self.reference_values)
+        self._positions = {}
+        # Consumer -> positions changed since it last took its changes, None if all of them
+        self._pending = {}
+        self._recommendations = {}
+        self._recommendation_args = None
+    
+    def update(self, intakes) -> List[str]:
+        """
+        Apply new intakes
+        
+        Args:
+            intakes: Dictionary of nutrient intakes
+        
+        Returns:
+            List[str]: Nutrients whose results changed
+        """
+        intakes = {nutrient: float(intake) for nutrient, intake in intakes.items() if nutrient in self.reference_values}
+        if list(intakes) != list(self.intakes):
+            # Different nutrients: rebuild everything
+            self.results = calculate_results(intakes, self.reference_values)
+            self._positions = {nutrient: i for i, nutrient in enumerate(self.results['Nutrient'])}
+            self._pending = {consumer: None for consumer in self._pending}
+            self.intakes = intakes
+            return list(intakes)
+        
+        changed = [nutrient for nutrient, intake in intakes.items() if intake != self.intakes[nutrient]]
+        self.intakes = intakes
+        if not changed:
+            return []
+        rows = [self._positions[nutrient] for nutrient in changed]
+        values = np.array([intakes[nutrient] for nutrient in changed])
+        reference = np.array([self.reference_values[nutrient] for nutrient in changed], dtype=np.float64)
+        percentages = values / reference * 100
+        codes = get_status_codes(percentages)
+        columns = [self.results.columns.get_loc(column) for column in ('Intake', 'Percentage', 'Status', 'Color')]
+        for column, column_values in zip(columns, (values, percentages, STATUS_LABELS[codes], STATUS_COLORS[codes])):
+            self.results.iloc[rows, column] = column_values
+        for consumer, pending in self._pending.items():
+            if pending is not None:
+                pending.update(rows)
+        return changed
+    
+    def take_changes(self, consumer: str) -> Optional[List[int]]:
+        """
+        Get the positions of the result rows changed since `consumer` last called this
+        
+        Returns:
+            List[int]: Changed row positions, or None if the consumer must rebuild from all
+            rows (on its first call and after the set of nutrients changed)
+        """
+        pending = self._pending.get(consumer)
+        self._pending[consumer] = set()
+        return sorted(pending) if pending is not None else None
+    
+    def recommendations(self, food_index, top_k=None, statuses=RECOMMENDATION_STATUSES) -> Dict[int, Dict]:
+        """
+        Ranked food recommendations (see FoodIndex.recommend_profile), recomputed only for changed rows
+        
+        Returns:
+            Dict: Row position in `results` -> food -> (amount, unit, content, action, energy)
+        """
+        changes = self.take_changes('recommendations')
+        if changes is None or self._recommendation_args != (id(food_index), top_k, statuses):
+            self._recommendation_args = (id(food_index), top_k, statuses)
+            self._recommendations = {}
+            rows = None
+        else:
+            rows = changes
+            for row in changes:
+                self._recommendations.pop(row, None)
+        if rows is None or rows:
+            self._recommendations.update(food_index.recommend_profile(self.results, top_k=top_k,
+                                                                      statuses=statuses, rows=rows))
+        return self._recommendations
+
+class BatchResults:
+    """
+    Analysis results for many intake profiles at once
+    
+    Attributes:
+        profiles: Profile labels (one per row)
+        nutrients: Nutrient names (one per column)
+        intakes: Intake matrix (profiles x nutrients), NaN where a nutrient is missing
+        reference: Reference value per nutrient
+        percentages: Percentage of reference matrix, NaN where the intake is missing
+        status_codes: Status level matrix (see get_status_codes), -1 where the intake is missing
+    """
+    def __init__(self, profiles, nutrients, intakes, reference, percentages, status_codes):
+        self.profiles = profiles
+        self.nutrients = nutrients
+        self.intakes = intakes
+        self.reference = reference
+        self.percentages = percentages
+        self.status_codes = status_codes
+
+    @property
+    def statuses(self) -> np.ndarray:
+        """Status label matrix, empty strings where the intake is missing"""
+        return np.where(self.status_codes >= 0, STATUS_LABELS[self.status_codes], '')
+
+    @property
+    def colors(self) -> np.ndarray:
+        """Colour code matrix, empty strings where the intake is missing"""
+        return np.where(self.status_codes >= 0, STATUS_COLORS[self.status_codes], '')
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Convert to the long format returned by calculate_results, with an extra 'Profile' column
+        
+        Returns:
+            pandas.DataFrame: One row per profile and available nutrient
+        """
+        rows, cols = np.nonzero(self.status_codes >= 0)
+        codes = self.status_codes[rows, cols]
+        return pd.DataFrame({
+            'Profile': np.asarray(self.profiles)[rows],
+            'Nutrient': np.asarray(self.nutrients)[cols],
+            'Intake': self.intakes[rows, cols],
+            'Reference': self.reference[cols],
+            'Percentage': self.percentages[rows, cols],
+            'Status': STATUS_LABELS[codes],
+            'Color': STATUS_COLORS[codes]
+        })
+
+def calculate_batch_results(intakes, reference_values, nutrients=None,
+                            bins=STATUS_BINS, inclusive=STATUS_BINS_INCLUSIVE) -> BatchResults:
+    """
+    Calculate analysis results for many intake profiles in a few array operations
+    
+    Args:
+        intakes: DataFrame with one row per profile and one column per nutrient, or a
+            2D array (profiles x nutrients) together with `nutrients`
+        reference_values: Dictionary of reference values for each nutrient
+        nutrients: Column names when `intakes` is an array
+        bins: Ascending status thresholds (percent of reference)
+        inclusive: Whether a percentage equal to each threshold belongs to the level above it
+    
+    Returns:
+        BatchResults: Percentages, status codes and colours for every profile and nutrient.
+        Nutrients without a reference value are dropped, as in calculate_results.
+    """
+    if isinstance(intakes, pd.DataFrame):
+        profiles = intakes.index.to_numpy()
+        nutrients = list(intakes.columns)
+        matrix = intakes.to_numpy(dtype=np.float64, na_value=np.nan)
+    else:
+        matrix = np.atleast_2d(np.asarray(intakes, dtype=np.float64))
+        profiles = np.arange(matrix.shape[0])
+        if nutrients is None:
+            raise ValueError("nutrients must be given when intakes is an array")
+        nutrients = list(nutrients)
+
+    keep = [i for i, nutrient in enumerate(nutrients) if nutrient in reference_values]
+    nutrients = [nutrients[i] for i in keep]
+    matrix = matrix[:, keep]
+    reference = np.array([reference_values[nutrient] for nutrient in nutrients], dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentages = matrix / reference * 100
+    status_codes = get_status_codes(percentages, bins, inclusive)
+    return BatchResults(profiles, nutrients, matrix, reference, percentages, status_codes)
+
 def get_food_recommendations(nutrient: str, current_intake: float, reference: float, nutrient_sources: Dict) -> Dict:
     """
     Generate food recommendations based on nutrient analysis
@@ -87,17 +303,210 @@ def get_food_recommendations(nutrient: str, current_intake: float, reference: fl
     """
     difference = reference - current_intake
     # Only make recommendations if difference is significant (>10% of reference)
-    if abs(difference) <= reference * 0.1:
+    if abs(difference) <= reference * RECOMMENDATION_TOLERANCE:
         return {}
     
     recommendations = {}
     if nutrient in nutrient_sources:
+        # Richest sources first, i.e. the fewest grams needed
+        foods = sorted(nutrient_sources[nutrient].items(), key=lambda item: -item[1][0])
         if difference > 0:  # Deficit - need to increase intake
-            for food, (content, unit) in nutrient_sources[nutrient].items():
+            for food, (content, unit) in foods:
                 amount_needed = (difference / content) * 100  # Convert to grams
                 recommendations[food] = (round(amount_needed, 1), unit, content, "increase")
         else:  # Excess - need to reduce intake
-            for food, (content, unit) in nutrient_sources[nutrient].items():
+            for food, (content, unit) in foods:
                 amount_to_reduce = (abs(difference) / content) * 100  # Convert to grams
                 recommendations[food] = (round(amount_to_reduce, 1), unit, content, "reduce")
     return recommendations
+
+class FoodIndex:
+    """
+    Array-backed food sources, pre-ranked per nutrient, for computing the recommendations
+    of many nutrients (and profiles) in one vectorized pass
+    
+    The (nutrient, food) pairs are stored in flat arrays with one contiguous segment per
+    nutrient, sorted by content in descending order (fewest grams needed first). The same
+    rankings are also kept as per-nutrient lists, which recommend_profile walks for a single
+    analysis, where the vectorized pass costs more than it saves.
+    
+    Attributes:
+        foods: Food names; food ids index into this array
+        nutrients: Nutrient names, in segment order
+        offsets: Start of each nutrient's segment in the flat arrays, plus the total length
+        food_ids: Food id of each pair
+        contents: Nutrient content per 100g of each pair
+        units: Unit of each pair
+        energy_density: Energy per 100g of the food of each pair, NaN if unknown
+    """
+    RANKINGS = ('grams', 'energy')
+    
+    def __init__(self, foods, nutrients, offsets, food_ids, contents, units, energy_density):
+        self.foods = foods
+        self.nutrients = nutrients
+        self.offsets = offsets
+        self.food_ids = food_ids
+        self.contents = contents
+        self.units = units
+        self.energy_density = energy_density
+        self._positions = {nutrient: i for i, nutrient in enumerate(nutrients)}
+        # Position of each pair in its segment when ranked by energy per unit of nutrient,
+        # foods without energy data last; ties keep the grams ranking
+        segments = np.repeat(np.arange(len(nutrients)), np.diff(offsets))
+        energy_per_unit = np.where(np.isnan(energy_density), np.inf, energy_density / contents)
+        self._orders = {
+            'grams': np.arange(len(contents)),
+            'energy': np.lexsort((np.arange(len(contents)), energy_per_unit, segments)),
+        }
+        # Ranking -> nutrient -> [(food, content, unit, energy density)], best ranked first
+        self._ranked = {
+            rank_by: {nutrient: [(str(foods[food_ids[pair]]), float(contents[pair]), str(units[pair]),
+                                  float(energy_density[pair])) for pair in order[offsets[i]:offsets[i + 1]]]
+                      for i, nutrient in enumerate(nutrients)}
+            for rank_by, order in self._orders.items()
+        }
+    
+    def sources(self, nutrient):
+        """
+        Returns:
+            Dict: Food sources of a nutrient as food -> (content, unit), richest first
+        """
+        i = self._positions.get(nutrient)
+        if i is None:
+            return {}
+        segment = slice(self.offsets[i], self.offsets[i + 1])
+        return {self.foods[food_id]: (float(content), unit) for food_id, content, unit
+                in zip(self.food_ids[segment], self.contents[segment], self.units[segment])}
+    
+    def recommend_profile(self, results, top_k=None, rank_by='grams', statuses=None, rows=None) -> Dict[int, Dict]:
+        """
+        Compute ranked food recommendations for the off-target rows of a single analysis
+        
+        Walks the ranked sources of each row like get_food_recommendations, which is faster
+        than recommend for the few dozen rows of one profile; use recommend for batches.
+        
+        Args:
+            results: DataFrame with Nutrient, Intake and Reference columns (and Status if
+                `statuses` is given), e.g. from calculate_results
+            top_k: Keep at most this many foods per row
+            rank_by: 'grams' or 'energy', as in recommend
+            statuses: Only recommend for rows with one of these statuses
+            rows: Only consider these row positions (default: all rows)
+        
+        Returns:
+            Dict: Row position in `results` -> food -> (amount, unit, content, action, energy),
+            best ranked first; rows without recommendations are left out
+        """
+        if rank_by not in self.RANKINGS:
+            raise ValueError(f"Unknown ranking: {rank_by}")
+        ranked = self._ranked[rank_by]
+        nutrients = results['Nutrient'].tolist()
+        intakes = results['Intake'].tolist()
+        references = results['Reference'].tolist()
+        row_statuses = results['Status'].tolist() if statuses is not None else None
+        recommendations = {}
+        for row in (range(len(nutrients)) if rows is None else rows):
+            sources = ranked.get(nutrients[row])
+            if sources is None or (statuses is not None and row_statuses[row] not in statuses):
+                continue
+            difference = references[row] - intakes[row]
+            # Written so that a missing (NaN) intake gets no recommendations either
+            if not abs(difference) > references[row] * RECOMMENDATION_TOLERANCE:
+                continue
+            action = 'increase' if difference > 0 else 'reduce'
+            foods = {}
+            for food, content, unit, energy_density in sources[:top_k]:
+                amount = abs(difference) / content * 100
+                foods[food] = (round(amount, 1), unit, content, action, round(amount * energy_density / 100, 1))
+            if foods:
+                recommendations[row] = foods
+        return recommendations
+    
+    def recommend(self, results, top_k=None, rank_by='grams', statuses=None) -> pd.DataFrame:
+        """
+        Compute ranked food recommendations for every off-target row of many analyses
+        
+        Args:
+            results: DataFrame with Nutrient, Intake and Reference columns (and Status if
+                `statuses` is given), e.g. from calculate_results or BatchResults.to_frame
+            top_k: Keep at most this many foods per row
+            rank_by: 'grams' (least food to add or remove first) or 'energy' (least energy
+                added or removed first, foods without energy data last)
+            statuses: Only recommend for rows with one of these statuses
+        
+        Returns:
+            pandas.DataFrame: One row per recommendation with the columns Row (position in
+            `results`), Nutrient, Rank (from 1), Food, Amount (grams), Unit, Content (per 100g),
+            Action ('increase' or 'reduce') and Energy (energy of the amount, NaN if unknown),
+            ordered by row and rank. Rows within RECOMMENDATION_TOLERANCE of the reference
+            get no recommendations, as in get_food_recommendations.
+        """
+        if rank_by not in self.RANKINGS:
+            raise ValueError(f"Unknown ranking: {rank_by}")
+        positions = np.array([self._positions.get(nutrient, -1) for nutrient in results['Nutrient']], dtype=np.int64)
+        intakes = results['Intake'].to_numpy(dtype=np.float64)
+        reference = results['Reference'].to_numpy(dtype=np.float64)
+        difference = reference - intakes
+        selected = (positions >= 0) & (np.abs(difference) > reference * RECOMMENDATION_TOLERANCE)
+        if statuses is not None:
+            selected &= results['Status'].isin(statuses).to_numpy()
+        rows = np.flatnonzero(selected)
+        segments = positions[rows]
+        
+        # Expand every selected row into the first `top_k` pairs of its nutrient's segment
+        starts = self.offsets[segments]
+        lengths = self.offsets[segments + 1] - starts
+        if top_k is not None:
+            lengths = np.minimum(lengths, top_k)
+        row_of = np.repeat(np.arange(len(rows)), lengths)
+        ranks = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        pairs = self._orders[rank_by][starts[row_of] + ranks]
+        
+        gap = difference[rows][row_of]
+        amounts = np.abs(gap) / self.contents[pairs] * 100
+        return pd.DataFrame({
+            'Row': rows[row_of],
+            'Nutrient': np.asarray(self.nutrients, dtype=object)[segments[row_of]],
+            'Rank': ranks + 1,
+            'Food': self.foods[self.food_ids[pairs]],
+            'Amount': amounts.round(1),
+            'Unit': self.units[pairs],
+            'Content': self.contents[pairs],
+            'Action': np.where(gap > 0, 'increase', 'reduce'),
+            'Energy': (amounts * self.energy_density[pairs] / 100).round(1),
+        })
+
+def build_food_index(nutrient_sources, energy_nutrient='Energy') -> FoodIndex:
+    """
+    Build the food ranking index from the nutrient sources
+    
+    Args:
+        nutrient_sources: Dictionary of nutrient -> food -> (content per 100g, unit)
+        energy_nutrient: Nutrient giving the energy content of foods, for energy costs
+    
+    Returns:
+        FoodIndex: Flat per-nutrient arrays ranked by content; sources without a positive
+        content are left out
+    """
+    food_ids = {}
+    nutrients, offsets, pair_foods, contents, units = [], [0], [], [], []
+    for nutrient, foods in nutrient_sources.items():
+        pairs = sorted(((content, food, unit) for food, (content, unit) in foods.items() if content and content > 0),
+                       key=lambda pair: -pair[0])
+        if not pairs:
+            continue
+        nutrients.append(nutrient)
+        for content, food, unit in pairs:
+            pair_foods.append(food_ids.setdefault(food, len(food_ids)))
+            contents.append(content)
+            units.append(unit)
+        offsets.append(len(contents))
+    
+    energy = np.full(len(food_ids), np.nan)
+    for food, (content, _) in nutrient_sources.get(energy_nutrient, {}).items():
+        if food in food_ids:
+            energy[food_ids[food]] = content
+    pair_foods = np.array(pair_foods, dtype=np.int64)
+    return FoodIndex(np.array(list(food_ids), dtype=object), nutrients, np.array(offsets, dtype=np.int64),
+                     pair_foods, np.array(contents, dtype=np.float64), np.array(units, dtype=object),
+                     energy[pair_foods])
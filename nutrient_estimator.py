@@ -0,0 +1,110 @@
+from data_store import get_reference_data, get_nutrient_registry
+from llm_gateway import get_gateway, PRIORITY_NORMAL
+from llm_cache import get_response_cache, make_key  # Cached LLM responses
+from meal_estimator import estimate_meal  # Item-level meal estimation
+from response_parser import ResponseParser, format_instructions  # LLM output parsing
+import metrics
+
+reference_values, _ = get_reference_data()
+nutrient_registry = get_nutrient_registry()
+
+# LLM model used for estimates (calls go through the shared gateway in llm_gateway)
+MODEL_NAME = 'llama-3.3-70b-versatile'#'llama-3.2-90b-text-preview'
+TEMPERATURE = 0.0  # Set to 0 for deterministic outputs
+# Completion tokens expected for an estimate, charged to the shared token budget
+ESTIMATE_TOKENS = 400
+
+# Parser for nutrient estimates, converting values to the units of Indicators_brief.csv
+REFERENCE_UNITS = nutrient_registry.units
+response_parser = ResponseParser(REFERENCE_UNITS)
+
+# Define system message template for the LLM
+SYSTEM_PROMPT = f"""You are given a list of food items or meals and you need to estimate 
+                                                           the total nutrient content of the diet. The nutrients that you have to 
+                                                           consider are: {', '.join(reference_values.keys())}.
+                                                           {format_instructions(REFERENCE_UNITS)}
+                                                           Only provide estimates for the nutrients listed above.
+                                                           You do not comment on the results.
+                                                           If you don't recognize a food item, make an estimation based on the context.
+                                                           """
+
+# System prompt for estimating a single food item, used by the item-level estimator
+FOOD_ITEM_PROMPT = f"""You are given the name of a single food item. Estimate its nutrient content per 100 g.
+The nutrients that you have to consider are: {', '.join(reference_values.keys())}.
+{format_instructions(REFERENCE_UNITS, per="100 g")}
+You do not comment on the results."""
+
+# Count of responses from which no nutrient could be read
+parse_failures = metrics.counter('parse_failures', 'LLM responses from which no nutrient value could be parsed')
+
+# Function to parse LLM response into structured data
+@metrics.timed()
+def parse_response(response):
+    """
+    Parse an LLM nutrient estimate
+    
+    Returns:
+        ParseResult: Values in reference units and the nutrients that were missing or unreadable
+    """
+    parsed = response_parser.parse(response)
+    if not parsed.values:
+        parse_failures.inc()
+    return parsed
+
+
+# Function to generate LLM response
+@metrics.timed()
+def generate_response(system_prompt, text, on_queue=None):
+    messages = [('system', system_prompt), ('user', text)]
+    # Estimates are short, so they queue ahead of meal plans when the token budget is spent
+    return get_gateway().complete(messages, model=MODEL_NAME, temperature=TEMPERATURE, priority=PRIORITY_NORMAL,
+                                  expected_tokens=ESTIMATE_TOKENS, on_queue=on_queue)
+
+# Function to estimate the per-100g nutrient content of a single food item, returning the
+# raw response and the parsed values
+def lookup_food_item(food, on_queue=None):
+    response = generate_response(FOOD_ITEM_PROMPT, food, on_queue)
+    return response, parse_response(response).values
+
+# Function to estimate the nutrient content of a diet description, reusing cached responses
+def estimate_nutrients(text, on_queue=None):
+    """
+    Estimate nutrient intakes for a free-text diet description
+    
+    The description is first split into food items that are resolved from the local food
+    table or from memoized per-item estimates, so most meals need no LLM call. If it cannot
+    be decomposed, the whole meal is sent to the LLM. Whole-meal responses are cached on disk
+    keyed on the normalized text, model and system prompt; since the model runs at
+    temperature 0, repeated meals are answered from the cache. Only responses that parse
+    successfully are cached.
+    
+    Args:
+        text: Diet description
+        on_queue: Called with the queue position while an LLM call waits for token budget
+    
+    Returns:
+        Tuple[Optional[str], Dict, List[str]]: Raw LLM response (the per-item responses for
+        item-level estimates, None if no call was made), parsed intakes (empty if parsing
+        failed) and the nutrients the estimate did not cover
+    """
+    responses = {}
+
+    def lookup(food):
+        responses[food], values = lookup_food_item(food, on_queue)
+        return values
+
+    meal = estimate_meal(text, lookup)
+    if meal is not None:
+        return "\n\n".join(responses.values()) or None, meal.intakes, meal.missing
+    
+    response_cache = get_response_cache()
+    key = make_key(text, MODEL_NAME, SYSTEM_PROMPT)
+    response = response_cache.get(key)
+    if response is None:
+        response = generate_response(SYSTEM_PROMPT, text, on_queue)
+        parsed = parse_response(response)
+        if parsed.values:
+            response_cache.set(key, response)
+    else:
+        parsed = parse_response(response)
+    return response, parsed.values, parsed.incomplete
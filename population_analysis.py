@@ -0,0 +1,105 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from nutrient_analysis import STATUS_LABELS, calculate_batch_results
+
+# Percentiles of the percentage-of-reference distribution reported per nutrient
+PERCENTILES = (10, 25, 50, 75, 90)
+
+class PopulationSummary:
+    """
+    Aggregates over every FAOSTAT (country, subpopulation) profile
+
+    Profiles are weighted equally; FAOSTAT does not give subpopulation sizes.
+
+    Attributes:
+        percentages: Percentage of reference per profile (rows, indexed by country and
+            subpopulation) and nutrient (columns), NaN where a nutrient is missing
+        distribution: Per nutrient: number of profiles, mean and PERCENTILES of the percentages
+        prevalence: Per nutrient: share of profiles in each status (columns STATUS_LABELS)
+        country_matrix: Median percentage per country (rows) and nutrient (columns)
+        country_ranking: Per country: number of profiles, share of deficient and excessive
+            nutrient values, median percentage capped at 100 (adequacy score) and rank, from
+            the fewest deficiencies to the most
+    """
+    def __init__(self, percentages, distribution, prevalence, country_matrix, country_ranking):
+        self.percentages = percentages
+        self.distribution = distribution
+        self.prevalence = prevalence
+        self.country_matrix = country_matrix
+        self.country_ranking = country_ranking
+
+    def to_csv(self, output_dir):
+        """
+        Write each aggregate to a CSV file in `output_dir`
+
+        Returns:
+            List[str]: Paths of the written files
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        paths = []
+        for name in ('distribution', 'prevalence', 'country_matrix', 'country_ranking'):
+            path = os.path.join(output_dir, f"{name}.csv")
+            getattr(self, name).to_csv(path)
+            paths.append(path)
+        return paths
+
+def build_population_summary(faostat_index, reference_values) -> PopulationSummary:
+    """
+    Analyse all FAOSTAT profiles at once
+
+    Args:
+        faostat_index: FaostatIndex with the profiles
+        reference_values: Dictionary of reference values
+
+    Returns:
+        PopulationSummary: Distributions, status prevalence and country rankings
+    """
+    intakes = pd.DataFrame.from_dict(faostat_index.profiles, orient='index')
+    nutrients = [nutrient for nutrient in reference_values if nutrient in intakes.columns]
+    intakes = intakes.reindex(columns=nutrients)
+    intakes.index = pd.MultiIndex.from_tuples(intakes.index, names=['Country', 'Subpopulation'])
+    batch = calculate_batch_results(intakes, reference_values)
+    percentages = pd.DataFrame(batch.percentages, index=intakes.index, columns=batch.nutrients)
+    codes = batch.status_codes
+    present = codes >= 0
+
+    with np.errstate(all='ignore'):
+        quantiles = np.nanpercentile(batch.percentages, PERCENTILES, axis=0) if len(percentages) else \
+            np.full((len(PERCENTILES), len(nutrients)), np.nan)
+        distribution = pd.DataFrame(quantiles.T, index=batch.nutrients, columns=[f"P{p}" for p in PERCENTILES])
+        distribution.insert(0, 'Mean', np.nanmean(batch.percentages, axis=0))
+    distribution.insert(0, 'Profiles', present.sum(axis=0))
+
+    # Profiles per status level and nutrient, divided by the profiles that have the nutrient
+    counts = (codes[..., np.newaxis] == np.arange(len(STATUS_LABELS))).sum(axis=0)
+    with np.errstate(all='ignore'):
+        prevalence = pd.DataFrame(counts / present.sum(axis=0)[:, np.newaxis], index=batch.nutrients,
+                                  columns=STATUS_LABELS)
+
+    country_matrix = percentages.groupby(level='Country', sort=False).median()
+
+    deficient = pd.DataFrame(np.where(present, codes == 0, np.nan), index=intakes.index)
+    excess = pd.DataFrame(np.where(present, codes >= 3, np.nan), index=intakes.index)
+    def by_country(frame):
+        return frame.groupby(level='Country', sort=False)
+
+    country_ranking = pd.DataFrame({
+        'Profiles': by_country(percentages).size(),
+        'Deficient share': by_country(deficient).sum().sum(axis=1) / by_country(deficient).count().sum(axis=1),
+        'Excess share': by_country(excess).sum().sum(axis=1) / by_country(excess).count().sum(axis=1),
+        'Adequacy score': by_country(percentages.clip(upper=100)).median().median(axis=1),
+    })
+    country_ranking = country_ranking.sort_values(['Deficient share', 'Adequacy score'], ascending=[True, False])
+    country_ranking['Rank'] = np.arange(1, len(country_ranking) + 1)
+
+    return PopulationSummary(percentages, distribution, prevalence, country_matrix, country_ranking)
+
+if __name__ == "__main__":
+    from data_store import get_population_summary
+    parser = argparse.ArgumentParser(description="Export population analytics over all FAOSTAT profiles")
+    parser.add_argument("--output", default="population", help="Directory for the CSV files")
+    args = parser.parse_args()
+    for path in get_population_summary().to_csv(args.output):
+        print(f"Wrote {path}")
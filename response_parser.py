@@ -0,0 +1,174 @@
+import json
+import re
+from typing import Dict, List, Optional
+
+# Conversion factors to a common base per unit family (kcal for energy, g for mass)
+UNIT_FACTORS = {
+    'kcal': ('energy', 1.0), 'cal': ('energy', 1.0), 'calorie': ('energy', 1.0), 'kj': ('energy', 1 / 4.184),
+    'g': ('mass', 1.0), 'gram': ('mass', 1.0), 'mg': ('mass', 1e-3), 'milligram': ('mass', 1e-3),
+    'μg': ('mass', 1e-6), 'µg': ('mass', 1e-6), 'ug': ('mass', 1e-6), 'mcg': ('mass', 1e-6),
+    'microgram': ('mass', 1e-6),
+}
+
+# "Nutrient: value unit" entries separated by semicolons, commas between entries or new lines,
+# optionally quoted as in JSON
+_ENTRY = re.compile(
+    r'["\']?(?P<name>[^\W\d_][^:;\n"\'{}=]*?)["\']?[ \t]*[:=][ \t]*["\']?'
+    r'(?P<value>[^:;\n"\'{}]*?)["\']?[ \t]*(?=[;\n,}][ \t]*["\']?[^\W\d_]|[;\n}]|$)')
+_QUANTITY = re.compile(r'(?P<number>\d+(?:[.,]\d+)*)\s*(?P<unit>kcal|kj|cal(?:orie)?s?|mg|milligrams?|[μµu]g|mcg|'
+                       r'micrograms?|g(?:rams?)?)?\b', re.IGNORECASE)
+_THOUSANDS = re.compile(r'^[1-9]\d{0,2}(?:,\d{3})+(?:\.\d+)?$')
+_UNKNOWN = re.compile(r'\b(?:unknown|n/?a|not available)\b', re.IGNORECASE)
+_PARENTHESES = re.compile(r'\s*\([^)]*\)')
+_WHITESPACE = re.compile(r'\s+')
+_JSON_OBJECT = re.compile(r'\{.*\}', re.DOTALL)
+
+class ParseResult:
+    """
+    Nutrient values extracted from an LLM response
+
+    Attributes:
+        values: Dictionary mapping nutrient names to values in their reference units
+        missing: Expected nutrients that were not in the response at all
+        unknown: Nutrients the model explicitly reported as unknown
+        invalid: Nutrients whose value could not be read as a quantity
+    """
+    def __init__(self, values, missing, unknown, invalid):
+        self.values = values
+        self.missing = missing
+        self.unknown = unknown
+        self.invalid = invalid
+
+    @property
+    def incomplete(self) -> List[str]:
+        """All expected nutrients without a value"""
+        return self.missing + self.unknown + self.invalid
+
+def _normalize_name(name):
+    return _WHITESPACE.sub(' ', name).strip().casefold()
+
+def _unit_key(unit):
+    unit = unit.strip().lower().split('/')[0]
+    if unit.endswith('s') and unit not in UNIT_FACTORS:
+        unit = unit[:-1]
+    if unit == 'calorie':
+        return 'kcal'  # Food "calories" are kilocalories
+    return unit
+
+def _to_number(text):
+    if _THOUSANDS.match(text):
+        return float(text.replace(',', ''))
+    return float(text.replace(',', '.'))
+
+class ResponseParser:
+    """
+    Single-pass, tolerant parser for nutrient estimates
+
+    Accepts a JSON object ({"Energy": 2100, "Iron": "12 mg", "Zinc": {"value": 8, "unit": "mg"}})
+    or "Nutrient: value unit;" entries spread over any number of lines, and converts values
+    to the reference unit of each nutrient.
+
+    Args:
+        reference_units: Dictionary mapping nutrient names to reference units (e.g. "mg/d")
+    """
+    def __init__(self, reference_units: Dict[str, str]):
+        self.nutrients = list(reference_units)
+        self.units = {nutrient: _unit_key(unit) for nutrient, unit in reference_units.items()}
+        self._names = {_normalize_name(nutrient): nutrient for nutrient in reference_units}
+        # Also accept names without their parenthetical qualifier when that is unambiguous
+        short_names = {}
+        for nutrient in reference_units:
+            short_names.setdefault(_normalize_name(_PARENTHESES.sub('', nutrient)), []).append(nutrient)
+        for short_name, nutrients in short_names.items():
+            if len(nutrients) == 1:
+                self._names.setdefault(short_name, nutrients[0])
+
+    def _match_name(self, name):
+        return self._names.get(_normalize_name(name))
+
+    def _convert(self, nutrient, number, unit):
+        target = self.units[nutrient]
+        if not unit:
+            return number
+        source = UNIT_FACTORS.get(_unit_key(unit))
+        destination = UNIT_FACTORS.get(target)
+        if source is None or destination is None or source[0] != destination[0]:
+            return number
+        return number * source[1] / destination[1]
+
+    def _read_value(self, nutrient, value, unit=None):
+        """Return a converted value, 'unknown' or None if it cannot be read"""
+        if value is None:
+            return 'unknown'
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, (int, float)):
+            return self._convert(nutrient, float(value), unit)
+        if isinstance(value, dict):
+            return self._read_value(nutrient, value.get('value', value.get('amount')), value.get('unit', unit))
+        if not isinstance(value, str):
+            return None
+        match = _QUANTITY.search(value)
+        if match is None:
+            return 'unknown' if _UNKNOWN.search(value) else None
+        return self._convert(nutrient, _to_number(match.group('number')), match.group('unit') or unit)
+
+    def _entries(self, response):
+        """Yield (name, value) pairs from a JSON object or from key-value text"""
+        match = _JSON_OBJECT.search(response)
+        if match:
+            try:
+                data = json.loads(match.group(0))
+            except ValueError:
+                data = None
+            if isinstance(data, dict):
+                # Accept a nested {"nutrients": {...}} wrapper
+                if len(data) == 1 and isinstance(next(iter(data.values())), dict) \
+                        and self._match_name(next(iter(data))) is None:
+                    data = next(iter(data.values()))
+                yield from data.items()
+                return
+        for entry in _ENTRY.finditer(response):
+            yield entry.group('name'), entry.group('value')
+
+    def parse(self, response: str) -> ParseResult:
+        """
+        Parse an LLM response
+
+        Args:
+            response: Raw response text
+
+        Returns:
+            ParseResult: Values found and the expected nutrients that were missing or unreadable
+        """
+        values, unknown, invalid = {}, [], []
+        for name, value in self._entries(response or ''):
+            nutrient = self._match_name(str(name))
+            if nutrient is None or nutrient in values:
+                continue
+            result = self._read_value(nutrient, value)
+            if result == 'unknown':
+                unknown.append(nutrient)
+            elif result is None:
+                invalid.append(nutrient)
+            else:
+                values[nutrient] = result
+                if nutrient in invalid:
+                    invalid.remove(nutrient)
+        seen = set(values) | set(unknown) | set(invalid)
+        missing = [nutrient for nutrient in self.nutrients if nutrient not in seen]
+        unknown = [nutrient for nutrient in unknown if nutrient not in values]
+        return ParseResult(values, missing, unknown, invalid)
+
+def format_instructions(reference_units: Dict[str, str], per: Optional[str] = None) -> str:
+    """
+    Describe the expected JSON response format for a system prompt
+
+    Args:
+        reference_units: Dictionary mapping nutrient names to reference units
+        per: Optional basis for the amounts, e.g. "100 g"
+    """
+    fields = ', '.join(f'"{nutrient}": <number in {unit.split("/")[0]}>' for nutrient, unit in reference_units.items())
+    basis = f" per {per}" if per else ""
+    return (f"Answer only with a JSON object giving the amount of each nutrient{basis} as a number in the unit shown, "
+            f"with exactly these keys: {{{fields}}}. Use null for nutrients you cannot estimate.")
@@ -0,0 +1,23 @@
+import os
+
+def env_setting(name, default):
+    """
+    Read a setting from the environment
+
+    Call this when the component using the setting is created rather than at import, so
+    that values main.py loads from .env after its imports are seen.
+
+    Args:
+        name: Environment variable holding the setting
+        default: Value used when the variable is unset or empty; the setting is converted
+            to its type (for booleans, '0', 'false', 'no' and 'off' are False)
+
+    Returns:
+        The setting, of the type of `default`
+    """
+    value = os.getenv(name, '').strip()
+    if not value:
+        return default
+    if isinstance(default, bool):
+        return value.lower() not in ('0', 'false', 'no', 'off')
+    return type(default)(value)
@@ -0,0 +1,102 @@
+import io
+import json
+import sys
+import types
+import pytest
+from api import MAX_TOP_K, create_app
+from data_store import get_reference_data
+
+@pytest.fixture(scope='module', autouse=True)
+def no_dotenv():
+    # create_app loads .env; keep a developer's .env out of the tests
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setitem(sys.modules, 'dotenv', types.SimpleNamespace(load_dotenv=lambda: None))
+        yield
+
+@pytest.fixture(scope='module')
+def app():
+    return create_app(enable_llm=False)
+
+def post(app, path, body):
+    payload = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+    environ = {'REQUEST_METHOD': 'POST', 'PATH_INFO': path, 'CONTENT_LENGTH': str(len(payload)),
+               'wsgi.input': io.BytesIO(payload)}
+    response = {}
+    body = b''.join(app(environ, lambda status, headers: response.update(status=int(status.split()[0]))))
+    return response['status'], json.loads(body)
+
+def get(app, path):
+    response = {}
+    body = b''.join(app({'REQUEST_METHOD': 'GET', 'PATH_INFO': path},
+                        lambda status, headers: response.update(status=int(status.split()[0]))))
+    return response['status'], body
+
+@pytest.fixture(scope='module')
+def intakes():
+    reference_values, _ = get_reference_data()
+    return {nutrient: reference * 0.5 for nutrient, reference in reference_values.items()}
+
+def test_analyze(app, intakes):
+    status, body = post(app, '/v1/recommendations', {'intakes': intakes, 'top_k': 2})
+    assert status == 200
+    assert body['recommendations'] and max(item['rank'] for item in body['recommendations']) == 2
+
+@pytest.mark.parametrize('top_k', [0, -1, MAX_TOP_K + 1])
+def test_top_k_out_of_range(app, intakes, top_k):
+    status, body = post(app, '/v1/recommendations', {'intakes': intakes, 'top_k': top_k})
+    assert status == 400 and 'top_k' in body['error']
+
+@pytest.mark.parametrize('value', [b'1e400', b'NaN', b'-Infinity', b'"ten"', b'true'])
+def test_non_finite_intakes(app, value):
+    status, body = post(app, '/v1/analyze', b'{"intakes": {"Protein": ' + value + b'}}')
+    assert status == 400 and 'Protein' in body['error']
+
+def test_missing_intake(app):
+    status, body = post(app, '/v1/analyze', {'intakes': {'Protein': None, 'Fat': 10}})
+    assert status == 200
+    assert [result['nutrient'] for result in body['results']] == ['Fat']
+
+def test_limits_read_when_the_app_is_created(monkeypatch, intakes):
+    monkeypatch.setenv('API_MAX_BATCH', '1')
+    status, body = post(create_app(), '/v1/analyze', {'profiles': [{'intakes': intakes}] * 2})
+    assert status == 413 and body['error'] == "At most 1 profiles per request"
+
+@pytest.mark.parametrize('profile', [{'country': ['France'], 'subpopulation': 'All'},
+                                     {'country': 'France', 'subpopulation': {'sex': 'F'}},
+                                     {'country': 'France'}])
+def test_country_and_subpopulation_must_be_strings(app, profile):
+    status, body = post(app, '/v1/analyze', profile)
+    assert status == 400
+
+def test_meal_plan_gateway_errors_map_to_status(monkeypatch, intakes):
+    import meal_planner
+    from llm_gateway import LLMOverloadedError
+
+    class Gateway:
+        def complete(self, messages, **kwargs):
+            raise LLMOverloadedError("Too many LLM calls waiting")
+
+    class Cache:
+        def get(self, analysis_results, country):
+            return None
+
+    monkeypatch.setattr(meal_planner, 'get_gateway', Gateway)
+    monkeypatch.setattr(meal_planner, 'get_meal_plan_cache', Cache)
+    status, body = post(create_app(enable_llm=True), '/v1/meal-plan', {'intakes': intakes, 'country': 'France'})
+    assert status == 503 and body['error'] == "Too many LLM calls waiting"
+
+def test_internal_errors_are_not_exposed(monkeypatch, app):
+    import api
+
+    def fail():
+        raise RuntimeError("/srv/data/nutrients.csv is unreadable")
+
+    monkeypatch.setattr(api, 'get_nutrient_registry', fail)
+    status, body = get(app, '/v1/nutrients')
+    assert status == 500 and json.loads(body) == {'error': "Internal error"}
+
+def test_metrics_only_when_enabled(app, monkeypatch):
+    assert get(app, '/metrics')[0] == 404
+    monkeypatch.setenv('API_METRICS', '1')
+    status, body = get(create_app(), '/metrics')
+    assert status == 200 and b'api_requests' in body
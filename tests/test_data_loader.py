@@ -0,0 +1,56 @@
+import multiprocessing
+import os
+import pandas as pd
+import pytest
+import data_loader
+
+@pytest.fixture
+def faostat_csv(tmp_path):
+    rows = [(f"Country{c} - Survey 2015", level, indicator, 'g', float(c * 10 + i))
+            for c in range(5) for level in ('National', 'Urban')
+            for i, indicator in enumerate(('Energy', 'Protein', 'Iron'))]
+    path = tmp_path / 'faostat.csv'
+    pd.DataFrame(rows, columns=['Survey', 'Geographic Level', 'Indicator', 'Unit', 'Value']).to_csv(path, index=False)
+    return str(path)
+
+def _build(csv_path, cache_dir, barrier):
+    barrier.wait()
+    data_loader.build_faostat_cache(csv_path, cache_dir)
+
+def _manifest_files(cache_dir):
+    manifest = data_loader._read_manifest(cache_dir)
+    return [column['file'] for column in manifest['columns'].values()]
+
+@pytest.mark.skipif(data_loader.fcntl is None, reason="needs fcntl")
+def test_concurrent_builds_leave_a_loadable_cache(faostat_csv, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    context = multiprocessing.get_context('fork')
+    for _ in range(3):
+        barrier = context.Barrier(2)
+        workers = [context.Process(target=_build, args=(faostat_csv, cache_dir, barrier)) for _ in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(30)
+            assert worker.exitcode == 0
+        assert all(os.path.exists(os.path.join(cache_dir, name)) for name in _manifest_files(cache_dir))
+        df = data_loader.load_faostat_data(csv_path=faostat_csv, cache_dir=cache_dir)
+        assert len(df) == 30
+        assert df['Survey'].iloc[0] == 'Country0'
+
+def test_rebuild_keeps_files_of_the_replaced_manifest(faostat_csv, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    first = data_loader.build_faostat_cache(faostat_csv, cache_dir)
+    old_files = [column['file'] for column in first['columns'].values()]
+    data_loader.build_faostat_cache(faostat_csv, cache_dir)
+    # A reader that read the first manifest before the swap can still open its files
+    assert all(os.path.exists(os.path.join(cache_dir, name)) for name in old_files)
+    data_loader.build_faostat_cache(faostat_csv, cache_dir)
+    assert not any(os.path.exists(os.path.join(cache_dir, name)) for name in old_files)
+
+def test_missing_column_file_triggers_rebuild(faostat_csv, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    data_loader.build_faostat_cache(faostat_csv, cache_dir)
+    os.remove(os.path.join(cache_dir, _manifest_files(cache_dir)[0]))
+    df = data_loader.load_faostat_data(csv_path=faostat_csv, cache_dir=cache_dir)
+    assert df['Value'].tolist()[:3] == [0.0, 1.0, 2.0]
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+from data_store import get_reference_data, get_nutrient_sources
+from nutrient_analysis import calculate_results
+from food_optimizer import FoodOptimizer, UPPER_PERCENTAGE
+
+@pytest.fixture(scope='module')
+def optimizer():
+    return FoodOptimizer(get_nutrient_sources(), max_foods=5, time_budget=1.0)
+
+@pytest.mark.parametrize('seed', range(8))
+def test_basket_keeps_nutrients_within_upper_bound(optimizer, seed):
+    reference_values, _ = get_reference_data()
+    rng = np.random.default_rng(seed)
+    intakes = {nutrient: reference * rng.uniform(0, 1.2) for nutrient, reference in reference_values.items()}
+    results = calculate_results(intakes, reference_values)
+    before = dict(zip(results['Nutrient'], results['Percentage']))
+
+    basket = optimizer.optimize(results, use_cache=False)
+    assert basket.items
+    for nutrient, percentage in basket.percentages.items():
+        if before[nutrient] <= UPPER_PERCENTAGE:
+            assert percentage <= UPPER_PERCENTAGE, nutrient
+
+def test_search_continues_past_a_candidate_that_does_not_help():
+    # 'rich' is the steepest candidate for A, but any amount of it pushes B past its bound
+    sources = {'A': {'rich': (100, 'mg'), 'plain': (20, 'mg')}, 'B': {'rich': (100, 'mg')}}
+    optimizer = FoodOptimizer(sources, max_foods=3, time_budget=1.0)
+    results = pd.DataFrame({'Nutrient': ['A', 'B'], 'Intake': [50.0, UPPER_PERCENTAGE],
+                            'Reference': [100.0, 100.0], 'Percentage': [50.0, UPPER_PERCENTAGE],
+                            'Status': ['Low', 'Adequate']})
+
+    basket = optimizer.optimize(results, use_cache=False)
+    assert [food for food, _ in basket.items] == ['plain']
+    assert basket.percentages == {'A': 100.0, 'B': UPPER_PERCENTAGE}
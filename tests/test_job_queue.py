@@ -0,0 +1,68 @@
+import threading
+import time
+import pytest
+from job_queue import CANCELLED, DONE, FAILED, JobQueue
+
+def wait_for(job_queue, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not job_queue.get(job_id).done:
+        assert time.monotonic() < deadline, "job did not finish"
+        time.sleep(0.01)
+    return job_queue.get(job_id)
+
+def test_job_result_and_error():
+    job_queue = JobQueue(max_workers=2)
+    done = wait_for(job_queue, job_queue.submit('test', lambda job, x: x * 2, 21))
+    assert (done.status, done.result) == (DONE, 42)
+
+    def fail(job):
+        raise ValueError("boom")
+    failed = wait_for(job_queue, job_queue.submit('test', fail))
+    assert failed.status == FAILED and isinstance(failed.error, ValueError)
+
+def test_cancelled_queued_job_never_runs():
+    job_queue = JobQueue(max_workers=1)
+    release = threading.Event()
+    ran = []
+    blocker = job_queue.submit('test', lambda job: release.wait(5))
+    queued = job_queue.submit('test', lambda job: ran.append(job.id))
+    job_queue.cancel(queued)
+    release.set()
+
+    assert wait_for(job_queue, blocker).status == DONE
+    assert wait_for(job_queue, queued).status == CANCELLED
+    assert ran == []
+
+def test_running_job_sees_cancellation():
+    job_queue = JobQueue(max_workers=1)
+    started = threading.Event()
+
+    def work(job):
+        started.set()
+        while not job.cancelled:
+            time.sleep(0.01)
+        return 'stopped early'
+    job_id = job_queue.submit('test', work)
+    assert started.wait(5)
+    job_queue.cancel(job_id)
+    assert wait_for(job_queue, job_id).status == CANCELLED
+
+def test_finished_jobs_expire_after_retention():
+    job_queue = JobQueue(max_workers=1, retention=0.1)
+    release = threading.Event()
+    finished = job_queue.submit('test', lambda job: None)
+    wait_for(job_queue, finished)
+    running = job_queue.submit('test', lambda job: release.wait(5))
+    time.sleep(0.2)
+
+    job_queue.submit('test', lambda job: None)  # Submitting purges expired jobs
+    assert job_queue.get(finished) is None
+    assert job_queue.get(running) is not None  # Unfinished jobs are kept however old
+    release.set()
+    assert wait_for(job_queue, running).status == DONE
+
+@pytest.mark.parametrize('job_id', [None, 'unknown-1'])
+def test_unknown_jobs(job_id):
+    job_queue = JobQueue()
+    assert job_queue.get(job_id) is None
+    job_queue.cancel(job_id)  # No-op
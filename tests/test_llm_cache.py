@@ -0,0 +1,40 @@
+import pytest
+import llm_cache
+from llm_cache import ResponseCache, make_key
+
+class Clock:
+    """Stands in for time.time, advancing one second per reading"""
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache.time, 'time', clock)
+    return clock
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / 'cache.db'), ttl=60, max_entries=10)
+    cache.set('key', 'response')
+    assert cache.get('key') == 'response'
+    clock.now += 60
+    assert cache.get('key') is None
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'entries': 0}
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / 'cache.db'), ttl=3600, max_entries=2)
+    cache.set('a', '1')
+    cache.set('b', '2')
+    assert cache.get('a') == '1'  # 'b' is now the least recently used
+    cache.set('c', '3')
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == ('1', '3')
+    assert cache.stats()['entries'] == 2
+
+def test_keys_ignore_trivial_differences():
+    assert make_key("Two eggs,  toast.", 'model', 'prompt') == make_key("two eggs, toast", 'model', 'prompt')
+    assert make_key("two eggs", 'model', 'prompt') != make_key("two eggs", 'model', 'other prompt')
@@ -0,0 +1,114 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from llm_gateway import FakeBackend, LLMGateway, LLMOverloadedError, PRIORITY_BACKGROUND, PRIORITY_HIGH, PRIORITY_NORMAL
+
+# About 90 tokens, so that a call still fills a 100-token budget once it is settled to its actual size
+LONG_ANSWER = 'x' * 360
+
+def test_coalesced_request_raises_priority_of_call_in_flight():
+    order = []
+    backend = FakeBackend(lambda messages: order.append(messages[-1][1]) or LONG_ANSWER)
+    gateway = LLMGateway(backend, tokens_per_minute=100)
+    gateway.scheduler.window = 0.3  # Budget frees up quickly; one call fits at a time
+
+    async def main():
+        call = lambda text, priority: asyncio.ensure_future(
+            gateway.acomplete([('user', text)], priority=priority, expected_tokens=90))
+        calls = [call('first', PRIORITY_NORMAL)]
+        for text, priority in [('plan', PRIORITY_BACKGROUND), ('estimate', PRIORITY_NORMAL), ('plan', PRIORITY_HIGH)]:
+            await asyncio.sleep(0.05)
+            calls.append(call(text, priority))
+        return await asyncio.gather(*calls)
+
+    assert asyncio.run(main()) == [LONG_ANSWER] * 4
+    # The speculative plan call is promoted once a foreground request joins it
+    assert order == ['first', 'plan', 'estimate']
+
+def test_identical_concurrent_calls_share_one_upstream_request():
+    backend = FakeBackend('shared answer', delay=0.2)
+    gateway = LLMGateway(backend, tokens_per_minute=0)
+    messages = [('system', 'prompt'), ('user', 'two eggs')]
+    with ThreadPoolExecutor(2) as executor:
+        answers = list(executor.map(lambda _: gateway.complete(messages), range(2)))
+    assert answers == ['shared answer'] * 2
+    assert len(backend.calls) == 1
+
+    # Once the call has finished, the same request goes upstream again
+    assert gateway.complete(messages) == 'shared answer'
+    assert len(backend.calls) == 2
+
+def test_different_or_uncoalesced_calls_go_upstream_separately():
+    backend = FakeBackend(lambda messages: messages[-1][1], delay=0.1)
+    gateway = LLMGateway(backend, tokens_per_minute=0)
+    with ThreadPoolExecutor(2) as executor:
+        assert list(executor.map(lambda text: gateway.complete([('user', text)]), ['a', 'b'])) == ['a', 'b']
+    assert len(backend.calls) == 2
+
+    backend = FakeBackend('answer', delay=0.1)
+    gateway = LLMGateway(backend, tokens_per_minute=0, coalesce=False)
+    with ThreadPoolExecutor(2) as executor:
+        list(executor.map(lambda _: gateway.complete([('user', 'a')]), range(2)))
+    assert len(backend.calls) == 2
+
+def test_identical_concurrent_streams_share_one_upstream_request():
+    text = 'Monday: oatmeal with berries. Tuesday: lentil soup and bread.'
+    backend = FakeBackend(text, delay=0.2)
+    gateway = LLMGateway(backend, tokens_per_minute=0)
+    with ThreadPoolExecutor(2) as executor:
+        streams = list(executor.map(lambda _: ''.join(gateway.stream([('user', 'plan')])), range(2)))
+    assert streams == [text] * 2
+    assert len(backend.calls) == 1
+
+def _budget_gateway(backend, window=0.3, **kwargs):
+    """Gateway whose token budget fits one 90-token call per `window` seconds"""
+    gateway = LLMGateway(backend, tokens_per_minute=100, **kwargs)
+    gateway.scheduler.window = window
+    return gateway
+
+def test_calls_over_the_token_budget_wait_for_it():
+    backend = FakeBackend(LONG_ANSWER)
+    gateway = _budget_gateway(backend)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(3) as executor:
+        list(executor.map(lambda text: gateway.complete([('user', text)], expected_tokens=90), ['a', 'b', 'c']))
+    # The second and third calls each wait for the previous charge to expire
+    assert time.perf_counter() - start >= 0.55
+    assert len(backend.calls) == 3
+
+def test_waiting_calls_are_admitted_by_priority_and_report_their_position():
+    order = []
+    gateway = _budget_gateway(FakeBackend(lambda messages: order.append(messages[-1][1]) or LONG_ANSWER))
+    positions = []
+    with ThreadPoolExecutor(3) as executor:
+        first = executor.submit(gateway.complete, [('user', 'first')], expected_tokens=90)
+        time.sleep(0.05)
+        low = executor.submit(gateway.complete, [('user', 'low')], priority=PRIORITY_BACKGROUND, expected_tokens=90,
+                              on_queue=positions.append)
+        time.sleep(0.05)
+        high = executor.submit(gateway.complete, [('user', 'high')], priority=PRIORITY_HIGH, expected_tokens=90)
+        assert [future.result() for future in (first, low, high)] == [LONG_ANSWER] * 3
+    assert order == ['first', 'high', 'low']
+    # Queued first, moved back behind the high priority call, then admitted
+    assert positions[-1] is None and 1 in positions
+
+def test_calls_are_turned_away_when_the_wait_is_too_long():
+    gateway = _budget_gateway(FakeBackend(LONG_ANSWER), window=60, max_queue_wait=1)
+    gateway.complete([('user', 'first')], expected_tokens=90)
+    with pytest.raises(LLMOverloadedError):
+        gateway.complete([('user', 'second')], expected_tokens=90)
+
+def test_full_queue_evicts_lower_priority_calls():
+    gateway = _budget_gateway(FakeBackend(LONG_ANSWER), window=0.5, max_queue=1)
+    gateway.complete([('user', 'first')], expected_tokens=90)
+    with ThreadPoolExecutor(1) as executor:
+        background = executor.submit(gateway.complete, [('user', 'background')], priority=PRIORITY_BACKGROUND,
+                                     expected_tokens=90)
+        time.sleep(0.1)
+        # The queue is full: an equally urgent call is turned away, a more urgent one takes the place
+        with pytest.raises(LLMOverloadedError):
+            gateway.complete([('user', 'other')], priority=PRIORITY_BACKGROUND, expected_tokens=90)
+        assert gateway.complete([('user', 'urgent')], priority=PRIORITY_HIGH, expected_tokens=90) == LONG_ANSWER
+        with pytest.raises(LLMOverloadedError):
+            background.result()
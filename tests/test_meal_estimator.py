@@ -0,0 +1,89 @@
+import threading
+import pytest
+from data_store import get_reference_data
+from meal_estimator import FoodItemStore, estimate_meal, split_items
+
+def _parsed(text):
+    return [(item.name, item.grams) for item in split_items(text)]
+
+def test_fractions():
+    assert _parsed("1/2 cup of rice") == [('rice', 120)]
+    assert _parsed("3/4 glass of milk") == [('milk', 187.5)]
+
+def test_decimal_commas_and_points():
+    assert _parsed("1,5 cups of milk, 2 eggs") == [('milk', 360), ('egg', 100)]
+    assert _parsed("0.5 kg of potatoes") == [('potato', 500)]
+
+def test_dishes_joined_by_and_or_with_stay_one_item():
+    assert _parsed("mac and cheese") == [('mac and cheese', 100)]
+    assert _parsed("chicken with rice") == [('chicken with rice', 100)]
+
+def test_and_with_split_items_when_a_quantity_follows():
+    assert _parsed("2 eggs, 200 g of rice and a slice of toast") == [('egg', 100), ('rice', 200), ('toast', 30)]
+    assert _parsed("coffee with 2 cookies") == [('coffee', 100), ('cookie', 30)]
+    assert _parsed("I had a banana and then 1 apple plus tea") == [('banana', 120), ('apple', 180), ('tea', 100)]
+
+def test_unknown_items_are_looked_up_concurrently(tmp_path):
+    reference_values, _ = get_reference_data()
+    names = ['zorblax stew', 'quux pie', 'frobnitz salad']
+    barrier = threading.Barrier(len(names), timeout=5)
+    looked_up = []
+
+    def lookup(name):
+        looked_up.append(name)
+        barrier.wait()  # Breaks (and fails the test) unless all lookups run at the same time
+        return {nutrient: 1.0 for nutrient in reference_values}
+
+    store = FoodItemStore(str(tmp_path / 'items.db'))
+    meal = estimate_meal("a zorblax stew, a quux pie, a frobnitz salad, 2 quux pies", lookup, store)
+    assert meal is not None
+    assert sorted(looked_up) == sorted(names)
+    assert meal.llm_calls == len(names)
+
+    # Memoized: the same meal needs no lookup the second time
+    meal = estimate_meal("a zorblax stew", pytest.fail, store)
+    assert meal.sources == {'zorblax stew': 'local'}
+
+def test_failed_lookup_falls_back_but_keeps_other_estimates(tmp_path):
+    reference_values, _ = get_reference_data()
+    store = FoodItemStore(str(tmp_path / 'items.db'))
+
+    def lookup(name):
+        return None if name == 'quux pie' else {nutrient: 1.0 for nutrient in reference_values}
+
+    assert estimate_meal("a zorblax stew, a quux pie", lookup, store) is None
+    assert store.get('zorblax stew') == {nutrient: 1.0 for nutrient in reference_values}
+    # The failure is remembered, so the next meal with the item falls back without a lookup
+    assert estimate_meal("a quux pie", pytest.fail, store) is None
+
+def test_partial_lookup_is_not_stored_as_an_estimate(tmp_path):
+    store = FoodItemStore(str(tmp_path / 'items.db'))
+    assert estimate_meal("a zorblax stew", lambda name: {'Calcium': 120.0}, store) is None
+    assert store.get('zorblax stew') == {}
+    assert estimate_meal("a zorblax stew", pytest.fail, store) is None
+
+def test_seeded_items_need_no_lookup_and_report_uncovered_nutrients(tmp_path):
+    reference_values, _ = get_reference_data()
+    store = FoodItemStore(str(tmp_path / 'items.db'))
+    seed = {nutrient: content for nutrient, content in store.get('spinach').items() if nutrient in reference_values}
+    assert seed and len(seed) < len(reference_values)
+
+    meal = estimate_meal("200 g of spinach", pytest.fail, store)
+    assert meal.intakes == {nutrient: round(content * 2, 2) for nutrient, content in seed.items()}
+    assert meal.missing == [nutrient for nutrient in reference_values if nutrient not in seed]
+    assert meal.llm_calls == 0
+
+    # Only the item without a local entry is looked up
+    looked_up = []
+    def lookup(name):
+        looked_up.append(name)
+        return {nutrient: 1.0 for nutrient in reference_values}
+    meal = estimate_meal("200 g of spinach, 100 g of zorblax stew", lookup, store)
+    assert looked_up == ['zorblax stew']
+    assert meal.sources == {'spinach': 'local', 'zorblax stew': 'llm'}
+    assert meal.intakes == {nutrient: round(content * 2 + 1, 2) for nutrient, content in seed.items()}
+
+def test_items_without_common_nutrients_fall_back_without_lookups(tmp_path):
+    store = FoodItemStore(str(tmp_path / 'items.db'))
+    assert not store.get('egg').keys() & store.get('banana').keys()
+    assert estimate_meal("2 eggs, 200 g of zorblax stew, a banana", pytest.fail, store) is None
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from data_store import get_food_index, get_reference_data
+from nutrient_analysis import (RECOMMENDATION_STATUSES, STATUS_BINS, STATUS_COLORS, STATUS_LABELS, FoodIndex,
+                               calculate_results, get_status, get_status_codes)
+
+BOUNDARIES = [value + offset for value in STATUS_BINS.tolist() for offset in (-0.01, 0.0, 0.01)]
+
+@pytest.mark.parametrize('percentage', [0.0, -5.0, 1e9] + BOUNDARIES)
+def test_get_status_matches_status_codes(percentage):
+    level = get_status_codes([percentage])[0]
+    assert get_status(percentage) == (str(STATUS_LABELS[level]), str(STATUS_COLORS[level]))
+
+def test_threshold_inclusiveness():
+    assert get_status(70.0)[0] == 'Borderline'
+    assert get_status(90.0)[0] == 'Adequate'
+    assert get_status(150.0)[0] == 'Adequate'
+    assert get_status(200.0)[0] == 'High'
+    assert get_status(np.nan)[0] == 'Deficient'
+
+@pytest.mark.parametrize('rank_by', FoodIndex.RANKINGS)
+def test_recommend_profile_matches_recommend(rank_by):
+    reference_values, _ = get_reference_data()
+    rng = np.random.default_rng(0)
+    intakes = {nutrient: reference * rng.uniform(0.3, 2.5) for nutrient, reference in reference_values.items()}
+    intakes[next(iter(intakes))] = np.nan  # A missing intake gets no recommendations
+    results = calculate_results(intakes, reference_values)
+    food_index = get_food_index()
+
+    batch = food_index.recommend(results, top_k=3, rank_by=rank_by, statuses=RECOMMENDATION_STATUSES)
+    profile = food_index.recommend_profile(results, top_k=3, rank_by=rank_by, statuses=RECOMMENDATION_STATUSES)
+    flat = [(row, food) + values for row, foods in profile.items() for food, values in foods.items()]
+    assert [(row, food) for row, food, *_ in flat] == list(zip(batch['Row'], batch['Food']))
+    assert [amount for _, _, amount, *_ in flat] == pytest.approx(batch['Amount'].tolist())
+    assert [action for *_, action, _ in flat] == batch['Action'].tolist()
+    assert [energy for *_, energy in flat] == pytest.approx(batch['Energy'].tolist(), nan_ok=True)
+    assert 0 not in profile
+
+def test_recommend_profile_limited_to_rows():
+    reference_values, _ = get_reference_data()
+    results = calculate_results({nutrient: 0.0 for nutrient in reference_values}, reference_values)
+    assert list(get_food_index().recommend_profile(results, rows=[2, 0])) == [2, 0]
@@ -0,0 +1,67 @@
+import os
+import sys
+import types
+from operator import attrgetter
+import pytest
+import data_store
+import job_queue
+import llm_cache
+import llm_gateway
+import meal_plan_cache
+from settings import env_setting
+
+# Process-wide components configured from the environment: the getter creating each one, the
+# settings it reads and the attributes they end up in
+COMPONENTS = [
+    pytest.param(llm_cache.get_response_cache,
+                 {'LLM_CACHE_TTL': '60', 'LLM_CACHE_MAX_ENTRIES': '7'},
+                 {'ttl': 60.0, 'max_entries': 7}, id='response_cache'),
+    pytest.param(llm_gateway.get_gateway,
+                 {'LLM_TIMEOUT': '5', 'LLM_MAX_CONCURRENCY': '3', 'LLM_MAX_RETRIES': '0', 'LLM_COALESCE': '0',
+                  'LLM_TOKENS_PER_MINUTE': '900', 'LLM_MAX_QUEUE': '4', 'LLM_MAX_QUEUE_WAIT': '2.5'},
+                 {'timeout': 5.0, 'max_concurrency': 3, 'max_retries': 0, 'coalesce': False,
+                  'scheduler.tokens_per_minute': 900, 'scheduler.max_queue': 4,
+                  'scheduler.max_wait': 2.5}, id='gateway'),
+    pytest.param(meal_plan_cache.get_meal_plan_cache,
+                 {'MEAL_PLAN_CACHE_POLICY': 'quantized', 'MEAL_PLAN_CACHE_BUCKET': '10',
+                  'MEAL_PLAN_CACHE_TTL': '60', 'MEAL_PLAN_CACHE_MAX_ENTRIES': '7'},
+                 {'policy': 'quantized', 'bucket': 10.0, 'store.ttl': 60.0, 'store.max_entries': 7},
+                 id='meal_plan_cache'),
+    pytest.param(data_store.get_food_optimizer,
+                 {'OPTIMIZER_MAX_FOODS': '3', 'OPTIMIZER_MAX_GRAMS': '150', 'OPTIMIZER_TIME_BUDGET': '0.5'},
+                 {'max_foods': 3, 'max_grams': 150.0, 'time_budget': 0.5}, id='food_optimizer'),
+    pytest.param(job_queue.get_job_queue, {'JOB_WORKERS': '2', 'JOB_RETENTION': '30'},
+                 {'max_workers': 2, 'retention': 30.0}, id='job_queue'),
+]
+
+@pytest.fixture
+def fresh_components(monkeypatch, tmp_path):
+    """Forget the process-wide components, so the next getter call creates them again"""
+    monkeypatch.setattr(data_store, 'NUTRIENT_SOURCES_PATH', os.path.abspath(data_store.NUTRIENT_SOURCES_PATH))
+    monkeypatch.setattr(data_store, '_entries', {})
+    monkeypatch.setattr(job_queue, '_default_queue', None)
+    monkeypatch.setattr(llm_cache, '_default_cache', None)
+    monkeypatch.setattr(llm_gateway, '_default_gateway', None)
+    monkeypatch.setitem(sys.modules, 'dotenv', types.SimpleNamespace(load_dotenv=lambda: None))
+    monkeypatch.setenv('LLM_BACKEND', 'fake')
+    monkeypatch.setattr(meal_plan_cache, '_default_cache', None)
+    monkeypatch.chdir(tmp_path)  # Caches are created relative to the working directory
+
+@pytest.mark.parametrize('create, environment, expected', COMPONENTS)
+def test_settings_read_when_the_component_is_created(monkeypatch, fresh_components, create, environment, expected):
+    # Set after import, as load_dotenv in main.py does
+    for name, value in environment.items():
+        monkeypatch.setenv(name, value)
+
+    component = create()
+    assert {name: attrgetter(name)(component) for name in expected} == expected
+
+def test_env_setting_converts_to_the_type_of_the_default(monkeypatch):
+    monkeypatch.delenv('NUTRISCAN_SETTING', raising=False)
+    assert env_setting('NUTRISCAN_SETTING', 5) == 5
+    monkeypatch.setenv('NUTRISCAN_SETTING', ' ')
+    assert env_setting('NUTRISCAN_SETTING', 'status') == 'status'
+    monkeypatch.setenv('NUTRISCAN_SETTING', '0')
+    assert (env_setting('NUTRISCAN_SETTING', True), env_setting('NUTRISCAN_SETTING', 2.5)) == (False, 0.0)
+    monkeypatch.setenv('NUTRISCAN_SETTING', '1')
+    assert (env_setting('NUTRISCAN_SETTING', False), env_setting('NUTRISCAN_SETTING', 8)) == (True, 1)
@@ -1,34 +1,43 @@
 import streamlit as st
-import plotly.graph_objects as go
 import pandas as pd
-from nutrient_analysis import get_food_recommendations
+from nutrient_analysis import RECOMMENDATION_STATUSES
+from job_queue import get_job_queue
+from metrics import timed
 
-def display_results(df_results, reference_df):
+# Define color scheme for different nutrient statuses
+COLOR_MAP = {
+    'green': '#2ecc71',   # Adequate
+    'yellow': '#f1c40f',  # Borderline
+    'red': '#e74c3c',     # Deficient
+    'orange': '#e67e22',  # High
+    'purple': '#9b59b6'   # Excess
+}
+
+# Seconds between checks of a running background job
+JOB_POLL_INTERVAL = 1.0
+
+def _yaxis_range(df_results):
+    return [0, max(df_results['Percentage'].max() * 1.2, 120)]
+
+@timed()
+def build_results_figure(df_results):
     """
-    Display the analysis results using a bar chart and detailed table
+    Build the bar chart of nutrient intakes as percentages of reference values
     
     Args:
         df_results: DataFrame containing analysis results
-        reference_df: DataFrame containing reference values and units
-    """
-    # Display section title
-    st.markdown("<h2 style='text-align: center;'>Diet Overview</h2>", unsafe_allow_html=True)
     
-    # Define color scheme for different nutrient statuses
-    color_map = {
-        'green': '#2ecc71',   # Adequate
-        'yellow': '#f1c40f',  # Borderline
-        'red': '#e74c3c',     # Deficient
-        'orange': '#e67e22',  # High
-        'purple': '#9b59b6'   # Excess
-    }
+    Returns:
+        go.Figure: The chart, ready to be rendered
+    """
+    import plotly.graph_objects as go  # Imported on first use, headless callers never need it
     
     # Create bar chart
     fig = go.Figure()
     fig.add_trace(go.Bar(
         x=df_results['Nutrient'],
         y=df_results['Percentage'],
-        marker_color=[color_map[color] for color in df_results['Color']],
+        marker_color=[COLOR_MAP[color] for color in df_results['Color']],
         text=df_results['Percentage'].round(1).astype(str) + '%',
         textposition='outside'
     ))
@@ -43,7 +52,7 @@ def display_results(df_results, reference_df):
             'yanchor': 'top'
         },
         yaxis_title='Percentage of Reference Value',
-        yaxis_range=[0, max(df_results['Percentage'].max() * 1.2, 120)],
+        yaxis_range=_yaxis_range(df_results),
         xaxis_tickangle=-45,
         height=500,  # Reduced height
         margin=dict(t=100, b=50, l=50, r=100),  # Increased bottom margin for labels
@@ -55,6 +64,51 @@ def display_results(df_results, reference_df):
 
     # Add reference line at 100%
     fig.add_hline(y=100, line_dash="dash", line_color="gray")
+    return fig
+
+@timed()
+def patch_results_figure(fig, df_results, rows):
+    """
+    Update the bars of changed nutrients in a figure from build_results_figure, in place
+    
+    Args:
+        fig: Figure to update
+        df_results: DataFrame containing the updated analysis results
+        rows: Positions of the changed rows of df_results
+    """
+    bar = fig.data[0]
+    y, text, colors = list(bar.y), list(bar.text), list(bar.marker.color)
+    for row in rows:
+        percentage = df_results['Percentage'].iat[row]
+        y[row] = percentage
+        text[row] = f"{round(percentage, 1)}%"
+        colors[row] = COLOR_MAP[df_results['Color'].iat[row]]
+    bar.update(y=y, text=text, marker_color=colors)
+    fig.update_layout(yaxis_range=_yaxis_range(df_results))
+
+@timed()
+def display_results(df_results, nutrient_registry, analysis=None):
+    """
+    Display the analysis results using a bar chart and detailed table
+    
+    Args:
+        df_results: DataFrame containing analysis results
+        nutrient_registry: NutrientRegistry giving the unit of each nutrient
+        analysis: Optional AnalysisState holding df_results; the chart from the previous run
+            is then kept in the session and only the bars of changed nutrients are updated
+    """
+    # Display section title
+    st.markdown("<h2 style='text-align: center;'>Diet Overview</h2>", unsafe_allow_html=True)
+    
+    if analysis is None:
+        fig = build_results_figure(df_results)
+    else:
+        changes = analysis.take_changes('figure')
+        fig = st.session_state.get('results_figure')
+        if changes is None or fig is None:
+            fig = st.session_state.results_figure = build_results_figure(df_results)
+        elif changes:
+            patch_results_figure(fig, df_results, changes)
     
     # Display the plot with container width constraint and hide modebar
     st.plotly_chart(
@@ -69,10 +123,11 @@ def display_results(df_results, reference_df):
     # Create detailed analysis table
     st.markdown("<h2 style='text-align: center;'>Detailed Analysis</h2>", unsafe_allow_html=True)
 
-    # Prepare detailed results DataFrame
+    # Prepare detailed results DataFrame, with units looked up by nutrient
+    units = [nutrient_registry.unit(nutrient) for nutrient in df_results['Nutrient']]
     detailed_results = pd.DataFrame({
-        'Intake': [f"{val:.2f} {unit}" for val, unit in zip(df_results['Intake'].values, reference_df['Unit'].values)],
-        'Reference': [f"{val:.2f} {unit}" for val, unit in zip(df_results['Reference'].values, reference_df['Unit'].values)],
+        'Intake': [f"{val:.2f} {unit}" for val, unit in zip(df_results['Intake'].values, units)],
+        'Reference': [f"{val:.2f} {unit}" for val, unit in zip(df_results['Reference'].values, units)],
         'Percentage': [f"{val:.2f}%" for val in df_results['Percentage'].values],
         'Status': df_results['Status'].values
     }, index=df_results['Nutrient'])
@@ -103,22 +158,89 @@ def display_results(df_results, reference_df):
     
     st.markdown(centered_table_html, unsafe_allow_html=True)
 
-def display_recommendations(df_results, nutrient_sources):
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def watch_job(state_key, message, on_done, show_progress=None):
+    """
+    Show the state of a background job and poll it until it finishes
+    
+    Only this fragment reruns while the job is pending, so the rest of the page stays
+    responsive. Once the job has finished, `on_done` stores its outcome in the session
+    state, the job id is cleared and the whole app reruns.
+    
+    Args:
+        state_key: Session state key holding the job id
+        message: Text shown while the job runs
+        on_done: Called with the finished Job
+        show_progress: Called with the job's partial output while it runs, e.g. st.markdown
+    """
+    job = get_job_queue().get(st.session_state.get(state_key))
+    if job is None or job.done:
+        st.session_state[state_key] = None
+        if job is not None:
+            on_done(job)
+        st.rerun()
+    
+    if job.position is not None:
+        ahead = "1 request" if job.position == 1 else f"{job.position} requests"
+        st.info(f"⏳ The language model is busy: {ahead} ahead of yours in the queue.")
+    else:
+        st.info(f"⏳ {message}")
+    if show_progress is not None and job.progress:
+        show_progress(job.progress)
+
+@timed()
+def display_basket(df_results, optimizer):
+    """
+    Display a combination of foods that addresses all deficits at once
+    
+    Args:
+        df_results: DataFrame containing analysis results
+        optimizer: FoodOptimizer over the food sources
+    """
+    basket = optimizer.optimize(df_results)
+    if not basket.items:
+        return
+    
+    st.write("🧺 A combination of foods to add that covers your deficits together:")
+    before = dict(zip(df_results['Nutrient'], df_results['Percentage']))
+    basket_df = pd.DataFrame({'Amount': [f"{grams:.0f}g" for _, grams in basket.items]},
+                             index=[food for food, _ in basket.items])
+    st.table(basket_df)
+    # Show how the nutrients that change move towards their reference values
+    changes = [f"{nutrient}: {before[nutrient]:.0f}% → {percentage:.0f}%" for nutrient, percentage in basket.percentages.items()
+               if abs(percentage - before[nutrient]) >= 1]
+    if changes:
+        st.caption(" | ".join(changes))
+    st.write("---")
+
+@timed()
+def display_recommendations(df_results, food_index, top_k=5, analysis=None):
     """
     Display dietary recommendations based on analysis results
     
     Args:
         df_results: DataFrame containing analysis results
-        nutrient_sources: Dictionary containing food sources for each nutrient
+        food_index: FoodIndex over the food sources for each nutrient
+        top_k: Number of foods to suggest per nutrient
+        analysis: Optional AnalysisState holding df_results, which keeps the suggestions of
+            unchanged nutrients between runs
     """
     # Get nutrients that need adjustment
-    deficient_nutrients = df_results[df_results['Status'].isin(['Deficient', 'High', 'Excess'])]
+    df_results = df_results.reset_index(drop=True)
+    deficient_nutrients = df_results[df_results['Status'].isin(RECOMMENDATION_STATUSES)]
     
     if not deficient_nutrients.empty:
+        # Ranked food suggestions for all of them, keyed by position in df_results
+        if analysis is not None:
+            recommendations_by_row = analysis.recommendations(food_index, top_k, RECOMMENDATION_STATUSES)
+        else:
+            recommendations_by_row = food_index.recommend_profile(df_results, top_k=top_k,
+                                                                  statuses=RECOMMENDATION_STATUSES)
+        
         st.warning("Your diet needs adjustment for the following nutrients:")
         
         # Process each nutrient that needs adjustment
-        for _, row in deficient_nutrients.iterrows():
+        for position, row in deficient_nutrients.iterrows():
             nutrient = row['Nutrient']
             current = row['Intake']
             reference = row['Reference']
@@ -140,18 +262,18 @@ def display_recommendations(df_results, nutrient_sources):
                 Recommended action: <span style='color: {action_color}; font-weight: bold;'>{action_text} by {abs(difference):.1f}</span></h3>
                 """, unsafe_allow_html=True)
             
-            # Get and display food recommendations
-            recommendations = get_food_recommendations(nutrient, current, reference, nutrient_sources)
+            # Display food recommendations, fewest grams first
+            recommendations = recommendations_by_row.get(position)
             
             if recommendations:
                 st.write("Suggested food modifications:")
                 # Create recommendations DataFrame
-                rec_df = pd.DataFrame(
-                    [(f"{amount:.1f}g", f"{content:.1f}{unit}", action.capitalize()) 
-                     for food, (amount, unit, content, action) in recommendations.items()],
-                    index=[food for food in recommendations.keys()],
-                    columns=['Amount', 'Nutrient content', 'Action']
-                )
+                rec_df = pd.DataFrame({
+                    'Amount': [f"{amount:.1f}g" for amount, _, _, _, _ in recommendations.values()],
+                    'Nutrient content': [f"{content:.1f}{unit}" for _, unit, content, _, _ in recommendations.values()],
+                    'Energy': [f"{energy:.0f} kcal" if pd.notna(energy) else "–" for *_, energy in recommendations.values()],
+                    'Action': [action.capitalize() for _, _, _, action, _ in recommendations.values()],
+                }, index=list(recommendations))
                 st.table(rec_df)
                 
                 # Display nutrient-specific tips
@@ -170,3 +292,68 @@ def display_recommendations(df_results, nutrient_sources):
             st.write("---")
     else:
         st.success("Your nutrient intake appears to be adequate for all measured parameters!")
+
+@timed()
+def build_population_heatmap(summary):
+    """
+    Build a heatmap of the median percentage of reference per country and nutrient
+    
+    Args:
+        summary: PopulationSummary over the FAOSTAT profiles
+    
+    Returns:
+        go.Figure: The heatmap, countries ordered from the fewest to the most deficiencies
+    """
+    import plotly.graph_objects as go
+    
+    matrix = summary.country_matrix.loc[summary.country_ranking.index]
+    fig = go.Figure(go.Heatmap(
+        z=matrix.to_numpy(),
+        x=list(matrix.columns),
+        y=list(matrix.index),
+        # Status colours of the results chart at the status thresholds (70, 90, 150, 200% of 300%)
+        colorscale=[[0, '#e74c3c'], [0.23, '#e74c3c'], [0.3, '#f1c40f'], [0.33, '#2ecc71'], [0.5, '#2ecc71'],
+                    [0.6, '#e67e22'], [0.67, '#9b59b6'], [1, '#9b59b6']],
+        zmin=0,
+        zmax=300,
+        colorbar={'title': '% of reference'},
+        hovertemplate='%{y}<br>%{x}: %{z:.0f}%<extra></extra>'
+    ))
+    fig.update_layout(
+        title={'text': 'Median Intake as Percentage of Reference Values by Country', 'x': 0.5, 'xanchor': 'center'},
+        xaxis_tickangle=-45,
+        yaxis_autorange='reversed',
+        height=max(400, 22 * len(matrix) + 200),
+        margin=dict(t=80, b=50, l=50, r=50)
+    )
+    return fig
+
+@timed()
+def display_population(summary):
+    """
+    Display the population overview: heatmap, status prevalence and country ranking
+    
+    Args:
+        summary: PopulationSummary over the FAOSTAT profiles
+    """
+    st.plotly_chart(build_population_heatmap(summary), use_container_width=True)
+    
+    col_prevalence, col_ranking = st.columns(2)
+    with col_prevalence:
+        st.subheader("Share of profiles by status")
+        st.dataframe((summary.prevalence * 100).round(1).astype(str) + '%')
+    with col_ranking:
+        st.subheader("Country ranking")
+        ranking = summary.country_ranking.copy()
+        for column in ('Deficient share', 'Excess share'):
+            ranking[column] = (ranking[column] * 100).round(1).astype(str) + '%'
+        ranking['Adequacy score'] = ranking['Adequacy score'].round(1)
+        st.dataframe(ranking)
+    
+    st.subheader("Distribution of intakes (% of reference)")
+    st.dataframe(summary.distribution.round(1))
+    
+    for name, label in (('distribution', 'distributions'), ('prevalence', 'status prevalence'),
+                        ('country_matrix', 'country x nutrient medians'), ('country_ranking', 'country ranking')):
+        st.download_button(f"Download {label} (CSV)", getattr(summary, name).to_csv().encode('utf-8'),
+                           file_name=f"{name}.csv", mime='text/csv', key=f"download_{name}")
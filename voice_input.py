@@ -1,4 +1,3 @@
-import speech_recognition as sr
 from typing import Tuple
 
 def get_voice_input(language: str = 'es-ES') -> Tuple[str, bool]:
@@ -11,6 +10,12 @@ def get_voice_input(language: str = 'es-ES') -> Tuple[str, bool]:
     Returns:
         Tuple[str, bool]: Transcribed text and success status
     """
+    # Imported here so the app starts without SpeechRecognition/PyAudio, e.g. on servers without a microphone
+    try:
+        import speech_recognition as sr
+    except ImportError:
+        return "Voice input requires the SpeechRecognition and PyAudio packages", False
+    
     # Initialize recognizer
     recognizer = sr.Recognizer()
     